@@ -1,32 +1,106 @@
 import asyncio
-from fastapi import FastAPI, UploadFile, File, HTTPException, BackgroundTasks
+import io
+import json
+import os
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from functools import partial
+from fastapi import FastAPI, UploadFile, File, HTTPException, Query, Request
 from fastapi.responses import JSONResponse
 from fastapi.responses import FileResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import Response, StreamingResponse
 from pathlib import Path
 import shutil
 import uuid
 import time
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 from fastapi.middleware.cors import CORSMiddleware
 
 # Import our existing modules
 from core.eeg_processor import preprocess_eeg
-from core.music_mapper import eeg_to_music_parameters
+from core.music_mapper import eeg_to_music_parameters, DEFAULT_BANDS
 from core.midi_generator import json_to_midi
 from core.midi_visualizer import visualize_midi
-from visualization.plots import create_all_visualizations
+from core.audio_renderer import convert_midi_to_mp3, find_audio_encoder
+from core.batch import aggregate_status, prepare_batch
+from core.cancellation import CancelToken, JobCancelled
+from core.handoff import AsyncPersister, StageHandoff, stage_source
+from core.warmup import prestart_threads, warm_up
+from core.stages import StageCache, file_fingerprint, stage_fingerprints, write_manifest
+from visualization.plots import create_all_visualizations, visualization_files
+from visualization.tiles import (
+    TileCache, get_tile, load_band_matrix, pyramid_info, tile_settings, tile_variant
+)
 from utils.config import config
-from data import validate_eeg_file
+from data import validate_eeg_file, estimate_job_size, SessionStore
 
 # Import the clear_uploads_directory function
 from utils.clear_uploads import clear_uploads_directory
+from utils.artifacts import (
+    IMMUTABLE_CACHE_CONTROL, RevalidatingStaticFiles, artifact_response, publish_artifact
+)
+from utils.health import readiness_report, uptime_seconds
+from utils.storage import open_store
+from utils.scheduler import JobScheduler, PRIORITY_CLASSES, INTERACTIVE, BULK
+from utils.log import get_logger, job_id_var, log_context, with_log_context
+
+logger = get_logger(__name__)
+
+# Startup warm-up of this process's stage workers; /readyz fails until it is done
+warmup_state: Dict = {"status": "pending"}
+
+
+async def run_warmup():
+    """Warm the stage workers in the background so liveness answers meanwhile"""
+    warmup_state.update(status="running", started=time.time())
+    try:
+        report = await asyncio.get_event_loop().run_in_executor(None, warm_up)
+    except Exception as e:
+        logger.exception("Worker warm-up failed")
+        warmup_state.update(status="failed", error=str(e))
+    else:
+        warmup_state.update(status="done", **report)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    """
+    Give the event loop a fixed pool of stage worker threads, start them all
+    now and warm them with a synthetic job before the instance reports ready.
+
+    The pool is threads in this process (stages share its GIL), not
+    isolated worker processes; with several server processes
+    (uvicorn --workers) each one warms itself.
+    """
+    threads = int(config.get('workers', 'threads', default=0)) or min(32, (os.cpu_count() or 1) + 4)
+    executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='stage-worker')
+    loop = asyncio.get_event_loop()
+    loop.set_default_executor(executor)
+    await asyncio.gather(*map(asyncio.wrap_future, prestart_threads(executor, threads)))
+    warmup_state.update(pool="threads", threads=threads, pid=os.getpid())
+
+    warmup_task = None
+    if config.get('workers', 'warmup', default=True):
+        warmup_task = asyncio.create_task(run_warmup())
+    else:
+        warmup_state.update(status="disabled")
+    try:
+        yield
+    finally:
+        # The warm-up cannot be interrupted mid-stage; let it finish so it
+        # does not outlive the executor and its persister
+        if warmup_task is not None:
+            await asyncio.wait([warmup_task])
+        executor.shutdown(wait=False)
+
 
 # Initialize FastAPI app
 app = FastAPI(
     title="Autism Buddy API",
     description="API for converting EEG data to music for autism therapy",
-    version="0.1.0"
+    version="0.1.0",
+    lifespan=lifespan
 )
 
 app.add_middleware(
@@ -41,19 +115,109 @@ app.add_middleware(
 UPLOAD_DIR = Path("uploads")
 UPLOAD_DIR.mkdir(exist_ok=True)
 
-# Mount output directory for static file access
-app.mount("/output", StaticFiles(directory="output"), name="output")
+# Per-job working directories
+JOBS_DIR = Path(config.get('paths', 'jobs'))
+
+# Content-addressed stores (storage.* config): uploads are deduplicated, artifacts
+# also compressed at rest; both may live in an S3-compatible bucket
+upload_store = open_store('uploads')
+artifact_store = open_store('artifacts')
+
+# Fingerprint-keyed outputs of earlier runs, reused when a stage's inputs are unchanged
+stage_cache = StageCache(config.get('paths', 'stage_cache'))
+
+# Rendered heatmap tiles, shared by jobs with identical analysis results
+tile_cache = TileCache(config.get('paths', 'tile_cache', default='output/tiles'),
+                       int(tile_settings()["cache_mb"] * 1024 * 1024))
+
+# Longitudinal per-patient index of finished sessions
+session_store = SessionStore(config.get('paths', 'session_store'))
+
+# Priority / fair-share / shortest-job-first dispatcher for processing jobs
+scheduler = JobScheduler(
+    max_concurrent=config.get('scheduler', 'max_concurrent_jobs', default=2),
+    bulk_max_concurrent=config.get('scheduler', 'bulk_max_concurrent_jobs', default=1)
+)
+
+# Mount output directory for static file access (mutable, always revalidated)
+app.mount("/output", RevalidatingStaticFiles(directory="output"), name="output")
 
 # In-memory job storage - would use a database in production
 uploaded_files: Dict[str, Path] = {}
 jobs: Dict[str, Dict] = {}
 
+# Jobs submitted together through /api/batch
+batches: Dict[str, Dict] = {}
+
+# Waiters for job changes - replaced with a fresh event after every update
+job_waiters: Dict[str, asyncio.Event] = {}
+
+# Cancellation flags polled by the pipeline stages of unfinished jobs
+cancel_tokens: Dict[str, CancelToken] = {}
+
+# Job states after which nothing changes any more
+TERMINAL_STATUSES = ("COMPLETED", "FAILED", "CANCELLED")
+
+# How long DELETE waits for a running job to reach a stage boundary
+CANCEL_WAIT_SECONDS = 1.0
+
+# Seconds between keep-alive comments on idle event streams
+SSE_KEEPALIVE_SECONDS = 15
+
+
+def update_job(job_id: str, **changes):
+    """Apply changes to a job and wake everyone waiting on it"""
+    job = jobs[job_id]
+    job.update(changes)
+    job["version"] += 1
+    waiter = job_waiters.pop(job_id, None)
+    if waiter is not None:
+        waiter.set()
+
+
+async def wait_for_job_change(job_id: str, version: int, timeout: float) -> bool:
+    """Wait until a job's version moves past `version`, or the timeout expires"""
+    if jobs[job_id]["version"] != version:
+        return True
+    waiter = job_waiters.setdefault(job_id, asyncio.Event())
+    try:
+        await asyncio.wait_for(waiter.wait(), timeout)
+    except asyncio.TimeoutError:
+        return False
+    return True
+
 
 @app.get("/")
 async def ping():
     return {"message": "Autism Buddy API is running"}
 
 
+@app.get("/healthz")
+async def healthz():
+    """Liveness: answers as long as the process and its event loop respond, whatever the load"""
+    return {"status": "ok", "uptime_seconds": uptime_seconds()}
+
+
+@app.get("/readyz")
+async def readyz():
+    """
+    Readiness for load balancers and autoscalers: 200 when this instance can
+    take more jobs, 503 while its workers are still warming up or when its
+    queue is too deep or disk/memory run low.
+    The body reports worker saturation, queue depth, disk headroom of the
+    uploads and output filesystems and memory pressure either way.
+    """
+    report = readiness_report(scheduler, {"uploads": UPLOAD_DIR, "output": "output"},
+                              warmup=warmup_state)
+    return JSONResponse(status_code=200 if report["ready"] else 503, content=report)
+
+
+@app.get("/artifacts/{name}")
+async def get_artifact(name: str, request: Request):
+    """Serve a published job artifact (compressed, immutable, range-capable)"""
+    return artifact_response(name, request.headers, artifact_store)
+
+
 # Debug endpoint to see what files are stored
 @app.get("/api/debug/files")
 async def debug_files():
@@ -64,41 +228,47 @@ async def debug_files():
     }
 
 
-@app.post("/api/upload")
-async def upload_file(file: UploadFile = File(...)):
-    """Upload an EEG file (.set, .edf, or .bdf)"""
-    # Clean up old uploads before processing new ones
-    clear_uploads_directory(UPLOAD_DIR)
+def active_upload_paths():
+    """Input files of jobs that have not finished yet (never cleaned up)"""
+    return [job["file_path"] for job in jobs.values() if job["status"] in ("PENDING", "PROCESSING")]
 
-    # Generate unique file ID
-    file_id = str(uuid.uuid4())
 
-    # Verify file extension
-    file_extension = Path(file.filename).suffix.lower()
+def check_upload_extension(filename: str) -> str:
+    """Lower-case extension of an uploaded file name, rejecting unsupported formats"""
+    file_extension = Path(filename).suffix.lower()
     if file_extension not in ['.set', '.edf', '.bdf']:
         raise HTTPException(
             status_code=400, detail="Invalid file type. Supported formats: .set, .edf, .bdf")
+    return file_extension
+
 
-    # Create file path and save uploaded file
-    file_path = UPLOAD_DIR / f"{file_id}{file_extension}"
+def save_upload(file: UploadFile) -> Dict:
+    """
+    Store an uploaded file under a new file ID.
+
+    The content goes into the upload store under its hash, so re-uploading
+    a recording reuses the stored copy; the file ID maps to a local working
+    copy of it.
+    """
+    # Generate unique file ID
+    file_id = str(uuid.uuid4())
+
+    # Verify file extension
+    file_extension = check_upload_extension(file.filename)
 
     try:
         # Ensure upload directory exists
         UPLOAD_DIR.mkdir(exist_ok=True)
 
-        # Save file with proper error handling
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-
-        # Verify file was saved
-        if not file_path.exists():
-            raise HTTPException(
-                status_code=500, detail="Failed to save uploaded file")
+        # Hash (and compress, if configured) while streaming into the store
+        name = upload_store.put_stream(iter(lambda: file.file.read(1 << 20), b''), file_extension)
+        file_path = upload_store.local_copy(name, UPLOAD_DIR)
 
         # Store file path for later processing
         uploaded_files[file_id] = file_path
 
-        print(f"File uploaded successfully: ID={file_id}, Path={file_path}")
+        logger.info("File uploaded", extra={"file_id": file_id, "path": str(file_path),
+                                            "content": name})
 
         return {
             "file_id": file_id,
@@ -106,32 +276,52 @@ async def upload_file(file: UploadFile = File(...)):
             "message": "File uploaded successfully"
         }
     except Exception as e:
-        print(f"Error during file upload: {str(e)}")
+        logger.exception("File upload failed", extra={"file_id": file_id})
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
 
 
-@app.post("/api/process/{file_id}")
-async def process_file(file_id: str, background_tasks: BackgroundTasks):
-    """Start processing the uploaded EEG file"""
-    # Check if file exists in our dictionary
+@app.post("/api/upload")
+async def upload_file(file: UploadFile = File(...)):
+    """Upload an EEG file (.set, .edf, or .bdf)"""
+    loop = asyncio.get_event_loop()
+    # Clean up old uploads before processing new ones
+    await loop.run_in_executor(None, partial(clear_uploads_directory, UPLOAD_DIR,
+                                             keep=active_upload_paths()))
+
+    # Hashing and compressing the upload must not block the event loop
+    return await loop.run_in_executor(None, save_upload, file)
+
+
+def check_priority(priority: Optional[str]):
+    if priority is not None and priority not in PRIORITY_CLASSES:
+        raise HTTPException(status_code=400,
+                            detail=f"Invalid priority. Supported: {', '.join(PRIORITY_CLASSES)}")
+
+
+def resolve_upload(file_id: str) -> Path:
+    """
+    Path of an uploaded file that is ready to be processed.
+
+    Raises:
+        HTTPException: 404 if the upload is unknown or gone, 400 if it is not
+            a valid EEG file or another job is already processing it
+    """
+    # File IDs map to content-addressed blobs; files on disk are named by
+    # content, not by file ID, so only the registry can resolve one
     if file_id not in uploaded_files:
-        print(f"File ID not found in uploaded_files dictionary: {file_id}")
-        print(f"Available file IDs: {list(uploaded_files.keys())}")
-
-        # Check if file might exist in uploads directory anyway
-        potential_files = list(UPLOAD_DIR.glob(f"{file_id}*"))
-        if potential_files:
-            file_path = potential_files[0]
-            print(f"Found file in directory that matches ID: {file_path}")
-            uploaded_files[file_id] = file_path
-        else:
-            raise HTTPException(status_code=404, detail="File not found")
+        logger.warning("File ID not registered",
+                       extra={"file_id": file_id, "registered_files": len(uploaded_files)})
+        raise HTTPException(status_code=404, detail="File not found")
 
     file_path = uploaded_files[file_id]
 
+    # The working copy may have been cleaned up while the store still has it
+    if not file_path.exists() and upload_store.exists(file_path.name):
+        file_path = uploaded_files[file_id] = upload_store.local_copy(file_path.name, UPLOAD_DIR)
+
     # Verify file actually exists on disk
     if not file_path.exists():
-        print(f"File doesn't exist at path: {file_path}")
+        logger.warning("Upload missing on disk", extra={"file_id": file_id, "path": str(file_path)})
         raise HTTPException(
             status_code=404, detail="File not found at {file_path}")
 
@@ -145,6 +335,17 @@ async def process_file(file_id: str, background_tasks: BackgroundTasks):
             raise HTTPException(
                 status_code=400, detail="File is already being processed by another job")
 
+    return file_path
+
+
+def queue_job(file_id: str, file_path: Path, estimated_size: int, patient_id: Optional[str] = None,
+              session_date: Optional[str] = None, clinic_id: str = "default",
+              priority: Optional[str] = None, batch_id: Optional[str] = None) -> Dict:
+    """Create a job for a validated upload and hand it to the scheduler"""
+    if priority is None:
+        interactive_max = config.get('scheduler', 'interactive_max_samples', default=10_000_000)
+        priority = INTERACTIVE if estimated_size <= interactive_max else BULK
+
     # Create a new job ID
     job_id = str(uuid.uuid4())
 
@@ -155,29 +356,162 @@ async def process_file(file_id: str, background_tasks: BackgroundTasks):
         "file_path": str(file_path),  # Store the file path for debugging
         "start_time": time.time(),
         "progress": 0,
+        "stage": "queued",
+        "version": 0,
+        "output_dir": str(JOBS_DIR / job_id),
         "output_files": {},
+        "artifacts": {},
+        "patient_id": patient_id,
+        "session_date": session_date or time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "clinic_id": clinic_id,
+        "priority": priority,
+        "estimated_size": estimated_size,
+        "batch_id": batch_id,
         "error": None
     }
 
-    # Add the task to background tasks queue without awaiting it
-    background_tasks.add_task(process_eeg_data, job_id, file_path)
+    # Queue the job; the scheduler starts it when a slot is free
+    cancel_tokens[job_id] = CancelToken()
+    scheduler.submit(job_id, lambda: process_eeg_data(job_id, file_path),
+                     priority=priority, tenant=clinic_id, size=estimated_size)
+    logger.info("Job queued", extra={"job_id": job_id, "priority": priority, "clinic_id": clinic_id,
+                                      "estimated_size": estimated_size, "batch_id": batch_id})
+
+    return {"job_id": job_id, "status": "PENDING", "file_path": str(file_path),
+            "priority": priority, "estimated_size": estimated_size}
+
+
+@app.post("/api/process/{file_id}")
+async def process_file(file_id: str, patient_id: Optional[str] = None,
+                       session_date: Optional[str] = None, clinic_id: str = "default",
+                       priority: Optional[str] = None):
+    """
+    Queue the uploaded EEG file for processing.
+
+    When `patient_id` is given the finished session is added to the patient's
+    history; `session_date` (ISO 8601) defaults to the processing date.
+
+    Jobs are scheduled per `clinic_id` (fair sharing between clinics) and
+    `priority` class: 'interactive' or 'bulk'. Without a priority, jobs whose
+    estimated size (channels x samples, read from the file header) is above
+    scheduler.interactive_max_samples are bulk.
+    """
+    check_priority(priority)
+    file_path = resolve_upload(file_id)
+
+    # Estimate the job size from the file header for shortest-job-first scheduling
+    estimated_size = await asyncio.get_event_loop().run_in_executor(
+        None, estimate_job_size, file_path)
 
     # Return immediately with job ID and initial status
-    return {"job_id": job_id, "status": "PENDING", "file_path": str(file_path)}
+    return queue_job(file_id, file_path, estimated_size, patient_id, session_date,
+                     clinic_id, priority)
+
+
+@app.post("/api/batch")
+async def process_batch(files: Optional[List[UploadFile]] = File(None),
+                        file_ids: Optional[List[str]] = Query(None),
+                        patient_id: Optional[str] = None, clinic_id: str = "default",
+                        priority: Optional[str] = None):
+    """
+    Upload and/or queue several EEG files as one batch.
+
+    Recordings come as multipart `files`, as repeated `file_ids` query
+    parameters of earlier uploads, or both. Every file is validated before
+    any job is queued: if one is rejected the whole batch is (400, with the
+    reason per file) and the files uploaded with it are removed.
+
+    The headers of all files are read once, and the spectral plans, scale
+    tables and colormap the jobs share are built before they are queued.
+    Jobs are then scheduled like single jobs (per clinic, priority class
+    and size; the priority is chosen per file when not given).
+    """
+    check_priority(priority)
+    files = files or []
+    file_ids = list(file_ids or [])
+    if not files and not file_ids:
+        raise HTTPException(status_code=400, detail="No files or file_ids given")
+    if len(set(file_ids)) != len(file_ids):
+        raise HTTPException(status_code=400, detail="Duplicate file_ids in batch")
+    for file in files:
+        check_upload_extension(file.filename)
+
+    loop = asyncio.get_event_loop()
+    if files:
+        keep = active_upload_paths() + [uploaded_files[file_id] for file_id in file_ids
+                                        if file_id in uploaded_files]
+        await loop.run_in_executor(None, partial(clear_uploads_directory, UPLOAD_DIR,
+                                                 keep_latest=max(5, len(files)), keep=keep))
+    saved = [await loop.run_in_executor(None, save_upload, file) for file in files]
+    file_ids += [upload["file_id"] for upload in saved]
+
+    # Validate everything before queueing anything
+    paths, errors = {}, []
+    for file_id in file_ids:
+        try:
+            paths[file_id] = resolve_upload(file_id)
+        except HTTPException as e:
+            errors.append({"file_id": file_id, "status_code": e.status_code, "error": e.detail})
+    if errors:
+        for upload in saved:
+            path = uploaded_files.pop(upload["file_id"])
+            # Identical content may be shared with other uploads
+            if path not in uploaded_files.values():
+                path.unlink(missing_ok=True)
+        raise HTTPException(status_code=400, detail={"message": "Batch rejected", "errors": errors})
+
+    prepared = await loop.run_in_executor(
+        None, prepare_batch, list(paths.values()))
+
+    batch_id = str(uuid.uuid4())
+    job_ids = []
+    for file_id, file_path in paths.items():
+        queued = queue_job(file_id, file_path, prepared["headers"][file_path]["estimated_size"],
+                           patient_id, None, clinic_id, priority, batch_id=batch_id)
+        job_ids.append(queued["job_id"])
+    batches[batch_id] = {"job_ids": job_ids, "clinic_id": clinic_id,
+                         "created": time.time(), "warmup": prepared["warmup"]}
+    logger.info("Batch queued", extra={"batch_id": batch_id, "jobs": len(job_ids)})
+
+    return batch_status_payload(batch_id)
+
+
+def batch_status_payload(batch_id: str) -> Dict:
+    """Aggregate status of a batch plus a summary of each of its jobs"""
+    batch = batches[batch_id]
+    job_states = [{"job_id": job_id, "file_id": jobs[job_id]["file_id"],
+                   "status": jobs[job_id]["status"], "progress": jobs[job_id]["progress"],
+                   "stage": jobs[job_id]["stage"], "priority": jobs[job_id]["priority"]}
+                  for job_id in batch["job_ids"]]
+    return {
+        "batch_id": batch_id,
+        **aggregate_status(job_states),
+        "clinic_id": batch["clinic_id"],
+        "warmup": batch["warmup"],
+        "jobs": job_states
+    }
 
 
-@app.get("/api/status/{job_id}")
-async def get_job_status(job_id: str):
-    """Get the status of a processing job"""
-    if job_id not in jobs:
-        raise HTTPException(status_code=404, detail="Job not found")
+@app.get("/api/batch/{batch_id}")
+async def get_batch_status(batch_id: str):
+    """Aggregate status of a batch; per-job outputs are under /api/status/{job_id}"""
+    if batch_id not in batches:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return batch_status_payload(batch_id)
 
+
+def job_status_payload(job_id: str) -> Dict:
+    """Build the status document shared by polling, long-polling and SSE"""
     job = jobs[job_id]
 
     response = {
         "job_id": job_id,
         "status": job["status"],
         "progress": job["progress"],
+        "stage": job["stage"],
+        "version": job["version"],
+        "priority": job["priority"],
+        "clinic_id": job["clinic_id"],
     }
 
     # Add additional info based on status
@@ -187,41 +521,365 @@ async def get_job_status(job_id: str):
         output_urls = {}
         for key, path in job["output_files"].items():
             if key != "visualizations":  # Handle standard files
-                relative_path = str(Path(path).relative_to("output"))
+                relative_path = Path(path).relative_to("output").as_posix()
                 output_urls[key] = f"{base_url}{relative_path}"
             else:  # Handle visualization directory
-                # Add individual visualization files
-                viz_path = Path(path)
-                if viz_path.exists():
-                    # Add each visualization file with a descriptive key
-                    viz_files = {
-                        "wave_distribution_plot": f"{base_url}plots/wave_distribution_boxplot.png",
-                        "wave_heatmap_plot": f"{base_url}plots/wave_heatmap.png",
-                        "music_parameters_plot": f"{base_url}plots/music_parameters.png",
-                        "global_parameters_plot": f"{base_url}plots/global_parameters.png"
-                    }
-                    # Only include files that actually exist
-                    for viz_key, viz_file_path in viz_files.items():
-                        # if Path("output" + viz_file_path[7:]).exists():
-                        output_urls[viz_key] = viz_file_path
+                # Add each visualization file with a descriptive key
+                viz_url = Path(path).relative_to("output").as_posix()
+                for viz_key, viz_file in visualization_files().items():
+                    output_urls[viz_key] = f"{base_url}{viz_url}/{viz_file}"
 
         response["output_files"] = output_urls
+        # Content-addressed copies that clients may cache forever
+        response["artifacts"] = {
+            key: f"/artifacts/{name}" for key, name in job["artifacts"].items()
+        }
+        response["recomputed_stages"] = job.get("recomputed_stages", [])
         response["processing_time"] = round(
             job["end_time"] - job["start_time"], 2)
+        # Time spent waiting for a scheduler slot (included in processing_time)
+        response["queue_time"] = round(
+            job.get("dispatch_time", job["start_time"]) - job["start_time"], 2)
 
     elif job["status"] == "FAILED":
         response["error"] = job["error"]
 
     return response
 
+
+@app.get("/api/status/{job_id}")
+async def get_job_status(job_id: str, wait: float = 0, since: Optional[int] = None):
+    """
+    Get the status of a processing job.
+
+    With `wait` > 0 this long-polls: the request is held until the job's
+    version moves past `since` (or its current version), up to `wait` seconds.
+    """
+    if job_id not in jobs:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    job = jobs[job_id]
+    logger.debug("Status polled", extra={"job_id": job_id, "wait": wait})
+    if wait > 0 and job["status"] not in TERMINAL_STATUSES:
+        version = job["version"] if since is None else since
+        await wait_for_job_change(job_id, version, min(wait, 60))
+
+    return job_status_payload(job_id)
+
+
+@app.get("/api/jobs/{job_id}/events")
+async def stream_job_events(job_id: str):
+    """Stream job progress as server-sent events until the job finishes"""
+    if job_id not in jobs:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def event_stream():
+        version = None
+        while True:
+            job = jobs[job_id]
+            if job["version"] != version:
+                version = job["version"]
+                payload = json.dumps(job_status_payload(job_id))
+                yield f"id: {version}\nevent: status\ndata: {payload}\n\n"
+                if job["status"] in TERMINAL_STATUSES:
+                    return
+            elif not await wait_for_job_change(job_id, version, SSE_KEEPALIVE_SECONDS):
+                # Comment line keeps proxies from closing an idle stream
+                yield ": keep-alive\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.delete("/api/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """
+    Cancel a processing job.
+
+    Queued jobs are dropped immediately. Running jobs are stopped at the next
+    tile, plot, audio block or stage boundary and their partial outputs are
+    removed; the request waits up to a second for that and answers 202 if the
+    job is still winding down. Finished jobs cannot be cancelled (409).
+    """
+    if job_id not in jobs:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    job = jobs[job_id]
+    if job["status"] == "CANCELLED":
+        return job_status_payload(job_id)
+    if job["status"] in TERMINAL_STATUSES:
+        raise HTTPException(status_code=409, detail=f"Job already {job['status'].lower()}")
+
+    if scheduler.cancel(job_id) == 'queued':
+        cancel_tokens.pop(job_id, None)
+        update_job(job_id, status="CANCELLED", stage="cancelled", end_time=time.time())
+        return job_status_payload(job_id)
+
+    # Running: ask the pipeline to stop and give it a moment to clean up
+    cancel_tokens[job_id].cancel()
+    update_job(job_id, stage="cancelling")
+    deadline = time.monotonic() + CANCEL_WAIT_SECONDS
+    while job["status"] not in TERMINAL_STATUSES:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return JSONResponse(status_code=202, content=job_status_payload(job_id))
+        await wait_for_job_change(job_id, job["version"], remaining)
+    return job_status_payload(job_id)
+
+
+def build_job_bundle(job: Dict) -> Dict:
+    """
+    Collect a finished job's analysis, music and global parameters into one
+    compact document (numbers instead of per-interval string lists).
+    """
+    output_files = job["output_files"]
+    with open(output_files["preprocessed_eeg"], 'r') as f:
+        analysis = json.load(f)
+    with open(output_files["music_parameters"], 'r') as f:
+        music = json.load(f)
+    global_parameters = None
+    if "global_parameters" in output_files:
+        with open(output_files["global_parameters"], 'r') as f:
+            global_parameters = json.load(f)
+
+    intervals = list(analysis["wave_strengths"].keys())
+    return {
+        "analysis": {
+            "interval_length": float(analysis["interval_length"]),
+            "intervals": [int(i) for i in intervals],
+            "bands": analysis.get("bands", DEFAULT_BANDS),
+            "wave_strengths": [[float(v) for v in analysis["wave_strengths"][i]]
+                               for i in intervals]
+        },
+        "music": {
+            "interval_length": float(music["interval_length"]),
+            "columns": ["pitch", "step", "duration"],
+            "values": [[float(v) for v in params]
+                       for params in music["musical_parameters"].values()]
+        },
+        "global_parameters": global_parameters,
+        "artifacts": {key: f"/artifacts/{name}" for key, name in job["artifacts"].items()}
+    }
+
+
+def build_job_zip(job: Dict) -> bytes:
+    """Pack a finished job's binary outputs (MIDI, CSV, plots and plot data) into a zip"""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for key in ("midi_file", "midi_visualization", "audio_file"):
+            path = Path(job["output_files"].get(key, ""))
+            if path.is_file():
+                # CSV compresses well, MIDI and audio barely
+                compression = zipfile.ZIP_DEFLATED if path.suffix == ".csv" else zipfile.ZIP_STORED
+                archive.write(path, path.name, compress_type=compression)
+        plots_dir = job["output_files"].get("visualizations")
+        if plots_dir:
+            for viz_file in visualization_files().values():
+                path = Path(plots_dir) / viz_file
+                if path.is_file():
+                    # PNGs are already compressed; plot data and SVG compress well
+                    compression = zipfile.ZIP_STORED if path.suffix == ".png" else zipfile.ZIP_DEFLATED
+                    archive.write(path, f"plots/{viz_file}", compress_type=compression)
+    return buffer.getvalue()
+
+
+@app.get("/api/jobs/{job_id}/bundle")
+async def get_job_bundle(job_id: str, format: str = "json"):
+    """
+    Return everything a client needs for a finished job in one response.
+
+    `format=json` (default) returns the compact parameters plus artifact URLs,
+    `format=zip` returns the MIDI, CSV and plot files as a zip archive.
+    """
+    if job_id not in jobs:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    job = jobs[job_id]
+    if job["status"] != "COMPLETED":
+        raise HTTPException(
+            status_code=409, detail=f"Job is not completed (status: {job['status']})")
+
+    loop = asyncio.get_event_loop()
+    if format == "json":
+        return await loop.run_in_executor(None, build_job_bundle, job)
+    if format == "zip":
+        content = await loop.run_in_executor(None, build_job_zip, job)
+        return Response(
+            content=content,
+            media_type="application/zip",
+            headers={"Content-Disposition": f'attachment; filename="{job_id}.zip"'}
+        )
+    raise HTTPException(status_code=400, detail="Unsupported bundle format. Use json or zip")
+
+def completed_analysis(job_id: str):
+    """wave_analysis.json of a completed job and its content key, or an HTTP error"""
+    if job_id not in jobs:
+        raise HTTPException(status_code=404, detail="Job not found")
+    job = jobs[job_id]
+    if job["status"] != "COMPLETED":
+        raise HTTPException(
+            status_code=409, detail=f"Job is not completed (status: {job['status']})")
+    path = job["output_files"].get("preprocessed_eeg")
+    if not path or not Path(path).is_file():
+        raise HTTPException(status_code=404, detail="Analysis results not found")
+    # The published artifact is named after the content hash
+    source_key = Path(job.get("artifacts", {}).get("preprocessed_eeg", job_id)).stem
+    return path, source_key
+
+
+@app.get("/api/jobs/{job_id}/heatmap")
+async def get_heatmap_info(job_id: str):
+    """Tile pyramid layout of a job's band heatmap (for pan/zoom clients)"""
+    path, _ = completed_analysis(job_id)
+    bands, strengths, interval_length = await asyncio.get_event_loop().run_in_executor(
+        None, load_band_matrix, path)
+    return {
+        "bands": list(bands),
+        "intervals": len(strengths),
+        "interval_length": float(interval_length),
+        "scale": float(strengths.max()) if strengths.size else 0.0,
+        **pyramid_info(len(strengths), bands),
+        "url_template": f"/api/jobs/{job_id}/heatmap/{{z}}/{{x}}.png"
+    }
+
+
+@app.get("/api/jobs/{job_id}/heatmap/{z}/{x}.png")
+async def get_heatmap_tile(job_id: str, z: int, x: int, request: Request):
+    """
+    One tile of a job's band heatmap: zoom level `z` splits the session into
+    2**z tiles, `x` is the tile column. Tiles are rendered on first request
+    and served from the tile cache afterwards. The ETag covers the tile
+    settings, so changing them never leaves clients on stale tiles.
+    """
+    path, source_key = completed_analysis(job_id)
+    etag = f'"{source_key}-{tile_variant()}-{z}-{x}"'
+    headers = {"Cache-Control": IMMUTABLE_CACHE_CONTROL, "ETag": etag}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    try:
+        content = await asyncio.get_event_loop().run_in_executor(
+            None, get_tile, tile_cache, path, source_key, z, x)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return Response(content=content, media_type="image/png", headers=headers)
+
+
+@app.get("/api/patients/{patient_id}/sessions")
+async def list_patient_sessions(patient_id: str, start: Optional[str] = None,
+                                end: Optional[str] = None):
+    """List a patient's stored sessions with their summary parameters"""
+    sessions = await asyncio.get_event_loop().run_in_executor(
+        None, session_store.list_sessions, patient_id, start, end
+    )
+    summary = await asyncio.get_event_loop().run_in_executor(
+        None, session_store.patient_summary, patient_id
+    )
+    return {"patient_id": patient_id, "summary": summary, "sessions": sessions}
+
+
+@app.get("/api/patients/{patient_id}/sessions/{session_id}")
+async def get_patient_session(patient_id: str, session_id: str, include_matrix: bool = False):
+    """Get one stored session, optionally with its full wave-strength matrix"""
+    session = await asyncio.get_event_loop().run_in_executor(
+        None, session_store.get_session, patient_id, session_id, include_matrix
+    )
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return session
+
+
+@app.get("/api/patients/{patient_id}/trends")
+async def get_patient_trends(patient_id: str, window: int = 5, start: Optional[str] = None,
+                             end: Optional[str] = None):
+    """Rolling band averages, session deltas and tempo/key history for a patient"""
+    return await asyncio.get_event_loop().run_in_executor(
+        None, session_store.trends, patient_id, window, start, end
+    )
+
+
+@app.get("/api/patients/{patient_id}/compare")
+async def compare_patient_sessions(patient_id: str, session_a: str, session_b: str):
+    """Compare two of a patient's sessions (values are session_b minus session_a)"""
+    comparison = await asyncio.get_event_loop().run_in_executor(
+        None, session_store.compare, patient_id, session_a, session_b
+    )
+    if comparison is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return comparison
+
 # Background processing function
 
 
+def publish_job_artifacts(output_files: Dict[str, str]) -> Dict[str, str]:
+    """Publish every output of a finished job into the artifact store"""
+    artifacts = {}
+    for key, path in output_files.items():
+        if key == "visualizations":
+            for viz_key, viz_file in visualization_files().items():
+                viz_path = Path(path) / viz_file
+                if viz_path.exists():
+                    artifacts[viz_key] = publish_artifact(viz_path, artifact_store)
+        elif Path(path).exists():
+            artifacts[key] = publish_artifact(path, artifact_store)
+    return artifacts
+
+
 async def process_eeg_data(job_id: str, file_path: Path):
-    """Process EEG data in the background"""
+    """
+    Process EEG data in the background.
+
+    Every stage is keyed by a fingerprint of its inputs and parameters, so a
+    re-run only recomputes the stages whose inputs changed; the others are
+    restored from the stage cache.
+
+    The job's cancel token is checked between stages and passed into the
+    long-running ones; a cancelled job stops at the next boundary and its
+    partial outputs are removed.
+
+    With pipeline.shared_memory_handoff the analysis and music outputs reach
+    the downstream stages through shared memory instead of being re-read from
+    JSON, and with pipeline.async_persist the JSON files are written in the
+    background; everything is flushed to disk before the manifest is written.
+    """
     job = jobs[job_id]
-    # Get paths from config
-    output_paths = config.get('paths', 'output')
+    loop = asyncio.get_event_loop()
+    cancel = cancel_tokens.setdefault(job_id, CancelToken())
+    # Every job writes into its own directory so concurrent jobs never
+    # overwrite each other's outputs
+    job_dir = Path(job["output_dir"])
+    output_paths = {
+        'json': str(job_dir / 'json'),
+        'midi': str(job_dir / 'midi'),
+        'plots': str(job_dir / 'plots')
+    }
+    preprocessed_eeg_path = Path(output_paths['json']) / 'wave_analysis.json'
+    eeg_music_params_path = Path(output_paths['json']) / 'music_parameters.json'
+    eeg_global_music_params_path = Path(output_paths['json']) / 'global_parameters.json'
+    midi_path = Path(output_paths['midi']) / 'midi_out.mid'
+    csv_path = Path(output_paths['midi']) / 'midi_visualization.csv'
+    recomputed = {}
+    handoff = StageHandoff() if config.get('pipeline', 'shared_memory_handoff', default=False) else None
+    persister = AsyncPersister() if config.get('pipeline', 'async_persist', default=False) else None
+
+    async def run_stage(stage, outputs, func, *args, **kwargs):
+        """Run one stage through the stage cache in a worker thread"""
+        cancel.check()
+        with log_context(stage=stage):
+            start = time.perf_counter()
+            recomputed[stage] = await loop.run_in_executor(
+                None, with_log_context(stage_cache.run, stage, fingerprints[stage], outputs,
+                                       func, *args, **kwargs)
+            )
+            logger.info("Stage finished", extra={"recomputed": recomputed[stage],
+                                                 "seconds": round(time.perf_counter() - start, 3)})
+        cancel.check()
+
+    # Every record logged by this job (and its stage threads) carries its
+    # job_id; the job runs as its own scheduler task, so this stays local to it
+    job_id_var.set(job_id)
 
     try:
         # Setup directories
@@ -229,86 +887,122 @@ async def process_eeg_data(job_id: str, file_path: Path):
             Path(path).mkdir(parents=True, exist_ok=True)
 
         # Set status to processing to indicate work has started
-        job["status"] = "PROCESSING"
-        job["progress"] = 10
+        update_job(job_id, status="PROCESSING", progress=10, stage="preprocessing",
+                   dispatch_time=time.time())
 
-        # Add a delay to simulate processing time
-        await asyncio.sleep(10)
+        # Fingerprint the recording and derive every stage's fingerprint
+        source_fingerprint = await loop.run_in_executor(None, file_fingerprint, file_path)
+        fingerprints = stage_fingerprints(source_fingerprint)
 
         # Step 1: Preprocess EEG data
-        preprocessed_eeg_path = Path(
-            output_paths['json']) / 'wave_analysis.json'
-        await asyncio.get_event_loop().run_in_executor(
-            None, preprocess_eeg, file_path
-        )
+        await run_stage('analysis', {'wave_analysis.json': preprocessed_eeg_path},
+                        preprocess_eeg, file_path, None, output_paths['json'], cancel=cancel,
+                        handoff=handoff, persister=persister)
+        analysis_source = await loop.run_in_executor(
+            None, stage_source, 'analysis', preprocessed_eeg_path, handoff, persister)
         job["output_files"]["preprocessed_eeg"] = str(preprocessed_eeg_path)
-        job["progress"] = 30
+        update_job(job_id, progress=30, stage="music_parameters")
 
         # Step 2: Generate music parameters
-        eeg_music_params_path = Path(
-            output_paths['json']) / 'music_parameters.json'
-        eeg_global_music_params_path = Path(
-            output_paths['json']) / 'global_parameters.json'
-        await asyncio.get_event_loop().run_in_executor(
-            None, eeg_to_music_parameters, preprocessed_eeg_path
-        )
+        await run_stage('music', {'music_parameters.json': eeg_music_params_path,
+                                  'global_parameters.json': eeg_global_music_params_path},
+                        eeg_to_music_parameters, analysis_source, output_paths['json'],
+                        cancel=cancel, handoff=handoff, persister=persister)
+        music_source = await loop.run_in_executor(
+            None, stage_source, 'music', eeg_music_params_path, handoff, persister)
+        global_source = music_source if handoff and 'music' in handoff.headers \
+            else eeg_global_music_params_path
         job["output_files"]["music_parameters"] = str(eeg_music_params_path)
 
-        # Add a delay to simulate processing time
-        await asyncio.sleep(10)
-
-        # Add global parameters to output files
-        global_params_path = Path(
-            output_paths['json']) / 'global_parameters.json'
-        if global_params_path.exists():
-            job["output_files"]["global_parameters"] = str(global_params_path)
+        # Add global parameters to output files (the music stage always
+        # produces them; with async persist the file may still be in flight)
+        job["output_files"]["global_parameters"] = str(eeg_global_music_params_path)
 
-        job["progress"] = 50
-
-        # Add a delay to simulate processing time
-        await asyncio.sleep(10)
+        update_job(job_id, progress=50, stage="midi")
 
         # Step 3: Create MIDI file
-        midi_path = Path(output_paths['midi']) / 'midi_out.mid'
-        await asyncio.get_event_loop().run_in_executor(
-            None, json_to_midi, eeg_music_params_path, eeg_global_music_params_path
-        )
+        await run_stage('midi', {'midi_out.mid': midi_path},
+                        json_to_midi, music_source, global_source, midi_path,
+                        eeg_analysis_path=analysis_source, cancel=cancel)
         job["output_files"]["midi_file"] = str(midi_path)
-        job["progress"] = 65
-
-        # Add a delay to simulate processing time
-        await asyncio.sleep(10)
+        update_job(job_id, progress=65, stage="midi_visualization")
 
         # Step 4: Create MIDI visualization
-        await asyncio.get_event_loop().run_in_executor(
-            None, lambda: visualize_midi(str(midi_path), output_paths['midi'])
-        )
-        csv_path = Path(output_paths['midi']) / \
-            'midi_visualization.csv'  # Corrected path
+        await run_stage('midi_visualization', {'midi_visualization.csv': csv_path},
+                        visualize_midi, str(midi_path), output_paths['midi'])
         job["output_files"]["midi_visualization"] = str(csv_path)
-        job["progress"] = 75
-
-        # Add a delay to simulate processing time
-        await asyncio.sleep(10)
+        update_job(job_id, progress=75, stage="visualizations")
 
         # Step 5: Generate visualizations
-        await asyncio.get_event_loop().run_in_executor(
-            None, create_all_visualizations, preprocessed_eeg_path, eeg_music_params_path
-        )
+        await run_stage('visualizations',
+                        {viz_file: Path(output_paths['plots']) / viz_file
+                         for viz_file in visualization_files().values()},
+                        create_all_visualizations, analysis_source, music_source,
+                        output_paths['plots'], cancel=cancel)
         job["output_files"]["visualizations"] = output_paths['plots']
-        job["progress"] = 90
+
+        # Step 6: Render audio with the built-in synthesizer
+        if config.get('audio', 'enabled', default=False):
+            update_job(job_id, progress=85, stage="audio")
+            mp3_path = Path(output_paths['midi']) / 'output.mp3'
+            audio_path = mp3_path if find_audio_encoder() else mp3_path.with_suffix('.wav')
+            await run_stage('audio', {audio_path.name: audio_path},
+                            convert_midi_to_mp3, str(midi_path), str(mp3_path), cancel=cancel)
+            job["output_files"]["audio_file"] = str(audio_path)
+
+        # Wait for the background writes (and stage cache stores) to land
+        if persister is not None:
+            await loop.run_in_executor(None, persister.flush)
+
+        job["recomputed_stages"] = [stage for stage, ran in recomputed.items() if ran]
+        await loop.run_in_executor(
+            None, write_manifest, job_dir / 'manifest.json', fingerprints, recomputed,
+            source_fingerprint
+        )
+        cancel.check()
+        update_job(job_id, progress=90, stage="publishing")
+
+        # Step 7: Publish content-addressed copies for immutable caching
+        job["artifacts"] = await loop.run_in_executor(
+            None, publish_job_artifacts, job["output_files"]
+        )
+
+        # Step 8: Index the session in the patient's history
+        if job["patient_id"]:
+            await loop.run_in_executor(
+                None, session_store.add_session, job["patient_id"], job_id,
+                job["session_date"], preprocessed_eeg_path, eeg_global_music_params_path
+            )
 
         # Complete job
-        job["status"] = "COMPLETED"
-        job["progress"] = 100
-        job["end_time"] = time.time()
+        update_job(job_id, status="COMPLETED", progress=100, stage="done",
+                   end_time=time.time())
+        logger.info("Job completed", extra={"seconds": round(job["end_time"] - job["dispatch_time"], 3),
+                                            "recomputed_stages": job["recomputed_stages"]})
+
+    except JobCancelled:
+        # Drop the partial outputs so the disk space is reclaimed right away
+        # (after any queued writes, so none land in the removed directory)
+        if persister is not None:
+            await loop.run_in_executor(None, persister.close)
+        await loop.run_in_executor(None, partial(shutil.rmtree, job_dir, ignore_errors=True))
+        job["output_files"] = {}
+        update_job(job_id, status="CANCELLED", stage="cancelled", end_time=time.time())
+        logger.info("Job cancelled")
 
     except Exception as e:
         # Handle failure
-        job["status"] = "FAILED"
-        job["error"] = str(e)
-        job["end_time"] = time.time()
-        print(f"Error during processing: {str(e)}")
+        update_job(job_id, status="FAILED", error=str(e), end_time=time.time())
+        logger.exception("Job failed")
+
+    finally:
+        cancel_tokens.pop(job_id, None)
+        if handoff is not None:
+            handoff.release()
+        if persister is not None:
+            persister.close()
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("api:app", host="0.0.0.0", port=8005, reload=True)
@@ -9,6 +9,7 @@ from core.eeg_processor import preprocess_eeg
 from core.music_mapper import eeg_to_music_parameters
 from core.midi_generator import json_to_midi
 from core.midi_visualizer import visualize_midi
+from core.audio_renderer import convert_midi_to_mp3
 
 __all__ = [
     'preprocess_eeg',
@@ -28,22 +29,28 @@ __core_version__ = "0.1.0"
 SUPPORTED_FORMATS = ['.set', '.edf', '.bdf']
 
 # Define the supported output formats
-SUPPORTED_OUTPUTS = ['midi', 'json', 'mp3']
+SUPPORTED_OUTPUTS = ['midi', 'json', 'mp3', 'wav']
 
 # Define a complete processing pipeline function
 def process_eeg_pipeline(eeg_file_path, output_directory=None):
     """
     Run the complete EEG to music processing pipeline
     
+    Stages whose inputs and parameters are unchanged since an earlier run
+    are restored from the stage cache instead of being recomputed.
+    
     Args:
         eeg_file_path (str or Path): Path to the EEG file
         output_directory (str or Path, optional): Directory for output files
         
     Returns:
-        dict: Dictionary with paths to all output files
+        dict: Dictionary with paths to all output files ('mp3_file' only
+            when audio.enabled is set, as in the API)
     """
     from pathlib import Path
     from utils.config import config
+    from core.stages import StageCache, file_fingerprint, stage_fingerprints
+    from core.handoff import AsyncPersister, StageHandoff
     
     # Use default output paths from config if not specified
     if not output_directory:
@@ -54,38 +61,111 @@ def process_eeg_pipeline(eeg_file_path, output_directory=None):
         output_paths = {
             'json': str(output_directory / 'json'),
             'midi': str(output_directory / 'midi'),
-            'visualization': str(output_directory / 'visualization')
+            'plots': str(output_directory / 'plots')
         }
     
     # Create output directories if they don't exist
     for path in output_paths.values():
         Path(path).mkdir(parents=True, exist_ok=True)
     
+    # Fingerprint every stage from the recording and the current config
+    stage_cache = StageCache(config.get('paths', 'stage_cache'))
+    source_fingerprint = file_fingerprint(eeg_file_path)
+    fingerprints = stage_fingerprints(source_fingerprint)
+    recomputed = {}
+    
+    # Hand analysis and music outputs to later stages in shared memory and
+    # write their JSON files in the background
+    handoff = StageHandoff() if config.get('pipeline', 'shared_memory_handoff', default=False) else None
+    persister = AsyncPersister() if config.get('pipeline', 'async_persist', default=False) else None
+    try:
+        return _run_pipeline_stages(eeg_file_path, output_paths, stage_cache, fingerprints,
+                                    source_fingerprint, recomputed, handoff, persister)
+    finally:
+        if handoff is not None:
+            handoff.release()
+        if persister is not None:
+            persister.close()
+
+
+def _run_pipeline_stages(eeg_file_path, output_paths, stage_cache, fingerprints,
+                         source_fingerprint, recomputed, handoff, persister):
+    """Stages of process_eeg_pipeline, run with an optional handoff and persister"""
+    from pathlib import Path
+    from core.stages import write_manifest
+    from core.audio_renderer import find_audio_encoder
+    from core.handoff import stage_source
+    from utils.config import config
+    from visualization.plots import create_all_visualizations, visualization_files
+    
     # Step 1: Preprocess EEG data
     preprocessed_eeg_path = Path(output_paths['json']) / 'wave_analysis.json'
-    preprocess_eeg(eeg_file_path)
+    recomputed['analysis'] = stage_cache.run(
+        'analysis', fingerprints['analysis'], {'wave_analysis.json': preprocessed_eeg_path},
+        preprocess_eeg, eeg_file_path, None, output_paths['json'],
+        handoff=handoff, persister=persister)
+    analysis_source = stage_source('analysis', preprocessed_eeg_path, handoff, persister)
     
     # Step 2: Generate music parameters
     eeg_music_params_path = Path(output_paths['json']) / 'music_parameters.json'
-    eeg_to_music_parameters(preprocessed_eeg_path)
+    eeg_global_music_params_path = Path(output_paths['json']) / 'global_parameters.json'
+    recomputed['music'] = stage_cache.run(
+        'music', fingerprints['music'],
+        {'music_parameters.json': eeg_music_params_path,
+         'global_parameters.json': eeg_global_music_params_path},
+        eeg_to_music_parameters, analysis_source, output_paths['json'],
+        handoff=handoff, persister=persister)
+    music_source = stage_source('music', eeg_music_params_path, handoff, persister)
+    global_source = music_source if handoff and 'music' in handoff.headers \
+        else eeg_global_music_params_path
     
     # Step 3: Create MIDI file
     midi_path = Path(output_paths['midi']) / 'midi_out.mid'
-    json_to_midi(eeg_music_params_path)
+    recomputed['midi'] = stage_cache.run(
+        'midi', fingerprints['midi'], {'midi_out.mid': midi_path},
+        json_to_midi, music_source, global_source, midi_path,
+        eeg_analysis_path=analysis_source)
     
     # Step 4: Create MIDI visualization
-    csv_path, _ = visualize_midi(str(midi_path), output_paths['json'])
+    csv_path = Path(output_paths['midi']) / 'midi_visualization.csv'
+    recomputed['midi_visualization'] = stage_cache.run(
+        'midi_visualization', fingerprints['midi_visualization'],
+        {'midi_visualization.csv': csv_path},
+        visualize_midi, str(midi_path), output_paths['midi'])
+    
+    # Step 5: Generate visualizations
+    plot_files = list(visualization_files().values())
+    recomputed['visualizations'] = stage_cache.run(
+        'visualizations', fingerprints['visualizations'],
+        {name: Path(output_paths['plots']) / name for name in plot_files},
+        create_all_visualizations, analysis_source, music_source, output_paths['plots'])
+    
+    # Step 6: Render the MIDI to audio (MP3 when a local encoder exists, WAV otherwise)
+    audio_path = None
+    if config.get('audio', 'enabled', default=False):
+        mp3_path = Path(output_paths['midi']) / 'output.mp3'
+        audio_path = mp3_path if find_audio_encoder() else mp3_path.with_suffix('.wav')
+        recomputed['audio'] = stage_cache.run(
+            'audio', fingerprints['audio'], {audio_path.name: audio_path},
+            convert_midi_to_mp3, str(midi_path), str(mp3_path))
+    
+    # Everything queued in the background must be on disk before the manifest
+    if persister is not None:
+        persister.flush()
     
-    # Step 5: Convert MIDI to MP3
-    mp3_path = Path(output_paths['midi']) / 'output.mp3'
-    convert_midi_to_mp3(str(midi_path), str(mp3_path))
+    manifest_path = Path(output_paths['json']) / 'manifest.json'
+    write_manifest(manifest_path, fingerprints, recomputed, source_fingerprint)
     
     # Return paths to all generated files
-    return {
+    output_files = {
         'preprocessed_eeg': str(preprocessed_eeg_path),
         'music_parameters': str(eeg_music_params_path),
+        'global_parameters': str(eeg_global_music_params_path),
         'midi_file': str(midi_path),
-        'mp3_file': str(mp3_path),
         'midi_visualization': str(csv_path),
-        'visualizations_dir': output_paths['visualization']
+        'visualizations_dir': output_paths['plots'],
+        'manifest': str(manifest_path)
     }
+    if audio_path is not None:
+        output_files['mp3_file'] = str(audio_path)
+    return output_files
@@ -0,0 +1,208 @@
+import shutil
+import subprocess
+import wave
+from pathlib import Path
+
+import numpy as np
+from mido import MidiFile
+
+from core.cancellation import raise_if_cancelled
+from utils.config import config
+from utils.log import get_logger
+
+logger = get_logger(__name__)
+
+# One cycle of the instrument waveform: a few decaying harmonics, roughly piano-like
+WAVETABLE_SIZE = 4096
+HARMONICS = (1.0, 0.5, 0.3, 0.15, 0.08, 0.04)
+
+# Envelope shape in seconds
+ATTACK_SECONDS = 0.01
+DECAY_SECONDS = 1.2
+RELEASE_SECONDS = 0.08
+
+# Per-note gain; overlapping notes are soft-limited with tanh
+NOTE_GAIN = 0.25
+
+
+def _build_wavetable():
+    phase = np.arange(WAVETABLE_SIZE) * (2 * np.pi / WAVETABLE_SIZE)
+    table = sum(amp * np.sin((i + 1) * phase) for i, amp in enumerate(HARMONICS))
+    return (table / np.abs(table).max()).astype(np.float32)
+
+
+WAVETABLE = _build_wavetable()
+
+
+def midi_note_arrays(midi_file_path):
+    """
+    Read the notes of a MIDI file as parallel arrays in seconds.
+
+    Tempo changes and all tracks are taken into account (mido merges the
+    tracks and converts delta times to seconds when iterating a file).
+
+    Args:
+        midi_file_path (str): Path to the MIDI file
+
+    Returns:
+        tuple: (starts, durations, pitches, velocities) NumPy arrays
+    """
+    starts, durations, pitches, velocities = [], [], [], []
+    sounding = {}  # (channel, note) -> list of (start, velocity)
+    now = 0.0
+    for message in MidiFile(midi_file_path):
+        now += message.time
+        if message.type == 'note_on' and message.velocity > 0:
+            sounding.setdefault((message.channel, message.note), []).append((now, message.velocity))
+        elif message.type in ('note_off', 'note_on'):
+            pending = sounding.get((message.channel, message.note))
+            if pending:
+                start, velocity = pending.pop(0)
+                starts.append(start)
+                durations.append(now - start)
+                pitches.append(message.note)
+                velocities.append(velocity)
+
+    return (np.array(starts, dtype=np.float64), np.array(durations, dtype=np.float64),
+            np.array(pitches, dtype=np.int16), np.array(velocities, dtype=np.int16))
+
+
+def render_notes_to_wav(starts, durations, pitches, velocities, wav_path,
+                        sample_rate=22050, block_seconds=10.0, cancel=None):
+    """
+    Synthesize notes with a wavetable oscillator and stream them to a WAV file.
+
+    Audio is rendered one block at a time. Within a block every sample of
+    every sounding note is computed in a single flat vectorized pass and
+    mixed with np.bincount, so there is no per-note or per-sample Python
+    loop and memory stays bounded by the block size.
+
+    Args:
+        starts (ndarray): Note start times in seconds
+        durations (ndarray): Note durations in seconds
+        pitches (ndarray): MIDI note numbers
+        velocities (ndarray): MIDI velocities (0-127)
+        wav_path (str): Output WAV path (16-bit mono PCM)
+        sample_rate (int): Output sample rate in Hz
+        block_seconds (float): Length of each rendered block
+        cancel (CancelToken, optional): Checked before every block
+
+    Returns:
+        str: Path to the written WAV file
+
+    Raises:
+        JobCancelled: If `cancel` is triggered
+    """
+    starts = np.asarray(starts, dtype=np.float64)
+    durations = np.asarray(durations, dtype=np.float64)
+    frequencies = 440.0 * 2.0 ** ((np.asarray(pitches, dtype=np.float64) - 69) / 12)
+    gains = np.asarray(velocities, dtype=np.float64) / 127 * NOTE_GAIN
+
+    # Note extents in samples, including the release tail
+    note_first = np.round(starts * sample_rate).astype(np.int64)
+    note_end = note_first + np.round((durations + RELEASE_SECONDS) * sample_rate).astype(np.int64)
+    total_samples = int(note_end.max()) if len(note_end) else 0
+    block_size = max(1, int(block_seconds * sample_rate))
+    table_scale = WAVETABLE_SIZE / sample_rate
+
+    Path(wav_path).parent.mkdir(parents=True, exist_ok=True)
+    with wave.open(str(wav_path), 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+
+        for block_start in range(0, total_samples, block_size):
+            raise_if_cancelled(cancel)
+            block_end = min(block_start + block_size, total_samples)
+            active = np.flatnonzero((note_first < block_end) & (note_end > block_start))
+
+            block = np.zeros(block_end - block_start, dtype=np.float64)
+            if len(active):
+                # Flatten the sample ranges of all active notes into one index space
+                lo = np.maximum(note_first[active], block_start)
+                hi = np.minimum(note_end[active], block_end)
+                lengths = hi - lo
+                owner = np.repeat(np.arange(len(active)), lengths)
+                offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+                positions = np.repeat(lo, lengths) + offsets
+                notes = active[owner]
+
+                # Samples since note onset drive both the oscillator phase and the envelope
+                elapsed = positions - note_first[notes]
+                t = elapsed / sample_rate
+                phase = (elapsed * (frequencies[notes] * table_scale)).astype(np.int64)
+                samples = WAVETABLE[phase % WAVETABLE_SIZE]
+
+                release_left = (durations[notes] + RELEASE_SECONDS - t) / RELEASE_SECONDS
+                envelope = (np.minimum(1.0, t / ATTACK_SECONDS)
+                            * np.exp(-t / DECAY_SECONDS)
+                            * np.clip(release_left, 0.0, 1.0))
+
+                block = np.bincount(positions - block_start, weights=samples * envelope * gains[notes],
+                                    minlength=len(block))
+
+            pcm = (np.tanh(block) * 32767).astype('<i2')
+            wav.writeframes(pcm.tobytes())
+
+    return str(wav_path)
+
+
+def find_audio_encoder():
+    """Return the path of a local MP3 encoder (ffmpeg or lame), or None"""
+    return shutil.which('ffmpeg') or shutil.which('lame')
+
+
+def encode_mp3(wav_path, mp3_path, encoder=None):
+    """
+    Encode a WAV file to MP3 with a local encoder.
+
+    Args:
+        wav_path (str): Input WAV file
+        mp3_path (str): Output MP3 file
+        encoder (str, optional): Encoder executable, found on PATH if omitted
+
+    Returns:
+        str: Path to the MP3 file, or None when no encoder is installed
+    """
+    encoder = encoder or find_audio_encoder()
+    if encoder is None:
+        return None
+    if Path(encoder).name.startswith('ffmpeg'):
+        command = [encoder, '-y', '-loglevel', 'error', '-i', str(wav_path),
+                   '-codec:a', 'libmp3lame', '-q:a', '4', str(mp3_path)]
+    else:
+        command = [encoder, '--quiet', '-V', '4', str(wav_path), str(mp3_path)]
+    subprocess.run(command, check=True)
+    return str(mp3_path)
+
+
+def convert_midi_to_mp3(midi_file_path, mp3_path, sample_rate=None, cancel=None):
+    """
+    Render a MIDI file to audio with the built-in synthesizer.
+
+    A WAV file is always written next to `mp3_path`; it is then encoded to
+    MP3 if ffmpeg or lame is available locally.
+
+    Args:
+        midi_file_path (str): Path to the MIDI file
+        mp3_path (str): Desired MP3 output path
+        sample_rate (int, optional): Sample rate, defaults to audio.sample_rate
+        cancel (CancelToken, optional): Stops rendering between blocks
+
+    Returns:
+        str: Path to the MP3 file, or to the WAV file when no encoder is installed
+    """
+    if sample_rate is None:
+        sample_rate = config.get('audio', 'sample_rate', default=22050)
+
+    wav_path = Path(mp3_path).with_suffix('.wav')
+    render_notes_to_wav(*midi_note_arrays(midi_file_path), wav_path, sample_rate=sample_rate,
+                        cancel=cancel)
+    raise_if_cancelled(cancel)
+
+    encoded = encode_mp3(wav_path, mp3_path)
+    if encoded is None:
+        logger.info("No MP3 encoder found, audio saved as WAV: %s", wav_path)
+        return str(wav_path)
+    logger.info("Audio rendered and saved to: %s", encoded)
+    return encoded
@@ -0,0 +1,114 @@
+"""
+Batches of recordings submitted together.
+
+Everything a job needs that depends only on the configuration and the
+sampling rate - spectral plans, scale lookup tables, the heatmap colormap -
+lives in process-wide caches. A batch reads every header once, then fills
+those caches for each distinct sampling rate before its jobs are queued, so
+the jobs start warm instead of each paying the set-up on the worker.
+"""
+import time
+
+from core.eeg_processor import select_spectral_plan
+from core.scales import get_scale_table, scale_tables
+from data.headers import estimate_job_size, read_eeg_header
+from utils.config import config
+from utils.log import get_logger
+from visualization.tiles import colormap_table, tile_settings
+
+logger = get_logger(__name__)
+
+# Aggregate state of a batch whose jobs have all finished, but not all the same way
+PARTIAL = "PARTIAL"
+
+
+def read_batch_headers(file_paths) -> dict:
+    """
+    Read the header of every recording of a batch.
+
+    Args:
+        file_paths (list): Paths of the recordings
+
+    Returns:
+        dict: path -> {"header": dict or None, "estimated_size": int} (see
+            estimate_job_size)
+    """
+    headers = {}
+    for path in file_paths:
+        try:
+            header = read_eeg_header(path)
+        except Exception:
+            header = None
+        headers[path] = {"header": header, "estimated_size": estimate_job_size(path, header)}
+    return headers
+
+
+def warm_shared_resources(sampling_rates) -> dict:
+    """
+    Build the cached resources the batch's jobs will use.
+
+    Args:
+        sampling_rates (iterable): Sampling rates (Hz) of the recordings
+
+    Returns:
+        dict: spectral_plans (one per rate), scale_tables and seconds spent
+    """
+    start = time.perf_counter()
+    rates = sorted({float(rate) for rate in sampling_rates if rate})
+    for rate in rates:
+        select_spectral_plan(rate)
+
+    tables = scale_tables()
+    configured_key = config.get('music', 'key', default='auto')
+    if configured_key and configured_key != 'auto':
+        get_scale_table(configured_key)
+    colormap_table(tile_settings()["colormap"])
+
+    summary = {"spectral_plans": len(rates), "scale_tables": len(tables),
+               "seconds": round(time.perf_counter() - start, 4)}
+    logger.info("Batch resources warmed", extra=summary)
+    return summary
+
+
+def prepare_batch(file_paths) -> dict:
+    """
+    Read the headers of a batch and warm the shared caches for it.
+
+    Returns:
+        dict: headers (see read_batch_headers) and warmup (see warm_shared_resources)
+    """
+    headers = read_batch_headers(file_paths)
+    rates = [entry["header"]["sfreq"] for entry in headers.values() if entry["header"]]
+    return {"headers": headers, "warmup": warm_shared_resources(rates)}
+
+
+def aggregate_status(job_states) -> dict:
+    """
+    Combine the states of a batch's jobs.
+
+    The batch is PENDING until a job starts, PROCESSING while any job is
+    unfinished, then COMPLETED, FAILED or CANCELLED when every job ended that
+    way and PARTIAL otherwise.
+
+    Args:
+        job_states (list): Dicts with the jobs' status and progress
+
+    Returns:
+        dict: status, progress (mean of the jobs) and the job count per status
+    """
+    counts = {}
+    for state in job_states:
+        counts[state["status"]] = counts.get(state["status"], 0) + 1
+
+    unfinished = counts.get("PENDING", 0) + counts.get("PROCESSING", 0)
+    if counts.get("PENDING", 0) == len(job_states):
+        status = "PENDING"
+    elif unfinished:
+        status = "PROCESSING"
+    elif len(counts) == 1:
+        status = next(iter(counts))
+    else:
+        status = PARTIAL
+
+    progress = sum(state["progress"] for state in job_states) / len(job_states) if job_states else 0
+    return {"status": status, "progress": round(progress, 1), "counts": counts}
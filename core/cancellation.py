@@ -0,0 +1,36 @@
+import threading
+
+
+class JobCancelled(Exception):
+    """Raised inside a pipeline stage when its job has been cancelled"""
+
+
+class CancelToken:
+    """
+    Cooperative cancellation flag shared between the API and a running job.
+
+    The API sets it from the event loop; pipeline stages running in worker
+    threads poll it at interval, tile, plot and audio-block boundaries and
+    stop by raising JobCancelled.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def check(self):
+        """Raise JobCancelled if the job has been cancelled"""
+        if self._event.is_set():
+            raise JobCancelled()
+
+
+def raise_if_cancelled(cancel):
+    """Check an optional CancelToken (None means the caller cannot be cancelled)"""
+    if cancel is not None:
+        cancel.check()
@@ -1,87 +1,670 @@
 import mne
 import numpy as np
-from scipy import signal
 import json
 import os
+import sys
+import tempfile
+import time
 import warnings
 
-# Suppress the specific RuntimeWarning
+# Peak memory reporting is only available on Unix
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from core.cancellation import raise_if_cancelled
+from core.handoff import write_json
+from core.segmentation import (
+    AnnotationIndex, build_intervals, condition_aggregates, segmentation_settings
+)
+from core.spectral import (
+    SPECTRAL_BACKENDS, decimate, decimation_factor, decimation_halo, get_spectral_plan
+)
+from data.synthetic import write_synthetic_eeglab
+from utils.config import config
+from utils.log import get_logger
+
+logger = get_logger(__name__)
+
+# Boundary events are handled by the segmentation (core.segmentation); MNE's warning is redundant
 warnings.filterwarnings('ignore', category=RuntimeWarning, message='The data contains.*boundary.*events')
+# Recordings without an .fdt sidecar are loaded whole; tiling still bounds the analysis memory
+warnings.filterwarnings('ignore', category=RuntimeWarning, message='Data will be preloaded')
 
 
-def preprocess_eeg(filename, interval_length=5):
+def read_raw(filename):
+    """
+    Open a recording without loading its samples: EEGLAB (.set), or EDF/EDF+
+    (.edf) and BDF (.bdf), whose annotations (e.g. EDF+ TAL events) arrive in
+    raw.annotations like EEGLAB events.
+    """
+    extension = os.path.splitext(str(filename))[1].lower()
+    if extension == '.edf':
+        return mne.io.read_raw_edf(filename, preload=False)
+    if extension == '.bdf':
+        return mne.io.read_raw_bdf(filename, preload=False)
+    return mne.io.read_raw_eeglab(filename, preload=False)
+
+
+def interval_view(data, samples_per_interval):
+    """
+    Split continuous data into complete intervals without copying.
+
+    Parameters:
+    data (ndarray): Array of shape (channels, samples)
+    samples_per_interval (int): Number of samples in each interval
+
+    Returns:
+    ndarray: View of shape (channels, intervals, samples_per_interval)
+    """
+    num_intervals = data.shape[1] // samples_per_interval
+    return data[:, :num_intervals * samples_per_interval].reshape(
+        data.shape[0], num_intervals, samples_per_interval)
+
+
+def gather_intervals(data, offsets, samples_per_interval):
+    """
+    Intervals starting at the given sample offsets of a block.
+
+    Back-to-back intervals are a view of the block; others (event-aligned
+    layouts with gaps) are gathered into a copy.
+
+    Parameters:
+    data (ndarray): Array of shape (channels, samples)
+    offsets (ndarray): Start sample of each interval within `data`
+    samples_per_interval (int): Number of samples in each interval
+
+    Returns:
+    ndarray: Array of shape (channels, intervals, samples_per_interval)
+    """
+    first = int(offsets[0])
+    if np.array_equal(offsets, first + np.arange(len(offsets)) * samples_per_interval):
+        return interval_view(data[:, first:first + len(offsets) * samples_per_interval],
+                             samples_per_interval)
+    return data[:, offsets[:, None] + np.arange(samples_per_interval)]
+
+
+def interval_statistics(intervals):
+    """
+    Per-channel, per-interval amplitude statistics used by quality control.
+
+    Parameters:
+    intervals (ndarray): Interval view of shape (channels, intervals, samples)
+
+    Returns:
+    tuple: (peak_to_peak, variance), each of shape (channels, intervals)
+    """
+    return np.ptp(intervals, axis=-1), intervals.var(axis=-1)
+
+
+def classify_intervals(peak_to_peak, variance, settings):
+    """
+    Flag artifact-contaminated intervals from their amplitude statistics.
+
+    Parameters:
+    peak_to_peak (ndarray): Array of shape (channels, intervals)
+    variance (ndarray): Array of shape (channels, intervals)
+    settings (dict): The processing.eeg.quality section of the config
+
+    Returns:
+    dict: Boolean `mask` (True = good interval) and per-criterion interval counts
+    """
+    median_variance = np.median(variance, axis=1, keepdims=True)
+
+    high_amplitude = peak_to_peak > settings['max_peak_to_peak']
+    flatline = peak_to_peak < settings['flatline_peak_to_peak']
+    high_variance = variance > settings['variance_factor'] * median_variance
+
+    # An interval is bad when too many of its channels are flagged
+    flagged = high_amplitude | flatline | high_variance
+    bad_fraction = flagged.mean(axis=0)
+    mask = bad_fraction <= settings['max_bad_channel_fraction']
+
+    return {
+        "mask": mask,
+        "high_amplitude": int(high_amplitude.any(axis=0).sum()),
+        "flatline": int(flatline.any(axis=0).sum()),
+        "high_variance": int(high_variance.any(axis=0).sum())
+    }
+
+
+def detect_bad_intervals(intervals, settings):
+    """
+    Flag artifact-contaminated intervals (blinks, electrode pops, flat signals).
+
+    Peak-to-peak amplitude and variance are computed per channel and interval
+    in one vectorized pass over the interval view. A channel is flagged in an
+    interval if its peak-to-peak amplitude is above `max_peak_to_peak` or below
+    `flatline_peak_to_peak`, or if its variance exceeds `variance_factor` times
+    that channel's median variance.
+
+    Parameters:
+    intervals (ndarray): Interval view of shape (channels, intervals, samples)
+    settings (dict): The processing.eeg.quality section of the config
+
+    Returns:
+    dict: Boolean `mask` (True = good interval) and per-criterion interval counts
+    """
+    return classify_intervals(*interval_statistics(intervals), settings)
+
+
+def plan_tiles(num_channels, num_intervals, bytes_per_channel_interval, memory_budget_mb):
+    """
+    Choose channel and interval block sizes that keep one tile within budget.
+
+    Whole channel sets are preferred (they are read in a single pass over the
+    file); channels are only split when one interval of all channels does not
+    fit. At least one channel and one interval are always processed, so an
+    impossible budget degrades to the smallest tile instead of failing.
+
+    Parameters:
+    num_channels (int): Channels in the recording
+    num_intervals (int): Complete intervals in the recording
+    bytes_per_channel_interval (int): Working memory for one interval of one channel
+    memory_budget_mb (float): Memory allowed for one tile
+
+    Returns:
+    tuple: (channels_per_tile, intervals_per_tile, estimated tile bytes)
+    """
+    budget = memory_budget_mb * 1024 * 1024
+    per_channel_interval = bytes_per_channel_interval
+
+    channels = int(min(num_channels, max(1, budget // per_channel_interval)))
+    intervals = int(min(max(num_intervals, 1), max(1, budget // (per_channel_interval * channels))))
+    return channels, intervals, channels * intervals * per_channel_interval
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process in MiB, or None where unavailable"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def chunked_interval_analysis(raw, plan, quality_settings, memory_budget_mb,
+                              decimation=1, dtype=np.float64, cancel=None, starts=None):
+    """
+    Channel-averaged band powers and quality statistics of every interval,
+    computed tile by tile so memory stays bounded for long, high-density
+    recordings.
+
+    Each tile is a block of channels over a block of intervals read straight
+    from the recording. Band powers (from the plan's spectral backend) are
+    accumulated as a running sum over channel blocks, and the small (channels, intervals) amplitude statistics are
+    filled in per tile, so no step ever holds the whole recording.
+
+    With `decimation` > 1 each tile is read with enough surrounding samples
+    for the polyphase anti-aliasing filter, so tiled decimation matches
+    decimating the whole recording. Quality statistics always use the native
+    samples.
+
+    Intervals tile the recording from its first sample unless `starts` gives
+    their positions (see core.segmentation); a tile then reads the span of
+    its intervals and gathers them from it. Tiles are split wherever
+    consecutive intervals are further apart than an interval, so skipped
+    (boundary / BAD) data is never read and every read stays within budget.
+
+    Parameters:
+    raw (mne.io.Raw): Recording, preloaded or not
+    plan (SpectralPlan): Spectral plan (backend) for the (decimated) analysis rate
+    quality_settings (dict): The processing.eeg.quality section of the config
+    memory_budget_mb (float): Memory allowed for one tile
+    decimation (int): Downsampling factor applied before the PSD
+    dtype (dtype): Precision of the decimation and spectral estimate
+    cancel (CancelToken, optional): Checked before every tile
+    starts (ndarray, optional): Native start sample of every interval, in
+        increasing order and multiples of `decimation`
+
+    Returns:
+    tuple: (band powers of shape (intervals, bands), quality dict, memory report dict)
+    """
+    spi = plan.samples_per_interval * decimation  # native samples per interval
+    halo = decimation_halo(decimation)
+    num_channels = len(raw.ch_names)
+    if starts is None:
+        starts = np.arange(raw.n_times // spi, dtype=np.int64) * spi
+    num_intervals = len(starts)
+
+    itemsize = np.dtype(dtype).itemsize
+    bytes_per_channel_interval = plan.working_bytes_per_interval(itemsize)
+    if decimation > 1 or itemsize != 8:
+        # The native float64 block is held next to its converted/filtered copy
+        bytes_per_channel_interval += 2 * spi * 8
+    tile_channels, tile_intervals, tile_bytes = plan_tiles(
+        num_channels, num_intervals, bytes_per_channel_interval, memory_budget_mb)
+
+    power_sum = np.zeros((num_intervals, len(plan.band_names)))
+    if quality_settings['enabled']:
+        peak_to_peak = np.empty((num_channels, num_intervals))
+        variance = np.empty((num_channels, num_intervals))
+
+    # Runs of contiguous (or overlapping) intervals, cut into tiles of at most tile_intervals
+    breaks = np.flatnonzero(np.diff(starts) > spi) + 1
+    run_bounds = zip(np.concatenate(([0], breaks)), np.concatenate((breaks, [num_intervals])))
+    interval_tiles = [(int(first), int(min(first + tile_intervals, run_end)))
+                      for run_start, run_end in run_bounds
+                      for first in range(run_start, run_end, tile_intervals)]
+
+    tiles = 0
+    for first_channel in range(0, num_channels, tile_channels):
+        picks = np.arange(first_channel, min(first_channel + tile_channels, num_channels))
+        for first, last in interval_tiles:
+            raise_if_cancelled(cancel)
+            start = max(0, starts[first] - halo)
+            block = raw.get_data(picks=picks, start=start,
+                                 stop=min(raw.n_times, starts[last - 1] + spi + halo))
+            offsets = starts[first:last] - start
+            logger.debug("Tile read", extra={"channels": [int(picks[0]), int(picks[-1])],
+                                             "intervals": [first, last]})
+
+            if quality_settings['enabled']:
+                peak_to_peak[picks, first:last], variance[picks, first:last] = \
+                    interval_statistics(gather_intervals(block, offsets, spi))
+
+            samples = decimate(block, decimation, dtype)
+            power_sum[first:last] += plan.interval_band_powers(gather_intervals(
+                samples, offsets // decimation, plan.samples_per_interval)).sum(axis=0)
+            tiles += 1
+            del block, samples
+
+    if quality_settings['enabled']:
+        quality = classify_intervals(peak_to_peak, variance, quality_settings)
+    else:
+        quality = {"mask": np.ones(num_intervals, dtype=bool)}
+
+    memory = {
+        "budget_mb": memory_budget_mb,
+        "tile_channels": tile_channels,
+        "tile_intervals": tile_intervals,
+        "tiles": tiles,
+        "estimated_tile_peak_mb": round(tile_bytes / (1024 * 1024), 1),
+        "process_peak_rss_mb": peak_rss_mb()
+    }
+    return power_sum / num_channels, quality, memory
+
+
+def select_spectral_plan(sfreq, interval_length=None, frequency_bands=None, fast_path=None,
+                         backend=None):
+    """
+    Spectral plan, decimation factor and working dtype for a sampling rate.
+
+    Parameters:
+    sfreq (float): Native sampling frequency in Hz
+    interval_length (int, optional): Interval length in seconds
+    frequency_bands (dict, optional): Band name -> [low, high] Hz
+    fast_path (dict, optional): Settings like processing.eeg.fast_path (the default)
+    backend (str, optional): Spectral backend, defaults to processing.eeg.spectral.backend
+
+    Returns:
+    tuple: (plan at the analysed rate, decimation factor, numpy dtype)
+    """
+    if fast_path is None:
+        fast_path = config.get('processing', 'eeg', 'fast_path', default={})
+    plan = get_spectral_plan(sfreq, interval_length, frequency_bands, backend)
+    decimation, dtype = 1, np.float64
+    if fast_path.get('enabled'):
+        dtype = np.dtype(fast_path.get('dtype', 'float32')).type
+        if fast_path.get('decimate', True):
+            highest_band = max(high for _, high in plan.band_edges)
+            decimation = decimation_factor(sfreq, plan.samples_per_interval, highest_band,
+                                           fast_path.get('nyquist_margin', 1.25))
+        if decimation > 1:
+            plan = get_spectral_plan(sfreq / decimation, interval_length, frequency_bands, plan.name)
+    return plan, decimation, dtype
+
+
+def analyze_recording(raw, interval_length=None, frequency_bands=None, fast_path=None,
+                      cancel=None, backend=None, segmentation=None):
+    """
+    Band percentages and quality control of every interval of a recording.
+
+    Parameters:
+    raw (mne.io.Raw): Recording, preloaded or not
+    interval_length (int, optional): Interval length in seconds,
+        defaults to processing.eeg.interval_length
+    frequency_bands (dict, optional): Band name -> [low, high] Hz,
+        defaults to processing.eeg.frequency_bands
+    fast_path (dict, optional): Settings like processing.eeg.fast_path
+        (the default); when enabled, PSDs are computed in the configured
+        dtype after decimating to the lowest rate that keeps every band
+    cancel (CancelToken, optional): Stops the analysis between tiles
+    backend (str, optional): Spectral backend, defaults to processing.eeg.spectral.backend
+    segmentation (dict, optional): Settings like processing.eeg.segmentation;
+        intervals are then laid out from the recording's annotations. Without
+        it they tile the recording from the first sample
+
+    Returns:
+    dict: plan, percentages (intervals, bands), quality, memory, computation
+        and, with `segmentation`, the interval layout (see build_intervals)
+    """
+    sfreq = raw.info['sfreq']
+    if fast_path is None:
+        fast_path = config.get('processing', 'eeg', 'fast_path', default={})
+
+    # Spectral plan (segment length, window, band bins) shared by all jobs
+    # with the same sampling rate and configuration
+    plan, decimation, dtype = select_spectral_plan(sfreq, interval_length, frequency_bands,
+                                                   fast_path, backend)
+
+    # Interval positions from the annotations, indexed once
+    layout = None
+    if segmentation is not None:
+        layout = build_intervals(AnnotationIndex.from_raw(raw, segmentation),
+                                 plan.samples_per_interval * decimation, segmentation, decimation)
+
+    # Quality statistics and channel-averaged band powers of every interval,
+    # computed over channel/time tiles that fit the memory budget
+    quality_settings = config.get('processing', 'eeg', 'quality')
+    memory_budget_mb = config.get('processing', 'eeg', 'memory_budget_mb', default=512)
+    band_powers, quality, memory = chunked_interval_analysis(
+        raw, plan, quality_settings, memory_budget_mb, decimation, dtype, cancel,
+        layout["starts"] if layout is not None else None)
+
+    # Convert band powers to percentages
+    percentages = band_powers / band_powers.sum(axis=1, keepdims=True)
+
+    return {
+        "plan": plan,
+        "percentages": percentages,
+        "quality": quality,
+        "memory": memory,
+        "intervals": layout,
+        "computation": {
+            "backend": plan.name,
+            "backend_options": plan.options,
+            "dtype": np.dtype(dtype).name,
+            "sfreq": plan.sfreq,
+            "decimation": decimation
+        }
+    }
+
+
+def interpolate_bad_intervals(percentages, mask):
+    """
+    Replace the band percentages of bad intervals by linear interpolation
+    between the nearest good intervals.
+
+    Parameters:
+    percentages (ndarray): Array of shape (intervals, bands)
+    mask (ndarray): Boolean array, True for good intervals
+
+    Returns:
+    ndarray: Array of the same shape with bad rows interpolated
+    """
+    if mask.all() or not mask.any():
+        return percentages
+    positions = np.arange(len(mask))
+    repaired = percentages.copy()
+    for band in range(percentages.shape[1]):
+        repaired[~mask, band] = np.interp(positions[~mask], positions[mask], percentages[mask, band])
+    return repaired
+
+
+def preprocess_eeg(filename, interval_length=None, output_dir='output/json', frequency_bands=None,
+                   cancel=None, handoff=None, persister=None):
     """
     Analyze EEG data to extract wave band strengths in specified time intervals.
     
+    Intervals are laid out from the recording's annotations as configured in
+    processing.eeg.segmentation; the band averages per condition are
+    aggregated from the same interval results.
+    
     Parameters:
-    filename (str): Path to the .set file
-    interval_length (int): Length of each interval in seconds
+    filename (str): Path to the .set, .edf or .bdf file
+    interval_length (int, optional): Length of each interval in seconds,
+        defaults to processing.eeg.interval_length
+    output_dir (str): Directory where wave_analysis.json is written
+    frequency_bands (dict, optional): Band name -> [low, high] Hz,
+        defaults to processing.eeg.frequency_bands
+    cancel (CancelToken, optional): Stops the analysis between tiles
+    handoff (StageHandoff, optional): Also share the band matrix in shared
+        memory as the 'analysis' output for the next stages
+    persister (AsyncPersister, optional): Queue the JSON write instead of
+        writing it before returning
     
     Returns:
     dict: Dictionary containing the analysis results
-    """
-    # Load the EEG data
-    raw = mne.io.read_raw_eeglab(filename, preload=True)
     
-    # Get sampling frequency and data
-    sfreq = raw.info['sfreq']
-    data = raw.get_data()
+    Raises:
+    JobCancelled: If `cancel` is triggered while the recording is analyzed
+    """
+    # Open the recording without loading it; samples are read tile by tile
+    raw = read_raw(filename)
     
-    # Calculate samples per interval
-    samples_per_interval = int(interval_length * sfreq)
+    # Intervals are laid out per processing.eeg.segmentation (fixed, or from the annotations)
+    analysis = analyze_recording(raw, interval_length, frequency_bands, cancel=cancel,
+                                 segmentation=segmentation_settings())
+    plan, percentages, quality = analysis["plan"], analysis["percentages"], analysis["quality"]
+    memory, layout = analysis["memory"], analysis["intervals"]
+    interval_length = plan.interval_length
+    num_intervals = percentages.shape[0]
+    numbers = layout["numbers"]
+    mask = quality["mask"]
+    quality_settings = config.get('processing', 'eeg', 'quality')
     
-    # Calculate number of complete intervals
-    total_samples = data.shape[1]
-    num_intervals = total_samples // samples_per_interval
+    # Per-condition band averages over the intervals that passed quality control
+    conditions = condition_aggregates(percentages, layout["conditions"], mask)
     
-    # Define frequency bands
-    freq_bands = {
-        'delta': (0.5, 4),
-        'theta': (4, 8),
-        'alpha': (8, 13),
-        'beta': (13, 30),
-        'gamma': (30, min(sfreq/2, 100))  # Upper limit capped at Nyquist frequency or 100 Hz
-    }
+    # Handle the intervals that failed quality control
+    mode = quality_settings['mode'] if quality_settings['enabled'] else None
+    if mode == 'interpolate':
+        percentages = interpolate_bad_intervals(percentages, mask)
+    kept = np.flatnonzero(mask) if mode == 'exclude' else np.arange(num_intervals)
     
     # Initialize results dictionary
     results = {
         "interval_length": str(interval_length),
-        "wave_strengths": {}
+        "bands": list(plan.band_names),
+        "frequency_bands": {name: list(edges) for name, edges in zip(plan.band_names, plan.band_edges)},
+        "wave_strengths": {
+            # Store results as strings, keyed by the original interval number
+            str(numbers[interval]): [f"{p:.3f}" for p in percentages[interval]]
+            for interval in kept
+        },
+        "quality_mask": mask.tolist(),
+        "quality": {
+            "mode": mode,
+            "bad_intervals": numbers[~mask].tolist(),
+            **{key: value for key, value in quality.items() if key != "mask"}
+        },
+        "segmentation": {
+            "mode": layout["mode"],
+            "events": layout["events"],
+            "boundaries": layout["boundaries"],
+            "skipped_intervals": layout["skipped"],
+            # Start (seconds) and condition of every stored interval
+            "interval_onsets": np.round(layout["starts"][kept] / raw.info['sfreq'], 3).tolist(),
+            "interval_conditions": layout["conditions"][kept].tolist()
+        },
+        "conditions": conditions,
+        "memory": memory,
+        "computation": analysis["computation"]
     }
     
-    # Process each interval
-    for interval in range(num_intervals):
-        # Extract data for current interval
-        start_idx = interval * samples_per_interval
-        end_idx = (interval + 1) * samples_per_interval
-        interval_data = data[:, start_idx:end_idx]
-        
-        # Calculate power spectrum using Welch's method
-        freqs, psd = signal.welch(interval_data, fs=sfreq, nperseg=min(samples_per_interval, 256))
-        psd = np.mean(psd, axis=0)  # Average across channels
-        
-        # Calculate power in each frequency band
-        band_powers = []
-        for band in freq_bands.values():
-            freq_mask = (freqs >= band[0]) & (freqs <= band[1])
-            band_power = np.sum(psd[freq_mask])
-            band_powers.append(band_power)
-        
-        # Convert to percentages
-        total_power = sum(band_powers)
-        percentages = [power/total_power for power in band_powers]
-        
-        # Store results as strings
-        results["wave_strengths"][str(interval + 1)] = [f"{p:.3f}" for p in percentages]
+    # Hand the band matrix to the next stages without a JSON round trip
+    # (parsed from the stored strings so it matches the file exactly)
+    if handoff is not None:
+        strengths = results["wave_strengths"]
+        handoff.share('analysis',
+                      np.array(list(strengths.values()), dtype=np.float64).reshape(
+                          len(strengths), len(plan.band_names)),
+                      bands=results["bands"], intervals=list(strengths),
+                      interval_length=results["interval_length"])
     
     # Save results to JSON file
-    output_dir = 'output/json'
-    os.makedirs(output_dir, exist_ok=True)
     output_filename = os.path.join(output_dir, 'wave_analysis.json')
+    write_json(output_filename, results, persister)
     
-    with open(output_filename, 'w') as f:
-        json.dump(results, f, indent=2)
-    
-    print(f"Analysis complete. Results saved to: {output_filename}")
+    logger.info("Analysis complete. Results saved to: %s", output_filename, extra={"memory": memory})
     return results
 
+
+def compare_band_percentages(reference, candidate, bands):
+    """
+    Per-band agreement of two (intervals, bands) percentage arrays.
+
+    Returns:
+    dict: band -> max_abs_error, mean_abs_error and correlation (None for a constant band)
+    """
+    error = np.abs(candidate - reference)
+
+    def correlation(band):
+        if reference[:, band].std() == 0 or candidate[:, band].std() == 0:
+            return None
+        return round(float(np.corrcoef(reference[:, band], candidate[:, band])[0, 1]), 6)
+
+    return {
+        name: {
+            "max_abs_error": round(float(error[:, i].max()), 6) if len(error) else 0.0,
+            "mean_abs_error": round(float(error[:, i].mean()), 6) if len(error) else 0.0,
+            "correlation": correlation(i)
+        }
+        for i, name in enumerate(bands)
+    }
+
+
+def fast_path_accuracy_report(filename, interval_length=None, frequency_bands=None,
+                              output_dir=None):
+    """
+    Compare the fast path (decimated, reduced precision) against the
+    reference float64 analysis at the native rate.
+
+    Both paths analyze the same recording; band percentages are compared
+    per band before any quality-control interpolation.
+
+    Parameters:
+    filename (str): Path to the .set, .edf or .bdf file
+    interval_length (int, optional): Interval length in seconds
+    frequency_bands (dict, optional): Band name -> [low, high] Hz
+    output_dir (str, optional): If given, the report is also written to
+        fast_path_accuracy.json in this directory
+
+    Returns:
+    dict: Per-band errors and correlations, timings and quality agreement
+    """
+    raw = read_raw(filename)
+    fast_settings = {**config.get('processing', 'eeg', 'fast_path', default={}), 'enabled': True}
+
+    runs = {}
+    for name, settings in (('reference', {'enabled': False}), ('fast', fast_settings)):
+        start = time.perf_counter()
+        runs[name] = analyze_recording(raw, interval_length, frequency_bands, settings)
+        runs[name]["seconds"] = time.perf_counter() - start
+
+    reference, fast = runs['reference']['percentages'], runs['fast']['percentages']
+    bands = runs['reference']['plan'].band_names
+
+    report = {
+        "recording": str(filename),
+        "intervals": int(reference.shape[0]),
+        "reference": {**runs['reference']['computation'],
+                      "seconds": round(runs['reference']['seconds'], 3)},
+        "fast": {**runs['fast']['computation'], "seconds": round(runs['fast']['seconds'], 3)},
+        "speedup": round(runs['reference']['seconds'] / max(runs['fast']['seconds'], 1e-9), 2),
+        "bands": compare_band_percentages(reference, fast, bands),
+        "quality_mask_agreement": float(np.mean(
+            runs['reference']['quality']['mask'] == runs['fast']['quality']['mask']))
+    }
+
+    if output_dir is not None:
+        os.makedirs(output_dir, exist_ok=True)
+        with open(os.path.join(output_dir, 'fast_path_accuracy.json'), 'w') as f:
+            json.dump(report, f, indent=2)
+    return report
+
+
+def spectral_backend_report(filename=None, backends=None, reference='welch', tolerance=None,
+                            repeats=3, interval_length=None, frequency_bands=None, output_dir=None):
+    """
+    Benchmark the spectral backends on one recording and compare each with a reference.
+
+    Every backend analyzes the same recording with the current configuration
+    (quality control, memory budget, fast path). Timing is the best of
+    `repeats` runs; accuracy compares band percentages with the reference
+    backend. The recommendation is the fastest backend whose worst per-band
+    mean absolute error is within `tolerance`.
+
+    Parameters:
+    filename (str, optional): Path to the .set, .edf or .bdf file; a
+        synthetic recording is generated when omitted
+    backends (list, optional): Backends to compare, defaults to all of them
+    reference (str): Backend the others are compared with
+    tolerance (float, optional): Accepted mean absolute error (fraction of total
+        power), defaults to processing.eeg.spectral.max_mean_abs_error
+    repeats (int): Timed runs per backend
+    interval_length (int, optional): Interval length in seconds
+    frequency_bands (dict, optional): Band name -> [low, high] Hz
+    output_dir (str, optional): If given, the report is also written to
+        spectral_backends.json in this directory
+
+    Returns:
+    dict: Per-backend timings, working memory and per-band accuracy, plus the recommendation
+    """
+    spectral = config.get('processing', 'eeg', 'spectral', default=None) or {}
+    if tolerance is None:
+        tolerance = spectral.get('max_mean_abs_error', 0.02)
+    backends = list(backends or SPECTRAL_BACKENDS)
+    if reference not in backends:
+        backends.insert(0, reference)
+
+    if filename is None:
+        filename = write_synthetic_eeglab(
+            os.path.join(tempfile.mkdtemp(prefix='spectral_'), 'synthetic.set'),
+            channels=16, duration=300)
+    raw = read_raw(filename)
+
+    runs = {}
+    for backend in backends:
+        timings = []
+        for _ in range(max(1, repeats)):
+            start = time.perf_counter()
+            analysis = analyze_recording(raw, interval_length, frequency_bands, backend=backend)
+            timings.append(time.perf_counter() - start)
+        runs[backend] = {**analysis, "seconds": min(timings)}
+
+    expected = runs[reference]['percentages']
+    bands = runs[reference]['plan'].band_names
+    report = {
+        "recording": str(filename),
+        "intervals": int(expected.shape[0]),
+        "reference": reference,
+        "tolerance": tolerance,
+        "backends": {}
+    }
+    for backend, run in runs.items():
+        accuracy = compare_band_percentages(expected, run['percentages'], bands)
+        worst = max((band["mean_abs_error"] for band in accuracy.values()), default=0.0)
+        report["backends"][backend] = {
+            **run['computation'],
+            "seconds": round(run['seconds'], 4),
+            "speedup": round(runs[reference]['seconds'] / max(run['seconds'], 1e-9), 2),
+            "working_kb_per_channel_interval": round(
+                run['plan'].working_bytes_per_interval(np.dtype(run['computation']['dtype']).itemsize)
+                / 1024, 1),
+            "worst_mean_abs_error": worst,
+            "within_tolerance": worst <= tolerance,
+            "bands": accuracy
+        }
+
+    accepted = [name for name, result in report["backends"].items() if result["within_tolerance"]]
+    report["recommended"] = min(accepted, key=lambda name: report["backends"][name]["seconds"])
+
+    if output_dir is not None:
+        os.makedirs(output_dir, exist_ok=True)
+        with open(os.path.join(output_dir, 'spectral_backends.json'), 'w') as f:
+            json.dump(report, f, indent=2)
+    return report
+
+
+if __name__ == '__main__':
+    # python -m core.eeg_processor recording.set              ->  fast path accuracy report
+    # python -m core.eeg_processor --backends [recording.set] ->  spectral backend benchmark
+    if sys.argv[1:2] == ['--backends']:
+        report = spectral_backend_report(sys.argv[2] if len(sys.argv) > 2 else None,
+                                         output_dir='output/json')
+    else:
+        report = fast_path_accuracy_report(sys.argv[1], output_dir='output/json')
+    print(json.dumps(report, indent=2))
@@ -0,0 +1,193 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import resource_tracker, shared_memory
+from pathlib import Path
+
+import numpy as np
+
+# Blocks created by this process (name -> SharedArray), so attaching in the
+# producing process returns the owner's array instead of mapping it again
+_owned_blocks = {}
+
+# Blocks attached from other processes, kept mapped until detach_all()
+_attached_blocks = {}
+
+
+class SharedArray:
+    """
+    NumPy array stored in a multiprocessing.shared_memory block.
+
+    The block is described by a small JSON-serializable header
+    (``{"shm", "shape", "dtype"}``) that can be handed to another stage or
+    worker process, which maps the same memory without copying it.
+    """
+
+    def __init__(self, shm, shape, dtype, owner):
+        self.shm = shm
+        self.array = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        self.owner = owner
+
+    @classmethod
+    def create(cls, array):
+        """Copy an array into a new shared memory block (the only copy made)"""
+        array = np.ascontiguousarray(array)
+        shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        shared = cls(shm, array.shape, array.dtype, owner=True)
+        shared.array[...] = array
+        _owned_blocks[shm.name] = shared
+        return shared
+
+    @classmethod
+    def attach(cls, header):
+        """Map the block described by a header (zero-copy)"""
+        name = header["shm"]
+        shared = _owned_blocks.get(name) or _attached_blocks.get(name)
+        if shared is None:
+            shm = shared_memory.SharedMemory(name=name)
+            # The producer owns the block; keep this process's resource
+            # tracker from unlinking it when the process exits
+            resource_tracker.unregister(shm._name, 'shared_memory')
+            shared = _attached_blocks[name] = cls(shm, tuple(header["shape"]),
+                                                  np.dtype(header["dtype"]), owner=False)
+        return shared
+
+    @property
+    def header(self) -> dict:
+        return {"shm": self.shm.name, "shape": list(self.array.shape),
+                "dtype": self.array.dtype.str}
+
+    def release(self):
+        """Unmap the block, and free it if this process created it"""
+        name = self.shm.name
+        _owned_blocks.pop(name, None)
+        _attached_blocks.pop(name, None)
+        self.array = None
+        try:
+            self.shm.close()
+        except BufferError:
+            # Views handed out to consumers keep the mapping alive until collected
+            pass
+        if self.owner:
+            self.shm.unlink()
+
+
+def is_handoff(source) -> bool:
+    """True if `source` is a shared-memory handoff header rather than a file path"""
+    return isinstance(source, dict) and "shm" in source
+
+
+def attach_array(header) -> np.ndarray:
+    """Zero-copy view of the array described by a handoff header"""
+    return SharedArray.attach(header).array
+
+
+def detach_all():
+    """Unmap every block attached from another process"""
+    for shared in list(_attached_blocks.values()):
+        shared.release()
+
+
+class StageHandoff:
+    """
+    The in-memory outputs of one pipeline run.
+
+    Producing stages share their arrays here; the resulting headers (block
+    description plus small metadata such as band names and interval keys)
+    are passed to the consuming stages in place of the JSON file paths.
+    """
+
+    def __init__(self):
+        self.headers = {}
+        self._blocks = []
+
+    def share(self, name, array, **metadata) -> dict:
+        """
+        Place a stage output in shared memory.
+
+        Args:
+            name (str): Output name, e.g. 'analysis' or 'music'
+            array (ndarray): Array to share
+            **metadata: JSON-serializable values stored in the header
+
+        Returns:
+            dict: The handoff header
+        """
+        shared = SharedArray.create(array)
+        self._blocks.append(shared)
+        header = {**metadata, **shared.header}
+        self.headers[name] = header
+        return header
+
+    def source(self, name, path):
+        """The handoff header of an output if it was shared, else its file path"""
+        return self.headers.get(name, path)
+
+    def release(self):
+        """Free every block created for this run"""
+        for shared in self._blocks:
+            shared.release()
+        self._blocks = []
+        self.headers = {}
+
+
+class AsyncPersister:
+    """
+    Writes stage outputs to disk on a background thread, off the critical path.
+
+    Work runs in submission order on a single thread, so anything queued
+    after a stage's writes (e.g. storing them in the stage cache) sees the
+    finished files.
+    """
+
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='persist')
+        self._pending = []
+
+    def submit(self, func, *args, **kwargs):
+        """Queue a call on the persist thread"""
+        self._pending.append(self._executor.submit(func, *args, **kwargs))
+
+    def write_json(self, path, data):
+        """Queue a JSON file write"""
+        self.submit(_write_json_file, path, data)
+
+    def flush(self):
+        """Wait for everything queued so far; re-raises the first failure"""
+        pending, self._pending = self._pending, []
+        errors = [future.exception() for future in pending]
+        errors = [error for error in errors if error is not None]
+        if errors:
+            raise errors[0]
+
+    def close(self):
+        """Finish queued work and stop the persist thread (call flush() first to see failures)"""
+        self._pending = []
+        self._executor.shutdown(wait=True)
+
+
+def _write_json_file(path, data):
+    os.makedirs(Path(path).parent, exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2)
+
+
+def stage_source(name, path, handoff=None, persister=None):
+    """
+    What the next stage reads an output from: its handoff header when it was
+    shared, otherwise its file path once every queued write has landed (a
+    path-based consumer must never see a file the persister has not written).
+    """
+    if handoff is not None and name in handoff.headers:
+        return handoff.headers[name]
+    if persister is not None:
+        persister.flush()
+    return path
+
+
+def write_json(path, data, persister=None):
+    """Write a stage's JSON output now, or queue it when a persister is given"""
+    if persister is not None:
+        persister.write_json(path, data)
+    else:
+        _write_json_file(path, data)
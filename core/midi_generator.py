@@ -1,77 +1,252 @@
-import json
+from pathlib import Path
+
+import numpy as np
 from mido import Message, MidiFile, MidiTrack, MetaMessage
 
-def json_to_midi(eeg_music_params_path: str, eeg_global_music_params_path: str):
+from core.cancellation import raise_if_cancelled
+from core.handoff import is_handoff
+from core.music_mapper import load_global_parameters, load_music_parameters, load_wave_strengths
+from core.scales import quantize_pitches
+from utils.config import config
+
+TICKS_PER_BEAT = 480
+
+# One row per MIDI note event. At equal ticks note_off (order 0) sorts
+# before note_on (order 1) so back-to-back notes never cut each other off.
+EVENT_DTYPE = np.dtype([
+    ('track', np.int16),
+    ('tick', np.int64),
+    ('order', np.int8),
+    ('channel', np.uint8),
+    ('note', np.uint8),
+    ('velocity', np.uint8)
+])
+NOTE_OFF, NOTE_ON = 0, 1
+
+# Voice per frequency band for multi-track output:
+# (General MIDI program, octave shift in semitones, note length as a multiple of the step)
+BAND_VOICES = {
+    'delta': (89, -24, 2.0),   # warm pad drone, held across the next interval
+    'theta': (48, -12, 1.5),   # string ensemble
+    'alpha': (0, 0, 1.0),      # piano melody
+    'beta': (11, 12, 0.5),     # vibraphone
+    'gamma': (14, 19, 0.25)    # tubular bells
+}
+DEFAULT_VOICE = (0, 0, 1.0)
+
+
+def note_events(onsets, durations, notes, velocities, track=1, channel=0):
+    """
+    Build the note_on/note_off events of a voice as one structured array.
+
+    Args:
+        onsets: Note start ticks
+        durations: Note lengths in ticks (at least one tick)
+        notes: MIDI note numbers
+        velocities: MIDI velocities
+        track: Index of the MIDI track the voice is written to
+        channel: MIDI channel of the voice
+
+    Returns:
+        ndarray: EVENT_DTYPE array with two events per note
+    """
+    onsets = np.asarray(onsets, dtype=np.int64)
+    durations = np.maximum(np.asarray(durations, dtype=np.int64), 1)
+    notes = np.clip(np.asarray(notes, dtype=np.int64), 0, 127)
+    count = len(onsets)
+
+    # A held note must end before the same pitch is struck again on this
+    # voice, otherwise its note_off would silence the new note
+    if count > 1:
+        order = np.lexsort((onsets, notes))
+        repeated = notes[order][1:] == notes[order][:-1]
+        next_strike = np.full(count, np.iinfo(np.int64).max)
+        next_strike[order[:-1][repeated]] = onsets[order][1:][repeated]
+        durations = np.maximum(np.minimum(durations, next_strike - onsets), 1)
+
+    events = np.empty(2 * count, dtype=EVENT_DTYPE)
+    events['track'] = track
+    events['channel'] = channel
+    events['tick'][:count] = onsets
+    events['tick'][count:] = onsets + durations
+    events['order'][:count] = NOTE_ON
+    events['order'][count:] = NOTE_OFF
+    events['note'] = np.tile(notes, 2)
+    events['velocity'] = np.tile(np.clip(velocities, 0, 127), 2)
+    return events
+
+
+def merge_events(*event_arrays):
+    """Concatenate event arrays and sort them by track, tick and note-off-first"""
+    events = np.concatenate(event_arrays)
+    return events[np.lexsort((events['order'], events['tick'], events['track']))]
+
+
+def encode_track(track: MidiTrack, events):
+    """
+    Append sorted events of one track to a MidiTrack, delta-encoding the
+    absolute ticks with a single np.diff.
+    """
+    deltas = np.diff(events['tick'], prepend=0).tolist()
+    kinds = events['order'].tolist()
+    channels = events['channel'].tolist()
+    notes = events['note'].tolist()
+    velocities = events['velocity'].tolist()
+    for delta, kind, channel, note, velocity in zip(deltas, kinds, channels, notes, velocities):
+        track.append(Message('note_on' if kind == NOTE_ON else 'note_off', channel=channel,
+                             note=note, velocity=velocity, time=delta))
+
+
+def tempo_events(track: MidiTrack, onsets, tempos):
+    """
+    Append a set_tempo meta event at every interval onset where the
+    per-interval tempo changes (the first interval's tempo is set at tick 0).
+    """
+    micros = (60000000 / np.asarray(tempos, dtype=np.float64)).astype(np.int64)
+    changes = np.flatnonzero(micros[1:] != micros[:-1]) + 1
+    deltas = np.diff(np.asarray(onsets)[changes], prepend=0).tolist()
+    for delta, tempo in zip(deltas, micros[changes].tolist()):
+        track.append(MetaMessage('set_tempo', tempo=tempo, time=delta))
+
+
+def _band_voice_events(interval_keys, note_params, onsets, analysis_path, dynamic_factor,
+                       key=None):
+    """
+    Events for one voice per frequency band, all on the shared interval timeline.
+    With a `key`, the octave/interval-shifted voices are snapped back into it.
+
+    Returns:
+        tuple: (list of (band, program, channel) per track, merged event array)
+    """
+    bands, intervals, strengths, _ = load_wave_strengths(analysis_path)
+    pitches, steps = note_params[:, 0], note_params[:, 1]
+
+    # Align the analysis rows with the music intervals
+    row = {interval: i for i, interval in enumerate(intervals)}
+    strengths = strengths[[row[interval] for interval in interval_keys]].reshape(-1, len(bands))
+
+    voices, event_arrays = [], []
+    channels = [c for c in range(16) if c != 9]  # channel 10 is percussion
+    for i, band in enumerate(bands):
+        program, shift, length = BAND_VOICES.get(band, DEFAULT_VOICE)
+        channel = channels[i % len(channels)]
+        velocity = np.rint((40 + 80 * strengths[:, i]) * dynamic_factor)
+        voice_pitches = pitches + shift
+        if key is not None:
+            voice_pitches = quantize_pitches(voice_pitches, key)
+        event_arrays.append(note_events(
+            onsets, steps * length * TICKS_PER_BEAT, voice_pitches, velocity,
+            track=i + 1, channel=channel))
+        voices.append((band, program, channel))
+    return voices, merge_events(*event_arrays)
+
+
+def json_to_midi(eeg_music_params_path: str, eeg_global_music_params_path: str,
+                 output_file: str = 'output/midi/midi_out.mid', multitrack: bool = None,
+                 eeg_analysis_path: str = None, cancel=None):
     """
     Generate a MIDI file from EEG-derived musical parameters and global parameters
-    
+
+    Notes are placed on an absolute tick timeline as structured NumPy event
+    arrays, merged and sorted once, then delta-encoded per track. When the
+    global parameters carry tempo/dynamics curves, the tempo changes at
+    interval onsets and velocities scale per interval.
+
     Args:
-        eeg_music_params_path: Path to the JSON file with note-level musical parameters
+        eeg_music_params_path: Path to the JSON file with note-level musical parameters,
+            or the 'music' shared-memory handoff header
         eeg_global_music_params_path: Path to the JSON file with global musical parameters
+            (or the 'music' handoff header)
+        output_file: Path of the MIDI file to write
+        multitrack: Write one track per frequency band instead of a single piano
+            track, defaults to music.multitrack
+        eeg_analysis_path: wave_analysis.json (or 'analysis' handoff header) used for
+            the band voices, defaults to the file next to the music parameters
+        cancel: Optional CancelToken, checked before every track is encoded
+
+    Raises:
+        JobCancelled: If `cancel` is triggered
     """
-    # Load note parameters
-    with open(eeg_music_params_path, 'r') as f:
-        data = json.load(f)
-        interval_length = int(data['interval_length'])
-        musical_parameters = data['musical_parameters']
-    
+    if multitrack is None:
+        multitrack = config.get('music', 'multitrack', default=False)
+
+    # Load note parameters: (pitch, step, duration) per interval
+    interval_keys, note_params, _ = load_music_parameters(eeg_music_params_path)
+
     # Load global parameters
-    with open(eeg_global_music_params_path, 'r') as f:
-        global_params = json.load(f)
-        wave_strengths = global_params['average_wave_strengths']
-        global_musical_params = global_params['musical_parameters']
-    
+    global_params = load_global_parameters(eeg_global_music_params_path)
+    wave_strengths = global_params['average_wave_strengths']
+    global_musical_params = global_params['musical_parameters']
+
     # Create MIDI file
-    midi = MidiFile(type=1)  # Type 1 allows multiple tracks
-    
+    midi = MidiFile(type=1, ticks_per_beat=TICKS_PER_BEAT)  # Type 1 allows multiple tracks
+
     # Create a tempo track (track 0)
     tempo_track = MidiTrack()
     midi.tracks.append(tempo_track)
-    
-    # Set tempo based on global parameters
-    tempo = global_musical_params['tempo']
+
+    # Per-interval curves (music.adaptive), unless they do not match the notes
+    tempo_curve = global_musical_params.get('tempo_curve')
+    dynamics_curve = global_musical_params.get('dynamics_curve')
+    if tempo_curve is not None and len(tempo_curve) != len(note_params):
+        tempo_curve = dynamics_curve = None
+
+    # Set tempo based on global parameters (the first interval's with a curve)
+    tempo = tempo_curve[0] if tempo_curve else global_musical_params['tempo']
     # MIDI tempo is in microseconds per quarter note
     tempo_in_microseconds = int(60000000 / tempo)
     tempo_track.append(MetaMessage('set_tempo', tempo=tempo_in_microseconds, time=0))
-    
+
     # Set time signature (4/4 by default)
-    tempo_track.append(MetaMessage('time_signature', numerator=4, denominator=4, 
+    tempo_track.append(MetaMessage('time_signature', numerator=4, denominator=4,
                                    clocks_per_click=24, notated_32nd_notes_per_beat=8, time=0))
-    
+
     # Add a text marker for the key instead of using key_signature
     key = global_musical_params['key']
     tempo_track.append(MetaMessage('text', text=f"Key: {key}", time=0))
-    
-    # Create a track for the notes
-    note_track = MidiTrack()
-    midi.tracks.append(note_track)
-    
-    # Optional: Add a track name
-    note_track.append(MetaMessage('track_name', name='EEG-Generated Notes', time=0))
-    
-    # Add instrument selection (default to piano)
-    note_track.append(Message('program_change', program=0, time=0))  # 0 = Acoustic Grand Piano
-    
+
     # Calculate dynamic range adjustment based on wave strengths if needed
     # For example, more beta/gamma activity could increase dynamics
-    dynamic_factor = 1.0 + (wave_strengths['beta'] + wave_strengths['gamma']) / 2
-    
-    # Add notes to track
-    for key, params in musical_parameters.items():
-        note = int(params[0])
-        duration = float(params[1])
-        velocity = int(float(params[2]) * 127 * dynamic_factor)  # Apply dynamic factor
-        
-        # Clamp velocity to valid MIDI range (0-127)
-        velocity = max(0, min(127, velocity))
-        
-        # Add note events
-        note_track.append(Message('note_on', note=note, velocity=velocity, time=0))
-        note_track.append(Message('note_off', note=note, velocity=velocity, 
-                                  time=int(duration * 480)))  # 480 ticks per beat
-    
+    # (bands missing from a custom band layout contribute nothing)
+    dynamic_factor = 1.0 + (wave_strengths.get('beta', 0) + wave_strengths.get('gamma', 0)) / 2
+    if dynamics_curve is not None:
+        dynamic_factor = np.asarray(dynamics_curve, dtype=np.float64)
+
+    if not multitrack:
+        # Single piano voice: each note lasts one step and the next starts when it ends
+        lengths = (note_params[:, 1] * TICKS_PER_BEAT).astype(np.int64)
+        onsets = np.concatenate(([0], np.cumsum(lengths)[:-1])) if len(lengths) else lengths
+        velocity = (note_params[:, 2] * 127 * dynamic_factor).astype(np.int64)  # Apply dynamic factor(s)
+        events = merge_events(note_events(onsets, lengths, note_params[:, 0].astype(np.int64),
+                                          velocity))
+        voices = [('EEG-Generated Notes', 0, 0)]  # 0 = Acoustic Grand Piano
+    else:
+        # One voice per band; every interval starts one step after the previous one,
+        # and voices longer than a step overlap the next interval
+        steps = (note_params[:, 1] * TICKS_PER_BEAT).astype(np.int64)
+        onsets = np.concatenate(([0], np.cumsum(steps)[:-1])) if len(steps) else steps
+        if eeg_analysis_path is None:
+            if is_handoff(eeg_music_params_path):
+                raise ValueError("Multi-track output from a handoff needs eeg_analysis_path")
+            eeg_analysis_path = Path(eeg_music_params_path).with_name('wave_analysis.json')
+        quantize_key = key if config.get('music', 'quantize_to_key', default=False) else None
+        voices, events = _band_voice_events(interval_keys, note_params, onsets,
+                                            eeg_analysis_path, dynamic_factor, quantize_key)
+
+    if tempo_curve:
+        tempo_events(tempo_track, onsets, tempo_curve)
+
+    # Write each voice to its own track
+    bounds = np.searchsorted(events['track'], np.arange(1, len(voices) + 2))
+    for index, (name, program, channel) in enumerate(voices):
+        raise_if_cancelled(cancel)
+        note_track = MidiTrack()
+        midi.tracks.append(note_track)
+        note_track.append(MetaMessage('track_name', name=name, time=0))
+        note_track.append(Message('program_change', channel=channel, program=program, time=0))
+        encode_track(note_track, events[bounds[index]:bounds[index + 1]])
+
     # Save the MIDI file
-    output_file = 'output/midi/midi_out.mid'
     midi.save(output_file)
-    
-    return output_file
\ No newline at end of file
+
+    return output_file
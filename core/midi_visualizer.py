@@ -1,5 +1,13 @@
+import os
+from pathlib import Path
+
 import py_midicsv as pm
 
+from utils.log import get_logger
+
+logger = get_logger(__name__)
+
+
 def visualize_midi(midi_file_path: str, output_dir: str = None) -> tuple:
     """
     Convert MIDI file to CSV for visualization and analysis.
@@ -16,15 +24,11 @@ def visualize_midi(midi_file_path: str, output_dir: str = None) -> tuple:
         csv_content = pm.midi_to_csv(midi_file_path)
         
         # Determine output path
-        # midi_path = Path(midi_file_path)
-        # if output_dir:
-        #     output=_path = Path(output_dir) / f"{midi_path.stem}_visualization.csv"
-        # else:
-        #     output_path = midi_path.with_name(f"{midi_path.stem}_visualization.csv")
-        
-        output_path = 'output/midi/midi_visualization.csv'
+        midi_path = Path(midi_file_path)
+        output_dir = Path(output_dir) if output_dir else midi_path.parent
+        output_path = output_dir / 'midi_visualization.csv'
         # Ensure output directory exists
-        # os.makedirs(output_path.parent, exist_ok=True)
+        os.makedirs(output_path.parent, exist_ok=True)
         
         # Save CSV file
         with open(output_path, "w") as f:
@@ -33,5 +37,5 @@ def visualize_midi(midi_file_path: str, output_dir: str = None) -> tuple:
         return str(output_path), csv_content
         
     except Exception as e:
-        print(f"Error visualizing MIDI file: {str(e)}")
+        logger.error("Error visualizing MIDI file: %s", e)
         return None, None
\ No newline at end of file
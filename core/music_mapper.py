@@ -2,50 +2,178 @@ import json
 import numpy as np
 import os
 from pathlib import Path
+from scipy import signal
 
-def calculate_global_parameters(input_file):
+from core.cancellation import raise_if_cancelled
+from core.handoff import attach_array, is_handoff, write_json
+from core.scales import get_scale_table, quantize_pitches
+from utils.config import config
+from utils.log import get_logger
+
+logger = get_logger(__name__)
+
+# Band layout of analyses written before bands became configurable
+DEFAULT_BANDS = ["delta", "theta", "alpha", "beta", "gamma"]
+
+
+def wave_strength_matrix(eeg_data):
     """
-    Calculate global music parameters based on average EEG wave strengths.
-    
+    Convert the per-interval wave strength strings of an analysis into a matrix.
+
     Parameters:
-    input_file (str): Path to input JSON file containing EEG data
-    
+    eeg_data (dict): Contents of a wave_analysis.json file
+
     Returns:
-    dict: The global music parameters
+    tuple: (band names, interval keys, float array of shape (intervals, bands))
     """
-    # Check if input file exists
-    if not os.path.exists(input_file):
-        raise FileNotFoundError(f"Input file not found: {input_file}")
-    
-    # Read the input JSON file
-    with open(input_file, 'r') as f:
+    bands = eeg_data.get("bands", DEFAULT_BANDS)
+    intervals = list(eeg_data["wave_strengths"].keys())
+    matrix = np.array([eeg_data["wave_strengths"][i] for i in intervals],
+                      dtype=np.float64).reshape(len(intervals), len(bands))
+    return bands, intervals, matrix
+
+
+def load_wave_strengths(source):
+    """
+    Band matrix of an analysis, from wave_analysis.json or a shared-memory handoff.
+
+    Parameters:
+    source (str, Path or dict): Path to wave_analysis.json, or the 'analysis'
+        handoff header (the matrix is then read in place, without copying)
+
+    Returns:
+    tuple: (band names, interval keys, matrix of shape (intervals, bands), interval length)
+    """
+    if is_handoff(source):
+        return source["bands"], source["intervals"], attach_array(source), source["interval_length"]
+    if not os.path.exists(source):
+        raise FileNotFoundError(f"Input file not found: {source}")
+    with open(source, 'r') as f:
         eeg_data = json.load(f)
+    bands, intervals, matrix = wave_strength_matrix(eeg_data)
+    return bands, intervals, matrix, eeg_data["interval_length"]
+
+
+def load_music_parameters(source):
+    """
+    Per-interval (pitch, step, duration) values, from music_parameters.json or
+    the 'music' handoff header.
+
+    Returns:
+    tuple: (interval keys, array of shape (intervals, 3), interval length)
+    """
+    if is_handoff(source):
+        return source["intervals"], attach_array(source), source["interval_length"]
+    with open(source, 'r') as f:
+        data = json.load(f)
+    params = data["musical_parameters"]
+    values = np.array(list(params.values()), dtype=np.float64).reshape(-1, 3)
+    return list(params.keys()), values, data["interval_length"]
+
+
+def load_global_parameters(source):
+    """Global parameters from global_parameters.json or the 'music' handoff header"""
+    if is_handoff(source):
+        return source["global_parameters"]
+    with open(source, 'r') as f:
+        return json.load(f)
+
+
+def _band_columns(bands, matrix):
+    """Map band name -> column; bands missing from the analysis read as zeros"""
+    zeros = np.zeros(matrix.shape[0])
+    columns = {band: matrix[:, i] for i, band in enumerate(bands)}
+    return lambda band: columns.get(band, zeros)
+
+
+def smooth_curve(values, method='ema', alpha=0.3, window=5):
+    """
+    Smooth a per-interval curve.
+
+    Parameters:
+    values (array-like): One value per interval
+    method (str): 'ema' (exponential moving average seeded with the first
+        value), 'median' (centred rolling median, edges repeated) or 'none'
+    alpha (float): EMA weight of the newest interval
+    window (int): Median window in intervals (odd)
+
+    Returns:
+    ndarray: Smoothed float curve of the same length
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if not len(values) or method in (None, 'none'):
+        return values
+    if method == 'ema':
+        # y[i] = alpha * x[i] + (1 - alpha) * y[i - 1] as one IIR filter pass
+        smoothed, _ = signal.lfilter([alpha], [1, alpha - 1], values, zi=[(1 - alpha) * values[0]])
+        return smoothed
+    if method == 'median':
+        half = max(int(window), 1) // 2
+        padded = np.pad(values, half, mode='edge')
+        return np.median(np.lib.stride_tricks.sliding_window_view(padded, 2 * half + 1), axis=1)
+    raise ValueError(f"Unknown smoothing {method!r}. Supported: ema, median, none")
+
+
+def adaptive_settings() -> dict:
+    """The music.adaptive section with defaults filled in"""
+    settings = config.get('music', 'adaptive', default=None) or {}
+    return {
+        "enabled": bool(settings.get('enabled', True)),
+        "smoothing": settings.get('smoothing', 'ema'),
+        "ema_alpha": float(settings.get('ema_alpha', 0.3)),
+        "median_window": int(settings.get('median_window', 5))
+    }
+
+
+def adaptive_curves(bands, matrix, settings=None):
+    """
+    Per-interval tempo and dynamics, following arousal through the session.
+
+    The global formulas are applied to smoothed band activity instead of
+    session averages: tempo falls from 80 towards 60 bpm as beta + gamma
+    outweigh alpha + theta + delta, and the velocity factor is
+    1 + (beta + gamma) / 2.
+
+    Parameters:
+    bands (list): Band names of the matrix columns
+    matrix (ndarray): (intervals, bands) wave strengths
+    settings (dict, optional): See adaptive_settings
+
+    Returns:
+    tuple: (tempo in bpm as int array, velocity factor as float array)
+    """
+    settings = settings or adaptive_settings()
+    band = _band_columns(bands, matrix)
+    smooth = lambda values: smooth_curve(values, settings["smoothing"], settings["ema_alpha"],
+                                         settings["median_window"])
+    aroused = smooth(band("beta") + band("gamma"))
+    calm = smooth(band("alpha") + band("theta") + band("delta"))
+
+    tempo = np.clip(np.rint(80 - 20 * aroused / (calm + 0.01)), 60, 80).astype(np.int64)
+    dynamics = 1.0 + aroused / 2
+    return tempo, dynamics
+
+
+def calculate_global_parameters(input_file, output_dir='output/json', persister=None):
+    """
+    Calculate global music parameters based on average EEG wave strengths,
+    plus per-interval tempo and dynamics curves with music.adaptive.enabled.
     
-    # Calculate average wave strengths
-    wave_strengths = eeg_data["wave_strengths"]
-    num_intervals = len(wave_strengths)
-    
-    # Initialize averages
-    avg_delta = 0
-    avg_theta = 0
-    avg_alpha = 0
-    avg_beta = 0
-    avg_gamma = 0
-    
-    # Sum up all values
-    for interval, strengths in wave_strengths.items():
-        avg_delta += float(strengths[0])
-        avg_theta += float(strengths[1])
-        avg_alpha += float(strengths[2])
-        avg_beta += float(strengths[3])
-        avg_gamma += float(strengths[4])
+    Parameters:
+    input_file (str or dict): Path to input JSON file containing EEG data,
+        or the 'analysis' handoff header
+    output_dir (str): Directory where global_parameters.json is written
+    persister (AsyncPersister, optional): Queue the JSON write
     
-    # Calculate averages
-    avg_delta /= num_intervals
-    avg_theta /= num_intervals
-    avg_alpha /= num_intervals
-    avg_beta /= num_intervals
-    avg_gamma /= num_intervals
+    Returns:
+    dict: The global music parameters
+    """
+    # Calculate average wave strengths for every band in the analysis
+    bands, _, matrix, _ = load_wave_strengths(input_file)
+    averages = dict(zip(bands, (matrix.sum(axis=0) / max(len(matrix), 1)).tolist()))
+    avg = lambda band: averages.get(band, 0.0)
+    avg_delta, avg_theta, avg_alpha = avg("delta"), avg("theta"), avg("alpha")
+    avg_beta, avg_gamma = avg("beta"), avg("gamma")
     
     # Calculate tempo
     tempo = 80 - 20 * (avg_beta + avg_gamma) / (avg_alpha + avg_theta + avg_delta + 0.01)
@@ -64,103 +192,103 @@ def calculate_global_parameters(input_file):
     else:  # beta or gamma is highest
         key = "A minor"
     
+    # A fixed key from the config (any built-in or user-defined scale) wins
+    configured_key = config.get('music', 'key', default='auto')
+    if configured_key and configured_key != 'auto':
+        get_scale_table(configured_key)  # fail early on unknown scales
+        key = configured_key
+    
     # Create global parameters dictionary
     global_params = {
-        "average_wave_strengths": {
-            "delta": round(avg_delta, 3),
-            "theta": round(avg_theta, 3),
-            "alpha": round(avg_alpha, 3),
-            "beta": round(avg_beta, 3),
-            "gamma": round(avg_gamma, 3)
-        },
+        "average_wave_strengths": {band: round(value, 3) for band, value in averages.items()},
         "musical_parameters": {
             "tempo": tempo,
             "key": key
         }
     }
-    
-    # Create output directory if it doesn't exist
-    output_dir = Path('output/json')
-    output_dir.mkdir(parents=True, exist_ok=True)
+
+    # Tempo and dynamics per interval, written as set_tempo events and note velocities
+    settings = adaptive_settings()
+    if settings["enabled"]:
+        tempo_curve, dynamics_curve = adaptive_curves(bands, matrix, settings)
+        global_params["musical_parameters"]["tempo_curve"] = tempo_curve.tolist()
+        global_params["musical_parameters"]["dynamics_curve"] = np.round(dynamics_curve, 3).tolist()
     
     # Save to output JSON file
-    output_file = 'output/json/global_parameters.json'
-    with open(output_file, 'w') as f:
-        json.dump(global_params, f, indent=2)
+    output_file = Path(output_dir) / 'global_parameters.json'
+    write_json(output_file, global_params, persister)
     
-    print(f"Global parameters calculated and saved to: {output_file}")
+    logger.info("Global parameters calculated and saved to: %s", output_file)
     return global_params
 
-def eeg_to_music_parameters(input_file):
+def eeg_to_music_parameters(input_file, output_dir='output/json', cancel=None, handoff=None,
+                            persister=None):
     """
     Convert EEG wave strengths to musical parameters.
 
+    All intervals are mapped at once; bands that the analysis does not
+    contain contribute nothing to the formulas. With music.quantize_to_key
+    the pitches are snapped to the session key through its precomputed
+    lookup table.
+
     Parameters:
-    input_file (str): Path to input JSON file containing EEG data
+    input_file (str or dict): Path to input JSON file containing EEG data,
+        or the 'analysis' handoff header
+    output_dir (str): Directory where music_parameters.json and
+        global_parameters.json are written
+    cancel (CancelToken, optional): Checked before each output is written
+    handoff (StageHandoff, optional): Also share the (pitch, step, duration)
+        matrix and the global parameters as the 'music' output
+    persister (AsyncPersister, optional): Queue the JSON writes
     
     Returns:
     dict: The generated music parameters
     
     Raises:
     FileNotFoundError: If the input file doesn't exist
+    JobCancelled: If `cancel` is triggered
     """
-    # Check if input file exists
-    if not os.path.exists(input_file):
-        raise FileNotFoundError(f"Input file not found: {input_file}")
-    
-    # Read the input JSON file
-    with open(input_file, 'r') as f:
-        eeg_data = json.load(f)
+    bands, intervals, matrix, interval_length = load_wave_strengths(input_file)
+    band = _band_columns(bands, matrix)
+    delta, beta, gamma = band("delta"), band("beta"), band("gamma")
+
+    # Calculate musical parameters for every interval at once
+
+    # Pitch (MIDI number)
+    pitch = np.rint(np.clip(60 + (delta * -10) + (gamma * 10), 0, 127)).astype(int)
+
+    # Snap the pitches to the session key (global parameters are needed first)
+    raise_if_cancelled(cancel)
+    global_params = calculate_global_parameters(input_file, output_dir, persister)
+    if config.get('music', 'quantize_to_key', default=False):
+        pitch = quantize_pitches(pitch, global_params["musical_parameters"]["key"])
+
+    # Step (intervals)
+    step = 2 + (beta * 5)
 
-    # Initialize output dictionary
+    # Duration
+    duration = np.maximum(0.1, 0.5 + (delta * 0.1) - (beta * 0.3))
+
+    # Store the results (values rounded as they are stored)
+    rows = [(p, round(st, 1), round(d, 2))
+            for p, st, d in zip(pitch.tolist(), step.tolist(), duration.tolist())]
     music_data = {
-        "interval_length": eeg_data["interval_length"],
-        "musical_parameters": {}
+        "interval_length": interval_length,
+        "musical_parameters": {
+            interval: [str(p), str(st), str(d)] for interval, (p, st, d) in zip(intervals, rows)
+        }
     }
+    raise_if_cancelled(cancel)
 
-    # Process each interval
-    for interval, wave_strengths in eeg_data["wave_strengths"].items():
-        # Convert string percentages to float
-        delta = float(wave_strengths[0])
-        theta = float(wave_strengths[1])
-        alpha = float(wave_strengths[2])
-        beta = float(wave_strengths[3])
-        gamma = float(wave_strengths[4])
-
-        # Calculate musical parameters
-
-        # Pitch (MIDI number)
-        pitch = 60 + (delta * -10) + (gamma * 10) 
-        pitch = round(np.clip(pitch, 0, 127))
-
-        # Step (intervals)
-        step = 2 + (beta * 5)
-        step = round(step, 1)
-
-        # Duration
-        duration = 0.5 + (delta * 0.1) - (beta * 0.3)
-        duration = round(max(0.1, duration), 2) 
-
-        # Store the results
-        music_data["musical_parameters"][interval] = [
-            str(pitch),
-            str(step),
-            str(duration)
-        ]
-
-    # Create output directory if it doesn't exist
-    output_dir = Path('output/json')
-    output_dir.mkdir(parents=True, exist_ok=True)
-    
-    # Create output filename based on input filename
-    output_file = 'output/json/music_parameters.json'
+    # Hand the values to the MIDI writer and plots without a JSON round trip
+    if handoff is not None:
+        handoff.share('music', np.array(rows, dtype=np.float64).reshape(-1, 3),
+                      intervals=list(intervals), interval_length=interval_length,
+                      global_parameters=global_params)
 
     # Save to output JSON file
-    with open(output_file, 'w') as f:
-        json.dump(music_data, f, indent=2)
-        
-    # Calculate and save global parameters
-    calculate_global_parameters(input_file)
+    output_file = Path(output_dir) / 'music_parameters.json'
+    write_json(output_file, music_data, persister)
 
-    print(f"Conversion complete. Music parameters saved to: {output_file}")
+    logger.info("Conversion complete. Music parameters saved to: %s", output_file)
     return music_data
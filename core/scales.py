@@ -0,0 +1,122 @@
+from functools import lru_cache
+
+import numpy as np
+
+from utils.config import config
+
+# Built-in scales as semitone offsets from the tonic; music.scales adds more
+SCALES = {
+    'major': (0, 2, 4, 5, 7, 9, 11),
+    'minor': (0, 2, 3, 5, 7, 8, 10),
+    'harmonic_minor': (0, 2, 3, 5, 7, 8, 11),
+    'dorian': (0, 2, 3, 5, 7, 9, 10),
+    'mixolydian': (0, 2, 4, 5, 7, 9, 10),
+    'major_pentatonic': (0, 2, 4, 7, 9),
+    'minor_pentatonic': (0, 3, 5, 7, 10),
+    'chromatic': tuple(range(12))
+}
+
+NOTE_CLASSES = {'C': 0, 'D': 2, 'E': 4, 'F': 5, 'G': 7, 'A': 9, 'B': 11}
+ACCIDENTALS = {'#': 1, 'b': -1}
+
+
+def available_scales() -> dict:
+    """Built-in scales merged with the user-defined ones from music.scales"""
+    scales = dict(SCALES)
+    for name, offsets in (config.get('music', 'scales', default=None) or {}).items():
+        scales[name] = tuple(int(offset) for offset in offsets)
+    return scales
+
+
+def parse_key(key: str) -> tuple:
+    """
+    Split a key name such as "A minor", "F# major" or "Bb dorian".
+
+    Args:
+        key (str): Tonic followed by a scale name
+
+    Returns:
+        tuple: (tonic pitch class 0-11, scale name)
+    """
+    tonic, _, scale = key.strip().partition(' ')
+    if not tonic or tonic[0].upper() not in NOTE_CLASSES:
+        raise ValueError(f"Invalid key: {key!r}")
+    pitch_class = NOTE_CLASSES[tonic[0].upper()] + sum(ACCIDENTALS.get(c, 0) for c in tonic[1:])
+    scale = scale.strip().lower().replace(' ', '_') or 'major'
+    return pitch_class % 12, scale
+
+
+def build_scale_table(tonic: int, offsets) -> np.ndarray:
+    """
+    Map every MIDI note to the nearest note of a scale.
+
+    Notes already in the scale map to themselves; ties between the scale
+    notes below and above resolve downwards.
+
+    Args:
+        tonic (int): Tonic pitch class (0 = C)
+        offsets (iterable): Scale degrees as semitones above the tonic
+
+    Returns:
+        ndarray: 128-entry uint8 lookup table
+    """
+    degrees = np.unique(np.mod(np.asarray(offsets, dtype=np.int64), 12))
+    if not len(degrees):
+        raise ValueError("A scale needs at least one degree")
+    # Scale notes one octave beyond the MIDI range on both sides
+    candidates = np.sort((np.arange(-1, 12)[:, None] * 12 + tonic + degrees).ravel())
+    candidates = candidates[(candidates >= 0) & (candidates <= 127)]
+
+    notes = np.arange(128)
+    above = np.searchsorted(candidates, notes)
+    upper = candidates[np.minimum(above, len(candidates) - 1)]
+    lower = candidates[np.maximum(above - 1, 0)]
+    # Past the last scale note only the one below exists, and vice versa
+    upper = np.where(upper < notes, lower, upper)
+    lower = np.where(lower > notes, upper, lower)
+    return np.where(notes - lower <= upper - notes, lower, upper).astype(np.uint8)
+
+
+@lru_cache(maxsize=None)
+def _cached_tables(scales):
+    return {(tonic, name): build_scale_table(tonic, offsets)
+            for name, offsets in scales for tonic in range(12)}
+
+
+def scale_tables() -> dict:
+    """
+    Lookup tables for every (tonic, scale) pair, built once per scale set.
+
+    Returns:
+        dict: (tonic pitch class, scale name) -> 128-entry uint8 table
+    """
+    return _cached_tables(tuple(sorted(available_scales().items())))
+
+
+def get_scale_table(key: str) -> np.ndarray:
+    """
+    Lookup table for a key name such as "A minor".
+
+    Raises:
+        ValueError: If the key's scale is neither built in nor configured
+    """
+    tonic, scale = parse_key(key)
+    table = scale_tables().get((tonic, scale))
+    if table is None:
+        raise ValueError(f"Unknown scale {scale!r}. Available: {', '.join(available_scales())}")
+    return table
+
+
+def quantize_pitches(pitches, key: str) -> np.ndarray:
+    """
+    Snap MIDI pitches to a key with one vectorized table lookup.
+
+    Args:
+        pitches (array-like): MIDI note numbers (clipped to 0-127)
+        key (str): Key name such as "A minor"
+
+    Returns:
+        ndarray: Quantized note numbers
+    """
+    pitches = np.clip(np.asarray(pitches, dtype=np.int64), 0, 127)
+    return np.take(get_scale_table(key), pitches).astype(np.int64)
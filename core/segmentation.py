@@ -0,0 +1,203 @@
+"""
+Interval layout of a recording from its annotations.
+
+EEGLAB events and EDF+ annotations arrive in `raw.annotations`: task or
+stimulus markers, 'boundary' discontinuities where data was cut out, and
+BAD_* spans. They are converted once into sample indices (an
+AnnotationIndex); every interval decision is then a vectorized lookup.
+
+Two layouts are supported:
+- fixed (default): intervals tile the recording from its first sample;
+- events: the interval grid restarts at every event and boundary, so
+  intervals start on the markers. The last interval before an event runs
+  on across it (overlapping the first interval after the event) rather
+  than being dropped, so closely spaced events still get an interval each
+  and no data between markers is lost; only boundaries and the end of the
+  recording cut a segment short.
+
+In both, intervals crossing a boundary or overlapping a BAD_* span can be
+skipped, and each interval is labelled with the condition (description) of
+the last event at or before its start.
+"""
+import numpy as np
+
+from utils.config import config
+
+# Label of intervals before the first event
+NO_CONDITION = "none"
+
+
+def segmentation_settings() -> dict:
+    """The processing.eeg.segmentation section with defaults filled in"""
+    settings = config.get('processing', 'eeg', 'segmentation', default=None) or {}
+    return {
+        "mode": settings.get('mode', 'fixed'),
+        "skip_boundaries": bool(settings.get('skip_boundaries', True)),
+        "events": list(settings.get('events') or []),
+        "boundary_descriptions": list(settings.get('boundary_descriptions') or
+                                      ['boundary', 'BAD_ACQ_SKIP', 'EDGE boundary'])
+    }
+
+
+class AnnotationIndex:
+    """
+    Annotations of a recording as sorted sample arrays.
+
+    Attributes:
+        event_samples (ndarray): Onsets of condition events
+        event_conditions (ndarray): Their descriptions
+        boundaries (ndarray): Discontinuity positions
+        bad_starts, bad_stops (ndarray): BAD_* spans sorted by start
+    """
+
+    def __init__(self, onsets, durations, descriptions, n_times, settings=None):
+        settings = settings or segmentation_settings()
+        onsets = np.asarray(onsets, dtype=np.int64)
+        durations = np.asarray(durations, dtype=np.int64)
+        descriptions = np.array([str(d) for d in descriptions], dtype=object)
+
+        is_boundary = np.isin(descriptions, settings["boundary_descriptions"])
+        is_bad = np.array([str(d).upper().startswith('BAD') for d in descriptions], dtype=bool) & \
+            ~is_boundary
+        is_event = ~is_boundary & ~is_bad
+        if settings["events"]:
+            is_event &= np.isin(descriptions, settings["events"])
+        inside = (onsets >= 0) & (onsets < n_times)
+
+        order = np.argsort(onsets[is_event & inside], kind='stable')
+        self.event_samples = onsets[is_event & inside][order]
+        self.event_conditions = descriptions[is_event & inside][order]
+        self.boundaries = np.unique(onsets[is_boundary & inside])
+
+        order = np.argsort(onsets[is_bad], kind='stable')
+        self.bad_starts = onsets[is_bad][order]
+        self.bad_stops = (onsets + np.maximum(durations, 1))[is_bad][order]
+        self.n_times = n_times
+
+    @classmethod
+    def from_raw(cls, raw, settings=None):
+        """Index of an MNE recording's annotations (sample positions in its data)"""
+        annotations = raw.annotations
+        sfreq = raw.info['sfreq']
+        if len(annotations):
+            onsets = raw.time_as_index(annotations.onset, use_rounding=True,
+                                       origin=annotations.orig_time)
+        else:
+            onsets = np.zeros(0, dtype=np.int64)
+        durations = np.rint(np.asarray(annotations.duration) * sfreq)
+        return cls(onsets, durations, list(annotations.description), raw.n_times, settings)
+
+
+def _grid(begins, ends, samples_per_interval, run_on=None):
+    """
+    Starts of the intervals of every [begin, end) segment: the complete ones,
+    plus (where `run_on` is set) one more covering the remainder and running
+    past `end`
+    """
+    lengths = np.maximum(ends - begins, 0)
+    counts = lengths // samples_per_interval
+    if run_on is not None:
+        counts = np.where(run_on, -(-lengths // samples_per_interval), counts)
+    first = np.repeat(np.cumsum(counts) - counts, counts)
+    return np.repeat(begins, counts) + (np.arange(counts.sum()) - first) * samples_per_interval
+
+
+def build_intervals(index, samples_per_interval, settings=None, align=1) -> dict:
+    """
+    Interval layout of a recording.
+
+    Parameters:
+    index (AnnotationIndex): The recording's annotations
+    samples_per_interval (int): Native samples per interval
+    settings (dict, optional): See segmentation_settings
+    align (int): Interval starts are multiples of this (the decimation
+        factor, so decimated tiles stay sample-aligned); samples_per_interval
+        must be a multiple of it
+
+    Returns:
+    dict: starts (native sample of each kept interval), numbers (1-based
+        interval number in the layout), conditions, skipped (count of
+        intervals dropped for boundaries / BAD spans), mode and the number of
+        events and boundaries
+    """
+    settings = settings or segmentation_settings()
+    spi = samples_per_interval
+    if settings["mode"] == 'events':
+        edges = np.unique(np.concatenate(([0], index.event_samples, index.boundaries)))
+        # Segments start at the first aligned sample at or after their marker
+        align = max(int(align), 1)
+        begins = -(-edges // align) * align
+        ends = np.append(edges[1:], index.n_times)
+        # A segment ending at an event runs on across it; boundaries and the
+        # end of the recording are hard ends
+        run_on = ~np.isin(ends, index.boundaries) & (ends < index.n_times)
+        starts = _grid(begins, ends, spi, run_on)
+        starts = starts[starts + spi <= index.n_times]
+    elif settings["mode"] == 'fixed':
+        starts = np.arange(index.n_times // spi, dtype=np.int64) * spi
+    else:
+        raise ValueError(f"Unknown segmentation mode {settings['mode']!r}. Supported: fixed, events")
+    numbers = np.arange(1, len(starts) + 1)
+
+    keep = np.ones(len(starts), dtype=bool)
+    if settings["skip_boundaries"]:
+        stops = starts + spi
+        # A boundary strictly inside an interval joins two unrelated pieces of data
+        following = np.searchsorted(index.boundaries, starts, side='right')
+        crosses = following < len(index.boundaries)
+        crosses[crosses] = index.boundaries[following[crosses]] < stops[crosses]
+        # Overlap with any BAD span: the latest-ending span among those starting before the stop
+        candidates = np.searchsorted(index.bad_starts, stops, side='left')
+        latest_stop = np.maximum.accumulate(index.bad_stops) if len(index.bad_stops) else index.bad_stops
+        bad = candidates > 0
+        bad[bad] = latest_stop[candidates[bad] - 1] > starts[bad]
+        keep = ~(crosses | bad)
+
+    # Condition of the last event at or before each interval start
+    last_event = np.searchsorted(index.event_samples, starts, side='right') - 1
+    conditions = np.where(last_event >= 0,
+                          index.event_conditions[np.maximum(last_event, 0)]
+                          if len(index.event_conditions) else NO_CONDITION,
+                          NO_CONDITION).astype(object)
+
+    return {
+        "mode": settings["mode"],
+        "starts": starts[keep],
+        "numbers": numbers[keep],
+        "conditions": conditions[keep],
+        "skipped": int((~keep).sum()),
+        "events": int(len(index.event_samples)),
+        "boundaries": int(len(index.boundaries))
+    }
+
+
+def condition_aggregates(percentages, conditions, mask=None) -> dict:
+    """
+    Per-condition mean and standard deviation of the band percentages.
+
+    Parameters:
+    percentages (ndarray): (intervals, bands) band percentages
+    conditions (array-like): Condition label of every interval
+    mask (ndarray, optional): Intervals to include (e.g. those passing quality control)
+
+    Returns:
+    dict: condition -> intervals, mean and std per band
+    """
+    conditions = np.asarray(conditions, dtype=object)
+    if mask is not None:
+        percentages, conditions = percentages[mask], conditions[mask]
+    if not len(conditions):
+        return {}
+    labels, groups = np.unique(conditions.astype(str), return_inverse=True)
+    counts = np.bincount(groups, minlength=len(labels))
+    sums = np.zeros((len(labels), percentages.shape[1]))
+    squares = np.zeros_like(sums)
+    np.add.at(sums, groups, percentages)
+    np.add.at(squares, groups, percentages ** 2)
+    means = sums / counts[:, None]
+    stds = np.sqrt(np.maximum(squares / counts[:, None] - means ** 2, 0))
+    return {
+        str(label): {"intervals": int(count), "mean": means[i].round(3).tolist(),
+                     "std": stds[i].round(3).tolist()}
+        for i, (label, count) in enumerate(zip(labels, counts))
+    }
@@ -0,0 +1,421 @@
+from functools import lru_cache
+
+import numpy as np
+from scipy import fft, signal
+
+from utils.config import config
+
+
+class SpectralPlan:
+    """
+    Everything needed to turn fixed-length EEG intervals into band powers.
+
+    Built once per (sampling rate, interval length, frequency bands, backend
+    options) and reused for every interval and every job. This class is the
+    default batched Welch backend; the other spectral backends subclass it
+    and override `configure`, `interval_band_powers` and
+    `working_bytes_per_interval`.
+
+    Attributes:
+        name (str): Backend name as used in processing.eeg.spectral.backend
+        sfreq (float): Sampling frequency in Hz
+        interval_length (float): Interval length in seconds
+        samples_per_interval (int): Samples in one interval
+        nperseg (int): Welch segment length
+        noverlap (int): Samples shared by consecutive segments
+        nfft (int): FFT size
+        window (ndarray): Window applied to each segment
+        freqs (ndarray): Frequency of each PSD bin (None for backends without bins)
+        band_names (tuple): Band names in output order
+        band_edges (tuple): (low, high) Hz per band, high capped at Nyquist
+        band_bins (tuple): (start, stop) PSD bin slice per band
+    """
+
+    name = 'welch'
+
+    def __init__(self, sfreq, interval_length, frequency_bands, **options):
+        self.sfreq = float(sfreq)
+        self.interval_length = interval_length
+        self.samples_per_interval = int(interval_length * self.sfreq)
+        if self.samples_per_interval < 2:
+            raise ValueError(f"Interval of {interval_length}s is too short at {sfreq} Hz")
+
+        # Band edges, high capped at Nyquist
+        nyquist = self.sfreq / 2
+        names, edges = [], []
+        for name, (low, high) in frequency_bands:
+            if not 0 <= low < high:
+                raise ValueError(f"Invalid frequency band {name}: [{low}, {high}]")
+            names.append(name)
+            edges.append((low, min(high, nyquist)))
+        self.band_names = tuple(names)
+        self.band_edges = tuple(edges)
+
+        self.freqs = None
+        self.configure(**options)
+
+        # Band bin ranges: bins with low <= f <= high
+        self.band_bins = ()
+        if self.freqs is not None:
+            self.band_bins = tuple(
+                (int(np.searchsorted(self.freqs, low, side='left')),
+                 int(np.searchsorted(self.freqs, high, side='right')))
+                for low, high in self.band_edges)
+
+    def configure(self, nperseg=256, overlap=0.5):
+        """
+        Backend parameters (the defaults are the ones the original per-interval loop used).
+
+        Parameters:
+        nperseg (int): Welch segment length (capped at the interval length)
+        overlap (float): Fraction of a segment shared with the next one
+        """
+        self.nperseg = min(self.samples_per_interval, int(nperseg))
+        self.noverlap = int(self.nperseg * overlap)
+        self.nfft = self.nperseg
+        self.window = signal.get_window('hann', self.nperseg)
+        self.freqs = np.fft.rfftfreq(self.nfft, 1 / self.sfreq)
+
+    @property
+    def options(self) -> dict:
+        """Backend parameters reported with the analysis results"""
+        return {"nperseg": self.nperseg, "noverlap": self.noverlap}
+
+    def working_bytes_per_interval(self, itemsize=8):
+        """
+        Approximate peak bytes needed to analyze one interval of one channel:
+        the samples, Welch's overlapping (windowed, detrended) segment copies
+        and their complex spectra.
+
+        Parameters:
+        itemsize (int): Bytes per real sample (8 for float64, 4 for float32)
+
+        Returns:
+        int: Bytes per channel-interval
+        """
+        spi = self.samples_per_interval
+        step = self.nperseg - self.noverlap
+        segments = max(1, (spi - self.noverlap) // step)
+        samples = spi * itemsize
+        segment_copies = 3 * segments * self.nperseg * itemsize
+        spectra = segments * (self.nfft // 2 + 1) * 2 * itemsize
+        return samples + segment_copies + spectra
+
+    def psd(self, intervals):
+        """
+        Welch power spectral density of every interval at once.
+
+        Parameters:
+        intervals (ndarray): Array of shape (..., samples_per_interval)
+
+        Returns:
+        ndarray: PSD of shape (..., len(freqs))
+        """
+        _, psd = signal.welch(intervals, fs=self.sfreq, window=self.window,
+                              nperseg=self.nperseg, noverlap=self.noverlap,
+                              nfft=self.nfft, axis=-1)
+        return psd
+
+    def band_powers(self, psd):
+        """
+        Sum PSD bins into band powers.
+
+        Parameters:
+        psd (ndarray): Array of shape (..., len(freqs))
+
+        Returns:
+        ndarray: Array of shape (..., len(band_names))
+        """
+        return np.stack([psd[..., start:stop].sum(axis=-1) for start, stop in self.band_bins],
+                        axis=-1)
+
+    def interval_band_powers(self, intervals):
+        """
+        Band powers of every interval at once.
+
+        Parameters:
+        intervals (ndarray): Array of shape (..., samples_per_interval)
+
+        Returns:
+        ndarray: Array of shape (..., len(band_names))
+        """
+        return self.band_powers(self.psd(intervals))
+
+
+class MultitaperPlan(SpectralPlan):
+    """
+    Multitaper PSD: the interval is tapered with K orthogonal DPSS (Slepian)
+    windows and the eigenvalue-weighted periodograms are averaged. Uses the
+    whole interval at once, so short intervals keep their full frequency
+    resolution with lower variance than Welch's few segments.
+    """
+
+    name = 'multitaper'
+
+    def configure(self, half_bandwidth=1.0, max_tapers=None):
+        """
+        Parameters:
+        half_bandwidth (float): Spectral smoothing half-bandwidth W in Hz
+        max_tapers (int, optional): Cap on the number of tapers (default 2NW - 1)
+        """
+        self.half_bandwidth = float(half_bandwidth)
+        n = self.samples_per_interval
+        nw = max(self.half_bandwidth * self.interval_length, 0.5)
+        tapers = max(1, int(2 * nw) - 1)
+        if max_tapers:
+            tapers = min(tapers, int(max_tapers))
+        self.tapers, ratios = signal.windows.dpss(n, nw, Kmax=tapers, return_ratios=True)
+        self.tapers = np.atleast_2d(self.tapers)
+        self.weights = np.atleast_1d(ratios) / np.sum(ratios)
+        self.freqs = np.fft.rfftfreq(n, 1 / self.sfreq)
+
+    @property
+    def options(self) -> dict:
+        return {"half_bandwidth": self.half_bandwidth, "tapers": len(self.tapers)}
+
+    def working_bytes_per_interval(self, itemsize=8):
+        """Samples, K tapered copies and their complex spectra"""
+        spi, tapers = self.samples_per_interval, len(self.tapers)
+        return spi * itemsize + tapers * spi * itemsize + tapers * (spi // 2 + 1) * 2 * itemsize * 2
+
+    def psd(self, intervals):
+        """Eigenvalue-weighted multitaper PSD of shape (..., len(freqs))"""
+        tapered = intervals[..., None, :] * self.tapers.astype(intervals.dtype, copy=False)
+        spectra = fft.rfft(tapered, axis=-1)
+        power = spectra.real ** 2 + spectra.imag ** 2
+        weights = self.weights.astype(power.dtype, copy=False)
+        return np.tensordot(power, weights, axes=([-2], [0])) * (2 / self.sfreq)
+
+
+class FilterBankPlan(SpectralPlan):
+    """
+    Band-pass filter bank with a Hilbert envelope: each band is isolated with
+    a zero-phase Butterworth filter and its power is the mean squared
+    analytic-signal amplitude. No spectrum is computed.
+    """
+
+    name = 'filterbank'
+
+    def configure(self, order=4):
+        """
+        Parameters:
+        order (int): Butterworth order of each band filter
+        """
+        self.order = int(order)
+        nyquist = self.sfreq / 2
+        self.filters = []
+        for low, high in self.band_edges:
+            if low <= 0 and high >= nyquist:
+                sos = None
+            elif low <= 0:
+                sos = signal.butter(self.order, high, btype='lowpass', fs=self.sfreq, output='sos')
+            elif high >= nyquist:
+                sos = signal.butter(self.order, low, btype='highpass', fs=self.sfreq, output='sos')
+            else:
+                sos = signal.butter(self.order, [low, high], btype='bandpass', fs=self.sfreq,
+                                    output='sos')
+            self.filters.append(sos)
+
+    @property
+    def options(self) -> dict:
+        return {"order": self.order}
+
+    def working_bytes_per_interval(self, itemsize=8):
+        """Samples plus one band at a time: padded filter passes and the complex analytic signal"""
+        return self.samples_per_interval * 8 * itemsize
+
+    def interval_band_powers(self, intervals):
+        powers = []
+        for sos in self.filters:
+            filtered = intervals if sos is None else signal.sosfiltfilt(
+                sos.astype(intervals.dtype, copy=False), intervals, axis=-1)
+            envelope = np.abs(signal.hilbert(filtered, axis=-1))
+            powers.append(np.mean(envelope ** 2, axis=-1))
+        return np.stack(powers, axis=-1)
+
+
+class RecursivePlan(SpectralPlan):
+    """
+    Recursive (exponentially weighted) per-bin power: non-overlapping
+    windowed frames update P = (1 - alpha) * P + alpha * |FFT(frame)|^2.
+
+    Half the FFTs of 50%-overlap Welch for the batch analysis, and the same
+    recursion runs incrementally on live data (RecursiveBandPowerTracker),
+    costing one FFT per new frame instead of a Welch pass per window.
+    """
+
+    name = 'recursive'
+
+    def configure(self, frame_length=256, alpha=0.3):
+        """
+        Parameters:
+        frame_length (int): Samples per frame (capped at the interval length)
+        alpha (float): Weight of the newest frame, 0 < alpha <= 1
+        """
+        if not 0 < alpha <= 1:
+            raise ValueError(f"alpha must be in (0, 1], got {alpha}")
+        self.frame_length = min(self.samples_per_interval, int(frame_length))
+        self.alpha = float(alpha)
+        self.frames = self.samples_per_interval // self.frame_length
+        self.window = signal.get_window('hann', self.frame_length)
+        self.scale = 2 / (self.sfreq * np.sum(self.window ** 2))
+        self.freqs = np.fft.rfftfreq(self.frame_length, 1 / self.sfreq)
+        # The recursion unrolled over one interval, started from the first frame
+        self.frame_weights = self.alpha * (1 - self.alpha) ** np.arange(self.frames - 1, -1, -1)
+        self.frame_weights[0] = (1 - self.alpha) ** (self.frames - 1)
+
+    @property
+    def options(self) -> dict:
+        return {"frame_length": self.frame_length, "alpha": self.alpha}
+
+    def working_bytes_per_interval(self, itemsize=8):
+        """Samples, one windowed copy and the frame spectra"""
+        spi = self.samples_per_interval
+        return 2 * spi * itemsize + self.frames * (self.frame_length // 2 + 1) * 2 * itemsize * 2
+
+    def frame_power(self, frames):
+        """Scaled periodogram of frames of shape (..., frame_length)"""
+        spectra = fft.rfft(frames * self.window.astype(frames.dtype, copy=False), axis=-1)
+        return (spectra.real ** 2 + spectra.imag ** 2) * self.scale
+
+    def psd(self, intervals):
+        """Recursive power estimate at the end of every interval, shape (..., len(freqs))"""
+        frames = intervals[..., :self.frames * self.frame_length].reshape(
+            *intervals.shape[:-1], self.frames, self.frame_length)
+        power = self.frame_power(frames)
+        weights = self.frame_weights.astype(power.dtype, copy=False)
+        return np.tensordot(power, weights, axes=([-2], [0]))
+
+
+class RecursiveBandPowerTracker:
+    """
+    Streaming band powers for live data using a RecursivePlan.
+
+    Feed sample chunks of any length with `update`; every complete frame
+    updates the per-channel, per-bin power estimate in O(one FFT).
+    """
+
+    def __init__(self, plan, num_channels):
+        self.plan = plan
+        self.power = None
+        self._buffer = np.empty((num_channels, 0))
+
+    def update(self, samples):
+        """
+        Add samples of shape (channels, n).
+
+        Returns:
+        ndarray: Current band powers of shape (channels, bands), None before the first frame
+        """
+        self._buffer = np.concatenate([self._buffer, samples], axis=-1)
+        length = self.plan.frame_length
+        complete = self._buffer.shape[-1] // length
+        if complete:
+            frames = self._buffer[:, :complete * length].reshape(len(self._buffer), complete, length)
+            power = self.plan.frame_power(frames)
+            for index in range(complete):
+                if self.power is None:
+                    self.power = power[:, index]
+                else:
+                    self.power = (1 - self.plan.alpha) * self.power + self.plan.alpha * power[:, index]
+            self._buffer = self._buffer[:, complete * length:]
+        return self.band_powers()
+
+    def band_powers(self):
+        """Band powers of the current estimate, shape (channels, bands)"""
+        return None if self.power is None else self.plan.band_powers(self.power)
+
+
+# Backend name -> plan class, selected with processing.eeg.spectral.backend
+SPECTRAL_BACKENDS = {
+    plan.name: plan for plan in (SpectralPlan, MultitaperPlan, FilterBankPlan, RecursivePlan)
+}
+
+
+def decimation_factor(sfreq, samples_per_interval, max_frequency, margin=1.25):
+    """
+    Largest integer decimation that still resolves the configured bands.
+
+    The decimated Nyquist frequency stays at least `margin` times the highest
+    band edge, leaving room for the anti-aliasing filter's transition band,
+    and the factor divides the interval length so intervals stay aligned.
+
+    Parameters:
+    sfreq (float): Native sampling frequency in Hz
+    samples_per_interval (int): Native samples in one interval
+    max_frequency (float): Highest band edge in Hz
+    margin (float): Required ratio of the new Nyquist to `max_frequency`
+
+    Returns:
+    int: Decimation factor, 1 when the recording cannot be decimated
+    """
+    limit = int(sfreq // (2 * max_frequency * margin))
+    for factor in range(limit, 1, -1):
+        if samples_per_interval % factor == 0:
+            return factor
+    return 1
+
+
+def decimation_halo(factor):
+    """
+    Samples of context needed on each side of a block so that its polyphase
+    decimation matches decimating the whole recording (half the length of
+    resample_poly's default anti-aliasing filter, rounded to the factor).
+    """
+    return 10 * factor if factor > 1 else 0
+
+
+def decimate(data, factor, dtype=np.float64):
+    """
+    Anti-alias filter and downsample along the last axis with a polyphase FIR.
+
+    Parameters:
+    data (ndarray): Array of shape (..., samples)
+    factor (int): Decimation factor
+    dtype (dtype): Output dtype; the filter runs in this precision
+
+    Returns:
+    ndarray: Array of shape (..., ceil(samples / factor))
+    """
+    data = data.astype(dtype, copy=False)
+    if factor == 1:
+        return data
+    return signal.resample_poly(data, 1, factor, axis=-1)
+
+
+@lru_cache(maxsize=32)
+def _cached_plan(backend, sfreq, interval_length, frequency_bands, options):
+    return SPECTRAL_BACKENDS[backend](sfreq, interval_length, frequency_bands, **dict(options))
+
+
+def get_spectral_plan(sfreq, interval_length=None, frequency_bands=None, backend=None):
+    """
+    Return the (cached) spectral plan for a sampling rate.
+
+    Parameters:
+    sfreq (float): Sampling frequency in Hz
+    interval_length (float, optional): Interval length in seconds,
+        defaults to processing.eeg.interval_length
+    frequency_bands (dict, optional): Band name -> [low, high] Hz,
+        defaults to processing.eeg.frequency_bands
+    backend (str, optional): 'welch', 'multitaper', 'filterbank' or 'recursive',
+        defaults to processing.eeg.spectral.backend; its options are read from
+        the section of the same name under processing.eeg.spectral
+
+    Returns:
+    SpectralPlan: Plan shared by every job with the same parameters
+    """
+    if interval_length is None:
+        interval_length = config.get('processing', 'eeg', 'interval_length')
+    if frequency_bands is None:
+        frequency_bands = config.get('processing', 'eeg', 'frequency_bands')
+    spectral = config.get('processing', 'eeg', 'spectral', default=None) or {}
+    if backend is None:
+        backend = spectral.get('backend', 'welch')
+    if backend not in SPECTRAL_BACKENDS:
+        raise ValueError(f"Unknown spectral backend {backend!r}. "
+                         f"Available: {', '.join(SPECTRAL_BACKENDS)}")
+    options = tuple(sorted((spectral.get(backend) or {}).items()))
+    bands = tuple((name, (float(low), float(high)))
+                  for name, (low, high) in frequency_bands.items())
+    return _cached_plan(backend, float(sfreq), interval_length, bands, options)
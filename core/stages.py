@@ -0,0 +1,173 @@
+import hashlib
+import json
+import os
+import shutil
+from pathlib import Path
+
+from utils.config import config
+
+# Bump a stage's version whenever its code changes the artifacts it produces
+STAGE_VERSIONS = {
+    'analysis': 7,
+    'music': 3,
+    'midi': 4,
+    'midi_visualization': 1,
+    'visualizations': 2,
+    'audio': 1
+}
+
+# stage -> (upstream stages, config sections that parameterize it)
+STAGE_GRAPH = {
+    'analysis': ((), [('processing', 'eeg')]),
+    'music': (('analysis',), [('music',)]),
+    'midi': (('music',), [('music',)]),
+    'midi_visualization': (('midi',), []),
+    'visualizations': (('analysis', 'music'), [('visualization',)]),
+    'audio': (('midi',), [('audio',)])
+}
+
+# (path, size, mtime) -> content hash, so unchanged recordings are hashed once
+_file_hash_cache = {}
+
+
+def fingerprint(*parts) -> str:
+    """Stable SHA-256 over JSON-serializable parts"""
+    payload = json.dumps(parts, sort_keys=True, default=str, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def file_fingerprint(path) -> str:
+    """
+    Content hash of an EEG recording, including the EEGLAB .fdt sidecar
+    when there is one. Memoized on (path, size, mtime).
+    """
+    path = Path(path)
+    files = [path]
+    sidecar = path.with_suffix('.fdt')
+    if path.suffix.lower() == '.set' and sidecar.exists():
+        files.append(sidecar)
+
+    sha = hashlib.sha256()
+    for file in files:
+        stat = file.stat()
+        cache_key = (str(file.resolve()), stat.st_size, stat.st_mtime_ns)
+        digest = _file_hash_cache.get(cache_key)
+        if digest is None:
+            file_sha = hashlib.sha256()
+            with open(file, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    file_sha.update(block)
+            digest = _file_hash_cache[cache_key] = file_sha.hexdigest()
+        sha.update(digest.encode('ascii'))
+    return sha.hexdigest()
+
+
+def stage_fingerprints(source_fingerprint: str, extra_params: dict = None) -> dict:
+    """
+    Fingerprint every stage of the pipeline.
+
+    A stage's fingerprint covers its code version, the config sections it
+    reads, any extra call parameters and the fingerprints of its upstream
+    stages, so changing e.g. only the plot settings leaves the analysis,
+    music and MIDI fingerprints untouched.
+
+    Args:
+        source_fingerprint: Fingerprint of the input recording
+        extra_params: Optional stage -> dict of call parameters not in the config
+
+    Returns:
+        dict: stage -> fingerprint
+    """
+    extra_params = extra_params or {}
+    fingerprints = {}
+    for stage, (upstream, sections) in STAGE_GRAPH.items():
+        fingerprints[stage] = fingerprint(
+            stage,
+            STAGE_VERSIONS[stage],
+            [fingerprints[name] for name in upstream] if upstream else source_fingerprint,
+            [config.get(*section, default=None) for section in sections],
+            extra_params.get(stage)
+        )
+    return fingerprints
+
+
+class StageCache:
+    """
+    Fingerprint-keyed cache of stage outputs.
+
+    Outputs of a stage are copied to ``<cache_dir>/<stage>/<fingerprint>/``
+    after it runs; a later run with the same fingerprint copies them back
+    instead of recomputing.
+    """
+
+    def __init__(self, cache_dir='output/cache'):
+        self.cache_dir = Path(cache_dir)
+
+    def _entry(self, stage, stage_fingerprint):
+        return self.cache_dir / stage / stage_fingerprint
+
+    def restore(self, stage, stage_fingerprint, outputs: dict) -> bool:
+        """Copy cached outputs into place; False if the stage has to run"""
+        entry = self._entry(stage, stage_fingerprint)
+        cached = {name: entry / name for name in outputs}
+        if not all(path.is_file() for path in cached.values()):
+            return False
+        for name, target in outputs.items():
+            Path(target).parent.mkdir(parents=True, exist_ok=True)
+            shutil.copyfile(cached[name], target)
+        return True
+
+    def store(self, stage, stage_fingerprint, outputs: dict):
+        """Save a stage's freshly produced outputs under its fingerprint"""
+        entry = self._entry(stage, stage_fingerprint)
+        entry.mkdir(parents=True, exist_ok=True)
+        for name, source in outputs.items():
+            if Path(source).is_file():
+                # Write then rename so a concurrent restore never sees partial files
+                tmp_path = entry / f".{name}.{os.getpid()}.tmp"
+                shutil.copyfile(source, tmp_path)
+                os.replace(tmp_path, entry / name)
+
+    def run(self, stage, stage_fingerprint, outputs: dict, func, *args, **kwargs) -> bool:
+        """
+        Run a stage unless its outputs are cached under the same fingerprint.
+
+        Args:
+            stage: Stage name
+            stage_fingerprint: Fingerprint from stage_fingerprints
+            outputs: Output file name -> path the stage writes it to
+            func: Callable producing the outputs
+
+        When `persister` is passed through to the stage, its outputs are
+        written in the background and storing them in the cache is queued
+        behind those writes.
+
+        Returns:
+            bool: True if the stage was recomputed, False if restored
+        """
+        if self.restore(stage, stage_fingerprint, outputs):
+            return False
+        func(*args, **kwargs)
+        persister = kwargs.get('persister')
+        if persister is not None:
+            persister.submit(self.store, stage, stage_fingerprint, outputs)
+        else:
+            self.store(stage, stage_fingerprint, outputs)
+        return True
+
+
+def write_manifest(path, fingerprints: dict, recomputed: dict, source_fingerprint: str):
+    """Record which inputs produced a job's artifacts and which stages actually ran"""
+    manifest = {
+        "source": source_fingerprint,
+        "stages": {
+            stage: {
+                "fingerprint": fingerprints[stage],
+                "recomputed": recomputed.get(stage)
+            }
+            for stage in STAGE_GRAPH
+        }
+    }
+    with open(path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
@@ -0,0 +1,141 @@
+"""
+Startup warm-up of a processing worker.
+
+A fresh process pays for lazy imports inside mne/scipy, matplotlib's backend
+and font loading, spectral plans, shared-memory and persister threads and
+the audio encoder on its first job. warm_up runs a tiny synthetic recording
+through every stage (bypassing the stage cache, so each stage really runs)
+before the process reports ready; prestart_threads spawns the stage worker
+threads up front.
+"""
+import io
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import matplotlib
+
+from utils.config import config
+from utils.log import get_logger
+
+logger = get_logger(__name__)
+
+# Synthetic warm-up recording: small, but long enough for a few intervals
+WARMUP_CHANNELS = 2
+WARMUP_INTERVALS = 4
+WARMUP_SFREQ = 256.0
+
+
+def prestart_threads(executor, count, timeout=30.0):
+    """
+    Start `count` threads of a ThreadPoolExecutor now instead of on demand:
+    every task blocks on a barrier until all of them run, so each needs its
+    own thread.
+
+    Returns:
+        list: Futures of the barrier tasks
+    """
+    barrier = threading.Barrier(count)
+
+    def wait():
+        try:
+            barrier.wait(timeout)
+        except threading.BrokenBarrierError:
+            pass
+
+    return [executor.submit(wait) for _ in range(count)]
+
+
+def _warm_matplotlib():
+    """Select Agg and render text once, loading the font cache and glyphs"""
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    figure, axes = plt.subplots(figsize=(2, 1))
+    axes.plot([0, 1], [0, 1])
+    axes.set_title("warm-up")
+    figure.savefig(io.BytesIO(), format='png')
+    plt.close(figure)
+
+
+def warm_up(work_dir=None) -> dict:
+    """
+    Run a synthetic job through every pipeline stage in a scratch directory.
+
+    The stages are called as a job calls them (shared-memory handoff and
+    async persister per the pipeline config, audio only when enabled);
+    nothing is written to the stage cache or the output tree.
+
+    Args:
+        work_dir (str or Path, optional): Scratch parent directory
+
+    Returns:
+        dict: seconds per stage and in total
+    """
+    from core.audio_renderer import convert_midi_to_mp3
+    from core.eeg_processor import preprocess_eeg
+    from core.handoff import AsyncPersister, StageHandoff, stage_source
+    from core.midi_generator import json_to_midi
+    from core.midi_visualizer import visualize_midi
+    from core.music_mapper import eeg_to_music_parameters
+    from data.synthetic import write_synthetic_eeglab
+    from visualization.plots import create_all_visualizations
+    from visualization.tiles import load_band_matrix, render_tile
+
+    timings = {}
+    start = time.perf_counter()
+
+    def timed(stage, func, *args, **kwargs):
+        stage_start = time.perf_counter()
+        result = func(*args, **kwargs)
+        timings[stage] = round(time.perf_counter() - stage_start, 3)
+        return result
+
+    handoff = StageHandoff() if config.get('pipeline', 'shared_memory_handoff', default=False) else None
+    persister = AsyncPersister() if config.get('pipeline', 'async_persist', default=False) else None
+    try:
+        with tempfile.TemporaryDirectory(prefix='warmup-', dir=work_dir) as scratch:
+            scratch = Path(scratch)
+            json_dir, midi_dir, plots_dir = scratch / 'json', scratch / 'midi', scratch / 'plots'
+            for path in (json_dir, midi_dir, plots_dir):
+                path.mkdir()
+
+            timed('matplotlib', _warm_matplotlib)
+            duration = WARMUP_INTERVALS * float(config.get('processing', 'eeg', 'interval_length'))
+            recording = write_synthetic_eeglab(scratch / 'warmup.set', WARMUP_CHANNELS, duration,
+                                               WARMUP_SFREQ, events=[('warmup', 0.0)])
+
+            analysis_path = json_dir / 'wave_analysis.json'
+            timed('analysis', preprocess_eeg, str(recording), None, str(json_dir),
+                  handoff=handoff, persister=persister)
+            analysis_source = stage_source('analysis', analysis_path, handoff, persister)
+
+            music_path = json_dir / 'music_parameters.json'
+            timed('music', eeg_to_music_parameters, analysis_source, str(json_dir),
+                  handoff=handoff, persister=persister)
+            music_source = stage_source('music', music_path, handoff, persister)
+            global_source = music_source if handoff and 'music' in handoff.headers \
+                else json_dir / 'global_parameters.json'
+
+            midi_path = midi_dir / 'midi_out.mid'
+            timed('midi', json_to_midi, music_source, global_source, str(midi_path),
+                  eeg_analysis_path=analysis_source)
+            timed('midi_visualization', visualize_midi, str(midi_path), str(midi_dir))
+            timed('visualizations', create_all_visualizations, analysis_source, music_source,
+                  str(plots_dir))
+            if persister is not None:
+                persister.flush()
+
+            _, strengths, _ = load_band_matrix(analysis_path)
+            timed('tiles', render_tile, strengths, 0, 0)
+            if config.get('audio', 'enabled', default=False):
+                timed('audio', convert_midi_to_mp3, str(midi_path), str(midi_dir / 'output.mp3'))
+    finally:
+        if handoff is not None:
+            handoff.release()
+        if persister is not None:
+            persister.close()
+
+    report = {"seconds": round(time.perf_counter() - start, 3), "stages": timings}
+    logger.info("Worker warmed up", extra=report)
+    return report
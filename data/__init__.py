@@ -8,16 +8,27 @@ Components:
 - Data loading utilities
 - Sample data access
 - Data validation tools
+- Recording header reader (job size estimates)
+- Per-patient session store
+- Synthetic EEG recordings (load tests, warm-up)
 """
 
 from pathlib import Path
 from utils.config import config
+from data.session_store import SessionStore
+from data.headers import read_eeg_header, estimate_job_size
+from data.synthetic import synthetic_eeg, write_synthetic_eeglab
 import os
 
 __all__ = [
     'get_sample_data_path',
     'list_sample_files',
-    'validate_eeg_file'
+    'validate_eeg_file',
+    'read_eeg_header',
+    'estimate_job_size',
+    'synthetic_eeg',
+    'write_synthetic_eeglab',
+    'SessionStore'
 ]
 
 def get_sample_data_path() -> Path:
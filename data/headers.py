@@ -0,0 +1,88 @@
+from pathlib import Path
+
+import scipy.io
+
+# EDF/BDF fixed header layout (bytes) - see the EDF specification
+EDF_HEADER_BYTES = 256
+EDF_SIGNAL_FIELD_BYTES = 216  # per-signal header bytes before samples-per-record
+EDF_FIELD_WIDTH = 8
+
+
+def _read_edf_header(filepath: Path) -> dict:
+    """Channel count, samples and duration from an EDF/BDF header"""
+    with open(filepath, 'rb') as f:
+        header = f.read(EDF_HEADER_BYTES)
+        records = int(header[236:244].decode('ascii').strip())
+        record_seconds = float(header[244:252].decode('ascii').strip())
+        signals = int(header[252:256].decode('ascii').strip())
+
+        # Samples per data record of every signal follow the other per-signal fields
+        f.seek(EDF_HEADER_BYTES + signals * EDF_SIGNAL_FIELD_BYTES)
+        per_record = f.read(signals * EDF_FIELD_WIDTH)
+        samples = [int(per_record[i:i + EDF_FIELD_WIDTH].decode('ascii').strip())
+                   for i in range(0, len(per_record), EDF_FIELD_WIDTH)]
+
+    duration = max(records, 0) * record_seconds
+    return {
+        "channels": signals,
+        "samples": max(samples, default=0) * max(records, 0),
+        "sfreq": max(samples, default=0) / record_seconds if record_seconds else None,
+        "duration": duration
+    }
+
+
+def _read_eeglab_header(filepath: Path) -> dict:
+    """Channel count, samples and duration from an EEGLAB .set file"""
+    variables = {name: shape for name, shape, _ in scipy.io.whosmat(str(filepath))}
+    if not {'nbchan', 'pnts', 'srate'} <= variables.keys():
+        # Files saved with the whole EEG structure in one variable
+        raise ValueError("EEGLAB header fields not found at the top level")
+
+    fields = scipy.io.loadmat(str(filepath), variable_names=['nbchan', 'pnts', 'trials', 'srate'],
+                              squeeze_me=True)
+    channels = int(fields['nbchan'])
+    samples = int(fields['pnts']) * int(fields.get('trials', 1) or 1)
+    sfreq = float(fields['srate'])
+    return {
+        "channels": channels,
+        "samples": samples,
+        "sfreq": sfreq,
+        "duration": samples / sfreq if sfreq else None
+    }
+
+
+def read_eeg_header(filepath) -> dict:
+    """
+    Read the size of a recording from its header without loading the samples.
+
+    Args:
+        filepath (str or Path): Path to a .set, .edf or .bdf file
+
+    Returns:
+        dict: channels, samples (per channel), sfreq and duration in seconds
+    """
+    filepath = Path(filepath)
+    if filepath.suffix.lower() in ('.edf', '.bdf'):
+        return _read_edf_header(filepath)
+    return _read_eeglab_header(filepath)
+
+
+def estimate_job_size(filepath, header=None) -> int:
+    """
+    Estimate the processing cost of a recording as channels x samples.
+
+    Falls back to the file size in 4-byte samples when the header cannot
+    be read, so every upload still gets a comparable size.
+
+    Args:
+        filepath (str or Path): Path to the EEG file
+        header (dict, optional): Its header, if already read
+
+    Returns:
+        int: Estimated number of channel samples
+    """
+    try:
+        header = header or read_eeg_header(filepath)
+        return int(header['channels'] * header['samples'])
+    except Exception:
+        return Path(filepath).stat().st_size // 4
@@ -0,0 +1,322 @@
+import io
+import json
+import sqlite3
+from contextlib import closing
+from pathlib import Path
+
+import numpy as np
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    patient_id TEXT NOT NULL,
+    session_date TEXT NOT NULL,
+    interval_length REAL NOT NULL,
+    num_intervals INTEGER NOT NULL,
+    bands TEXT NOT NULL,
+    band_means TEXT NOT NULL,
+    tempo INTEGER,
+    musical_key TEXT,
+    wave_strengths BLOB NOT NULL,
+    band_sums TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_patient_date
+    ON sessions (patient_id, session_date);
+CREATE TABLE IF NOT EXISTS patient_summaries (
+    patient_id TEXT PRIMARY KEY,
+    session_count INTEGER NOT NULL,
+    interval_count INTEGER NOT NULL,
+    band_sums TEXT NOT NULL,
+    first_session TEXT NOT NULL,
+    last_session TEXT NOT NULL
+);
+"""
+
+# Columns needed for summary queries - the wave matrix blob is never read here
+SUMMARY_COLUMNS = ("session_id, session_date, interval_length, num_intervals, "
+                   "bands, band_means, tempo, musical_key")
+
+
+def _encode_matrix(matrix: np.ndarray) -> bytes:
+    """Serialize a wave-strength matrix as .npy bytes"""
+    buffer = io.BytesIO()
+    np.save(buffer, matrix.astype(np.float32), allow_pickle=False)
+    return buffer.getvalue()
+
+
+def _decode_matrix(blob: bytes) -> np.ndarray:
+    """Inverse of _encode_matrix"""
+    return np.load(io.BytesIO(blob), allow_pickle=False)
+
+
+def _summary_row(row) -> dict:
+    """Turn a SUMMARY_COLUMNS row into a session summary dict"""
+    return {
+        "session_id": row[0],
+        "session_date": row[1],
+        "interval_length": row[2],
+        "num_intervals": row[3],
+        "band_means": dict(zip(json.loads(row[4]), json.loads(row[5]))),
+        "tempo": row[6],
+        "key": row[7]
+    }
+
+
+class SessionStore:
+    """
+    Per-patient store of analysed sessions.
+
+    Each session keeps its full wave-strength matrix plus precomputed
+    per-band means and global musical parameters, indexed on
+    (patient_id, session_date). Longitudinal queries only read the
+    precomputed summaries, and per-patient running totals are updated
+    incrementally on insert.
+    """
+
+    def __init__(self, db_path='output/sessions.db'):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            # Stores created before band_sums existed get the column; their
+            # rows fall back to summing the stored matrix
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(sessions)")]
+            if "band_sums" not in columns:
+                conn.execute("ALTER TABLE sessions ADD COLUMN band_sums TEXT")
+                conn.commit()
+
+    def _connect(self):
+        # A connection per call keeps the store safe to use from executor threads
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def add_session(self, patient_id, session_id, session_date, analysis_file, global_file=None):
+        """
+        Index a finished analysis for a patient.
+
+        Parameters:
+        patient_id (str): Patient identifier
+        session_id (str): Unique session identifier (the job id)
+        session_date (str): ISO 8601 date or datetime of the session
+        analysis_file (str): Path to the session's wave_analysis.json
+        global_file (str, optional): Path to the session's global_parameters.json
+
+        Returns:
+        dict: The stored session summary
+        """
+        with open(analysis_file, 'r') as f:
+            analysis = json.load(f)
+        tempo, key = None, None
+        if global_file and Path(global_file).exists():
+            with open(global_file, 'r') as f:
+                musical_parameters = json.load(f)["musical_parameters"]
+            tempo, key = musical_parameters["tempo"], musical_parameters["key"]
+
+        bands = analysis.get("bands", ["delta", "theta", "alpha", "beta", "gamma"])
+        matrix = np.array([[float(v) for v in strengths]
+                           for strengths in analysis["wave_strengths"].values()],
+                          dtype=np.float64).reshape(-1, len(bands))
+        band_sums = matrix.sum(axis=0)
+        band_means = band_sums / max(len(matrix), 1)
+
+        with closing(self._connect()) as conn, conn:
+            previous = conn.execute(
+                "SELECT patient_id FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            conn.execute(
+                "INSERT OR REPLACE INTO sessions (session_id, patient_id, session_date, "
+                "interval_length, num_intervals, bands, band_means, tempo, musical_key, "
+                "wave_strengths, band_sums) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (session_id, patient_id, session_date, float(analysis["interval_length"]),
+                 len(matrix), json.dumps(bands), json.dumps(band_means.round(6).tolist()),
+                 tempo, key, _encode_matrix(matrix), json.dumps(band_sums.tolist()))
+            )
+            if previous is not None:
+                # Re-indexing a session would double count it - rebuild instead,
+                # for the patient it belonged to as well if it moved
+                self._rebuild_patient_summary(conn, patient_id)
+                if previous[0] != patient_id:
+                    self._rebuild_patient_summary(conn, previous[0])
+            else:
+                self._update_patient_summary(conn, patient_id, session_date, bands,
+                                             band_sums, len(matrix))
+
+        return {
+            "session_id": session_id,
+            "session_date": session_date,
+            "interval_length": float(analysis["interval_length"]),
+            "num_intervals": len(matrix),
+            "band_means": dict(zip(bands, band_means.round(6).tolist())),
+            "tempo": tempo,
+            "key": key
+        }
+
+    @staticmethod
+    def _update_patient_summary(conn, patient_id, session_date, bands, band_sums, num_intervals):
+        """Fold one session into the patient's running totals"""
+        row = conn.execute(
+            "SELECT session_count, interval_count, band_sums, first_session, last_session "
+            "FROM patient_summaries WHERE patient_id = ?", (patient_id,)
+        ).fetchone()
+        sums = dict(zip(bands, band_sums.tolist()))
+        if row is None:
+            conn.execute(
+                "INSERT INTO patient_summaries VALUES (?, ?, ?, ?, ?, ?)",
+                (patient_id, 1, num_intervals, json.dumps(sums), session_date, session_date)
+            )
+            return
+        previous = json.loads(row[2])
+        for band, value in sums.items():
+            previous[band] = previous.get(band, 0.0) + value
+        conn.execute(
+            "UPDATE patient_summaries SET session_count = ?, interval_count = ?, band_sums = ?, "
+            "first_session = ?, last_session = ? WHERE patient_id = ?",
+            (row[0] + 1, row[1] + num_intervals, json.dumps(previous),
+             min(row[3], session_date), max(row[4], session_date), patient_id)
+        )
+
+    @staticmethod
+    def _rebuild_patient_summary(conn, patient_id):
+        """
+        Recompute a patient's running totals from the stored, unrounded
+        per-session band sums (the wave matrix for rows stored before them)
+        """
+        conn.execute("DELETE FROM patient_summaries WHERE patient_id = ?", (patient_id,))
+        rows = conn.execute(
+            "SELECT session_date, num_intervals, bands, band_sums, wave_strengths FROM sessions "
+            "WHERE patient_id = ? ORDER BY session_date", (patient_id,)
+        ).fetchall()
+        for session_date, num_intervals, bands, band_sums, wave_strengths in rows:
+            if band_sums is not None:
+                band_sums = np.array(json.loads(band_sums))
+            else:
+                band_sums = _decode_matrix(wave_strengths).astype(np.float64).sum(axis=0)
+            SessionStore._update_patient_summary(conn, patient_id, session_date,
+                                                 json.loads(bands), band_sums, num_intervals)
+
+    def list_sessions(self, patient_id, start=None, end=None):
+        """
+        List a patient's session summaries ordered by date.
+
+        Parameters:
+        patient_id (str): Patient identifier
+        start (str, optional): Only sessions on or after this ISO date
+        end (str, optional): Only sessions on or before this ISO date
+
+        Returns:
+        list: Session summary dicts
+        """
+        query = f"SELECT {SUMMARY_COLUMNS} FROM sessions WHERE patient_id = ?"
+        params = [patient_id]
+        if start:
+            query += " AND session_date >= ?"
+            params.append(start)
+        if end:
+            query += " AND session_date <= ?"
+            params.append(end)
+        query += " ORDER BY session_date, session_id"
+        with closing(self._connect()) as conn:
+            return [_summary_row(row) for row in conn.execute(query, params)]
+
+    def get_session(self, patient_id, session_id, include_matrix=False):
+        """Return one session summary, optionally with its wave-strength matrix"""
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                f"SELECT {SUMMARY_COLUMNS}, wave_strengths FROM sessions "
+                "WHERE patient_id = ? AND session_id = ?", (patient_id, session_id)
+            ).fetchone()
+        if row is None:
+            return None
+        session = _summary_row(row)
+        if include_matrix:
+            session["wave_strengths"] = _decode_matrix(row[8]).tolist()
+        return session
+
+    def patient_summary(self, patient_id):
+        """Return the patient's running totals as per-band averages over all intervals"""
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT session_count, interval_count, band_sums, first_session, last_session "
+                "FROM patient_summaries WHERE patient_id = ?", (patient_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        interval_count = max(row[1], 1)
+        return {
+            "patient_id": patient_id,
+            "session_count": row[0],
+            "interval_count": row[1],
+            "average_wave_strengths": {band: round(total / interval_count, 6)
+                                       for band, total in json.loads(row[2]).items()},
+            "first_session": row[3],
+            "last_session": row[4]
+        }
+
+    def trends(self, patient_id, window=5, start=None, end=None):
+        """
+        Longitudinal trends computed from the stored per-session summaries.
+
+        Parameters:
+        patient_id (str): Patient identifier
+        window (int): Number of sessions in the rolling band average
+        start (str, optional): Only sessions on or after this ISO date
+        end (str, optional): Only sessions on or before this ISO date
+
+        Returns:
+        dict: Session dates, per-band means, rolling averages, session-to-session
+        deltas and the tempo/key history
+        """
+        sessions = self.list_sessions(patient_id, start, end)
+        bands = []
+        for session in sessions:
+            bands.extend(b for b in session["band_means"] if b not in bands)
+
+        # Sessions x bands matrix of means (NaN where a session lacks a band)
+        means = np.array([[session["band_means"].get(band, np.nan) for band in bands]
+                          for session in sessions], dtype=np.float64).reshape(len(sessions), len(bands))
+
+        # Rolling average via cumulative sums over the available values
+        window = max(1, int(window))
+        valid = ~np.isnan(means)
+        sums = np.vstack([np.zeros((1, len(bands))), np.cumsum(np.where(valid, means, 0.0), axis=0)])
+        counts = np.vstack([np.zeros((1, len(bands))), np.cumsum(valid, axis=0)])
+        lower = np.maximum(np.arange(1, len(sessions) + 1) - window, 0)
+        window_sums = sums[1:] - sums[lower]
+        window_counts = counts[1:] - counts[lower]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            rolling = window_sums / window_counts
+
+        deltas = np.diff(means, axis=0)
+
+        def as_series(matrix):
+            return {band: [None if np.isnan(v) else round(float(v), 6) for v in matrix[:, i]]
+                    for i, band in enumerate(bands)}
+
+        return {
+            "patient_id": patient_id,
+            "window": window,
+            "session_ids": [session["session_id"] for session in sessions],
+            "session_dates": [session["session_date"] for session in sessions],
+            "band_means": as_series(means),
+            "rolling_band_means": as_series(rolling),
+            "session_deltas": as_series(deltas),
+            "tempo_history": [session["tempo"] for session in sessions],
+            "key_history": [session["key"] for session in sessions]
+        }
+
+    def compare(self, patient_id, session_a, session_b):
+        """Compare two sessions' band means and global parameters (b minus a)"""
+        first = self.get_session(patient_id, session_a)
+        second = self.get_session(patient_id, session_b)
+        if first is None or second is None:
+            return None
+        bands = [b for b in second["band_means"] if b in first["band_means"]]
+        return {
+            "session_a": first,
+            "session_b": second,
+            "band_mean_deltas": {band: round(second["band_means"][band] - first["band_means"][band], 6)
+                                 for band in bands},
+            "tempo_delta": (second["tempo"] - first["tempo"]
+                            if first["tempo"] is not None and second["tempo"] is not None else None),
+            "key_changed": first["key"] != second["key"]
+        }
@@ -0,0 +1,82 @@
+from pathlib import Path
+
+import numpy as np
+import scipy.io
+
+# Rhythms mixed into every synthetic channel: (frequency Hz, amplitude V)
+SYNTHETIC_RHYTHMS = ((2.0, 20e-6), (6.0, 10e-6), (10.0, 15e-6), (20.0, 5e-6), (40.0, 2e-6))
+SYNTHETIC_NOISE = 5e-6
+
+
+def synthetic_eeg(channels=8, duration=60.0, sfreq=256.0, seed=0) -> np.ndarray:
+    """
+    Generate EEG-like data: delta to gamma rhythms with per-channel phases,
+    slowly varying amplitudes and white noise.
+
+    Args:
+        channels (int): Number of channels
+        duration (float): Length in seconds
+        sfreq (float): Sampling rate in Hz
+        seed (int): Random seed, so the same parameters give the same recording
+
+    Returns:
+        ndarray: (channels, samples) float32 data in volts
+    """
+    rng = np.random.default_rng(seed)
+    times = np.arange(int(round(duration * sfreq))) / sfreq
+    data = rng.normal(0.0, SYNTHETIC_NOISE, (channels, times.size))
+    for frequency, amplitude in SYNTHETIC_RHYTHMS:
+        phases = rng.uniform(0, 2 * np.pi, (channels, 1))
+        # Amplitude drifts over tens of seconds so the intervals differ
+        envelope = 1 + 0.5 * np.sin(2 * np.pi * times / rng.uniform(20, 60) + phases)
+        data += amplitude * envelope * np.sin(2 * np.pi * frequency * times + phases)
+    return data.astype(np.float32)
+
+
+def write_synthetic_eeglab(filepath, channels=8, duration=60.0, sfreq=256.0, seed=0,
+                           events=()) -> Path:
+    """
+    Write a synthetic recording as a single-file EEGLAB .set (data embedded).
+
+    Args:
+        filepath (str or Path): Output .set path
+        channels (int): Number of channels
+        duration (float): Length in seconds
+        sfreq (float): Sampling rate in Hz
+        seed (int): Random seed
+        events (list): (type, onset in seconds) markers, e.g. ('eyes_closed', 30.0)
+            or ('boundary', 45.0)
+
+    Returns:
+        Path: The written file
+    """
+    filepath = Path(filepath)
+    filepath.parent.mkdir(parents=True, exist_ok=True)
+    data = synthetic_eeg(channels, duration, sfreq, seed)
+
+    event = np.zeros((1, len(events)), dtype=[('type', 'O'), ('latency', 'O')])
+    for i, (kind, onset) in enumerate(events):
+        # EEGLAB latencies are 1-based samples
+        event[0, i] = (kind, float(onset * sfreq + 1))
+
+    chanlocs = np.zeros((1, channels), dtype=[('labels', 'O'), ('type', 'O')])
+    for i in range(channels):
+        chanlocs[0, i] = (f"EEG{i + 1:03d}", 'EEG')
+    scipy.io.savemat(str(filepath), {
+        'setname': filepath.stem,
+        'nbchan': float(channels),
+        'pnts': float(data.shape[1]),
+        'trials': 1.0,
+        'srate': float(sfreq),
+        'xmin': 0.0,
+        'xmax': (data.shape[1] - 1) / sfreq,
+        'ref': 'common',
+        'chanlocs': chanlocs,
+        'icawinv': np.zeros((0, 0)),
+        'icasphere': np.zeros((0, 0)),
+        'icaweights': np.zeros((0, 0)),
+        'event': event if len(events) else np.zeros((0, 0), dtype=[('type', 'O'), ('latency', 'O')]),
+        # EEGLAB stores microvolts
+        'data': data * np.float32(1e6)
+    }, format='5', do_compression=False)
+    return filepath
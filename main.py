@@ -5,12 +5,15 @@ from core.midi_visualizer import visualize_midi
 from visualization.plots import create_all_visualizations
 from utils.cli import (
     Spinner, print_header, print_success, print_error, print_info,
-    clear_screen, log_to_file
+    clear_screen
 )
 from utils.config import config
+from utils.log import get_logger, setup_logging
 from pathlib import Path
 import time
 
+logger = get_logger('main')
+
 
 def setup_directories():
     """Create necessary output directories"""
@@ -36,6 +39,8 @@ def handle_midi_visualization(midi_path: str):
 
 
 def main():
+    # The CLI prints its own progress; log records go to the log file only
+    setup_logging(force=True, console=False)
     clear_screen()
     print_header("EEG to Music Conversion Tool")
     print_info("Starting processing pipeline...")
@@ -63,7 +68,7 @@ def main():
             time.sleep(0.1)
         results = preprocess_eeg(eeg_file)
         print_success("EEG preprocessing completed successfully")
-        log_to_file("EEG preprocessing completed")
+        logger.info("EEG preprocessing completed")
 
         # Step 2: Generate music parameters
         print_header("Step 2: Music Parameter Generation")
@@ -72,16 +77,16 @@ def main():
             time.sleep(0.1)
         eeg_to_music_parameters(preprocessed_eeg_path)
         print_success("Music parameters generated successfully")
-        log_to_file("Music parameters generated")
+        logger.info("Music parameters generated")
 
         # Step 3: Create MIDI file
         print_header("Step 3: MIDI File Creation")
         for _ in range(10):
             spinner.spin("Creating MIDI file...")
             time.sleep(0.1)
-        json_to_midi(eeg_music_params_path)
+        json_to_midi(eeg_music_params_path, eeg_global_music_params_path)
         print_success("MIDI file created successfully")
-        log_to_file("MIDI file created")
+        logger.info("MIDI file created")
 
         # Step 4: Create MIDI visualization
         print_header("Step 4: MIDI Visualization")
@@ -89,9 +94,9 @@ def main():
             spinner.spin("Creating MIDI visualization...")
             time.sleep(0.1)
         csv_path, _ = visualize_midi(
-            'output/midi/midi_out.mid', output_paths['json'])
+            'output/midi/midi_out.mid', output_paths['midi'])
         print_success("MIDI visualization created successfully")
-        log_to_file("MIDI visualization created")
+        logger.info("MIDI visualization created")
 
         # Step 5: Generate visualizations
         print_header("Step 5: Visualization Generation")
@@ -100,7 +105,7 @@ def main():
             time.sleep(0.1)
         create_all_visualizations(preprocessed_eeg_path, eeg_music_params_path)
         print_success("Visualizations generated successfully")
-        log_to_file("Visualizations generated")
+        logger.info("Visualizations generated")
         
         # Final summary
         end_time = time.time()
@@ -122,7 +127,7 @@ def main():
 
     except Exception as e:
         print_error(f"An error occurred: {str(e)}")
-        log_to_file(f"Error: {str(e)}")
+        logger.exception("Processing failed")
         return
 
 
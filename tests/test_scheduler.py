@@ -0,0 +1,150 @@
+"""
+Dispatch order of the JobScheduler.
+
+Jobs are dummy coroutines that record when they start and then wait for
+the test to release them, so every test controls exactly when slots free up.
+"""
+import asyncio
+
+from utils.scheduler import BULK, INTERACTIVE, JobScheduler
+
+
+class Jobs:
+    """Dummy jobs: each records its start and runs until released"""
+
+    def __init__(self):
+        self.started = []
+        self.release = {}
+
+    def __call__(self, job_id):
+        event = self.release[job_id] = asyncio.Event()
+
+        async def run():
+            self.started.append(job_id)
+            await event.wait()
+        return run
+
+
+async def settle():
+    """Let started tasks and follow-up dispatches run"""
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+async def drain(scheduler, jobs):
+    """Release running jobs until nothing is left, recording the start order"""
+    await settle()
+    while scheduler.running:
+        for job_id in list(scheduler.running):
+            jobs.release[job_id].set()
+        await settle()
+
+
+def submit(scheduler, jobs, job_id, **kwargs):
+    scheduler.submit(job_id, jobs(job_id), **kwargs)
+
+
+def test_interactive_before_bulk():
+    async def scenario():
+        scheduler, jobs = JobScheduler(max_concurrent=1), Jobs()
+        submit(scheduler, jobs, 'blocker')
+        submit(scheduler, jobs, 'bulk', priority=BULK)
+        submit(scheduler, jobs, 'interactive', priority=INTERACTIVE)
+        await drain(scheduler, jobs)
+        return jobs.started
+
+    assert asyncio.run(scenario()) == ['blocker', 'interactive', 'bulk']
+
+
+def test_bulk_concurrency_cap():
+    async def scenario():
+        scheduler, jobs = JobScheduler(max_concurrent=3, bulk_max_concurrent=1), Jobs()
+        submit(scheduler, jobs, 'bulk-1', priority=BULK)
+        submit(scheduler, jobs, 'bulk-2', priority=BULK)
+        submit(scheduler, jobs, 'interactive', priority=INTERACTIVE)
+        await settle()
+        stats = scheduler.stats()
+        await drain(scheduler, jobs)
+        return stats, jobs.started
+
+    stats, started = asyncio.run(scenario())
+    # Only one bulk job runs; the free slots stay available to interactive work
+    assert stats["running"] == {INTERACTIVE: 1, BULK: 1}
+    assert stats["queued"] == {INTERACTIVE: {}, BULK: {'default': 1}}
+    assert started == ['bulk-1', 'interactive', 'bulk-2']
+
+
+def test_fair_share_across_tenants():
+    async def scenario():
+        scheduler, jobs = JobScheduler(max_concurrent=1), Jobs()
+        submit(scheduler, jobs, 'blocker', tenant='other')
+        for i in range(1, 4):
+            submit(scheduler, jobs, f'a{i}', tenant='a', size=10)
+        submit(scheduler, jobs, 'b1', tenant='b', size=10)
+        await drain(scheduler, jobs)
+        return jobs.started
+
+    # A large batch from one clinic does not hold back the other clinic's job
+    assert asyncio.run(scenario()) == ['blocker', 'a1', 'b1', 'a2', 'a3']
+
+
+def test_idle_tenant_catches_up_to_the_clock():
+    async def scenario():
+        scheduler, jobs = JobScheduler(max_concurrent=1), Jobs()
+        times = scheduler.virtual_time[INTERACTIVE]
+
+        # Tenant b is served once, then idles while tenant a runs four jobs
+        submit(scheduler, jobs, 'blocker', tenant='other')
+        submit(scheduler, jobs, 'b1', tenant='b', size=10)
+        for i in range(1, 5):
+            submit(scheduler, jobs, f'a{i}', tenant='a', size=10)
+        await drain(scheduler, jobs)
+        assert times['b'] == 10 and times['a'] == 40
+
+        # Both return; b starts at the current virtual time, not at the
+        # service it did not use while idle
+        jobs.started.clear()
+        submit(scheduler, jobs, 'blocker-2', tenant='other')
+        clock = scheduler.clock[INTERACTIVE]
+        submit(scheduler, jobs, 'a5', tenant='a', size=10)
+        submit(scheduler, jobs, 'a6', tenant='a', size=10)
+        for i in range(2, 5):
+            submit(scheduler, jobs, f'b{i}', tenant='b', size=10)
+        assert times['b'] == clock == 30
+        await drain(scheduler, jobs)
+        return jobs.started
+
+    started = asyncio.run(scenario())
+    # Without the catch-up b (virtual time 10) would run b2, b3 and b4 first
+    assert started == ['blocker-2', 'b2', 'b3', 'a5', 'b4', 'a6']
+
+
+def test_smallest_job_first_within_a_tenant():
+    async def scenario():
+        scheduler, jobs = JobScheduler(max_concurrent=1), Jobs()
+        submit(scheduler, jobs, 'blocker')
+        submit(scheduler, jobs, 'large', size=30)
+        submit(scheduler, jobs, 'small', size=10)
+        submit(scheduler, jobs, 'medium', size=20)
+        submit(scheduler, jobs, 'small-later', size=10)
+        await drain(scheduler, jobs)
+        return jobs.started
+
+    assert asyncio.run(scenario()) == ['blocker', 'small', 'small-later', 'medium', 'large']
+
+
+def test_cancel():
+    async def scenario():
+        scheduler, jobs = JobScheduler(max_concurrent=1), Jobs()
+        submit(scheduler, jobs, 'running')
+        submit(scheduler, jobs, 'queued-1')
+        submit(scheduler, jobs, 'queued-2')
+        await settle()
+        results = (scheduler.cancel('queued-1'), scheduler.cancel('running'),
+                   scheduler.cancel('unknown'), scheduler.queued())
+        await drain(scheduler, jobs)
+        return results, jobs.started
+
+    results, started = asyncio.run(scenario())
+    assert results == ('queued', 'running', None, 1)
+    assert started == ['running', 'queued-2']
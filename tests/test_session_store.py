@@ -0,0 +1,57 @@
+"""
+Per-patient running totals in the session store across re-indexed sessions.
+"""
+import json
+import sqlite3
+
+import pytest
+
+from data.session_store import SessionStore
+
+
+def write_analysis(path, rows):
+    path.write_text(json.dumps({
+        "interval_length": 2.0,
+        "bands": ["delta", "theta"],
+        "wave_strengths": {str(i): [f"{v:.3f}" for v in row] for i, row in enumerate(rows)}
+    }))
+    return str(path)
+
+
+def raw_totals(store, patient_id):
+    with sqlite3.connect(store.db_path) as conn:
+        row = conn.execute("SELECT session_count, interval_count, band_sums "
+                           "FROM patient_summaries WHERE patient_id = ?", (patient_id,)).fetchone()
+    return row and (row[0], row[1], json.loads(row[2]))
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SessionStore(tmp_path / 'sessions.db')
+
+
+def test_reindexed_session_matches_incremental_totals(store, tmp_path):
+    first = write_analysis(tmp_path / 'a.json', [[1.234567891, 2.0], [3.000000049, 4.5]])
+    second = write_analysis(tmp_path / 'b.json', [[0.333333333, 0.1], [0.7, 0.2], [0.9, 0.3]])
+    store.add_session('p1', 's1', '2026-01-01', first)
+    store.add_session('p1', 's2', '2026-01-02', second)
+    incremental = raw_totals(store, 'p1')
+
+    # Re-indexing the same analysis rebuilds the totals from the stored sessions
+    store.add_session('p1', 's2', '2026-01-02', second)
+    assert raw_totals(store, 'p1') == incremental
+
+
+def test_session_moved_to_another_patient(store, tmp_path):
+    analysis = write_analysis(tmp_path / 'a.json', [[1.0, 2.0]])
+    store.add_session('p1', 's1', '2026-01-01', analysis)
+    store.add_session('p1', 's2', '2026-01-02', analysis)
+    store.add_session('p2', 's1', '2026-01-01', analysis)
+
+    assert raw_totals(store, 'p1')[:2] == (1, 1)
+    assert raw_totals(store, 'p2')[:2] == (1, 1)
+
+    # The previous patient's summary goes once they have no sessions left
+    store.add_session('p2', 's2', '2026-01-02', analysis)
+    assert store.patient_summary('p1') is None
+    assert store.patient_summary('p2')['session_count'] == 2
@@ -0,0 +1,229 @@
+"""
+Content stores on the local and S3 backends.
+
+The S3 backend runs against an in-memory stand-in: FakeS3Client implements the handful of boto3 client calls S3Storage makes
+(head_object, get_object with Range, upload_file, delete_object) and raises
+the same error shape as botocore's ClientError for missing objects.
+"""
+import asyncio
+import gzip
+import io
+
+import pytest
+from starlette.applications import Starlette
+from starlette.datastructures import Headers
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from utils.artifacts import artifact_response, publish_artifact
+from utils.storage import ContentStore, LocalStorage, S3Storage
+
+
+class FakeClientError(Exception):
+    def __init__(self, code):
+        super().__init__(code)
+        self.response = {"Error": {"Code": code}}
+
+
+class FakeS3Client:
+    def __init__(self):
+        self.objects = {}
+        self.uploads = 0
+
+    def _get(self, bucket, key):
+        try:
+            return self.objects[(bucket, key)]
+        except KeyError:
+            raise FakeClientError('404') from None
+
+    def head_object(self, Bucket, Key):
+        return {"ContentLength": len(self._get(Bucket, Key))}
+
+    def get_object(self, Bucket, Key, Range=None):
+        data = self._get(Bucket, Key)
+        if Range is not None:
+            first, _, last = Range[len('bytes='):].partition('-')
+            data = data[int(first):int(last) + 1 if last else None]
+        return {"Body": io.BytesIO(data)}
+
+    def upload_file(self, filename, bucket, key):
+        with open(filename, 'rb') as f:
+            self.objects[(bucket, key)] = f.read()
+        self.uploads += 1
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop((Bucket, Key), None)
+
+
+@pytest.fixture
+def client():
+    return FakeS3Client()
+
+
+@pytest.fixture
+def storage(client):
+    return S3Storage('bucket', prefix='artifacts/', client=client)
+
+
+def write(path, data):
+    path.write_bytes(data)
+    return path
+
+
+def body(response):
+    """Collect a streamed response's body"""
+    async def collect():
+        return b''.join([chunk async for chunk in response.body_iterator])
+    return asyncio.run(collect())
+
+
+def test_put_exists_size_get(storage, client, tmp_path):
+    storage.put_file('blob.bin', write(tmp_path / 'blob.bin', b'0123456789'))
+
+    assert ('bucket', 'artifacts/blob.bin') in client.objects
+    assert storage.exists('blob.bin')
+    assert storage.size('blob.bin') == 10
+    assert b''.join(storage.iter_bytes('blob.bin', block_size=3)) == b'0123456789'
+
+
+def test_missing_object(storage):
+    assert not storage.exists('missing.bin')
+    with pytest.raises(FileNotFoundError):
+        storage.size('missing.bin')
+
+
+def test_ranged_reads(storage, tmp_path):
+    storage.put_file('blob.bin', write(tmp_path / 'blob.bin', b'0123456789'))
+
+    assert b''.join(storage.iter_bytes('blob.bin', start=2, end=5)) == b'2345'
+    assert b''.join(storage.iter_bytes('blob.bin', start=7)) == b'789'
+
+
+def test_delete(storage, tmp_path):
+    storage.put_file('blob.bin', write(tmp_path / 'blob.bin', b'data'))
+    storage.delete('blob.bin')
+    assert not storage.exists('blob.bin')
+
+
+def test_rejects_keys_outside_the_store(storage):
+    with pytest.raises(ValueError):
+        storage.exists('../secret')
+
+
+def test_content_store_compresses_and_deduplicates(storage, client, tmp_path):
+    store = ContentStore(storage, 'gzip')
+    content = b'{"a": 1}' * 100
+    name = store.put_file(write(tmp_path / 'data.json', content))
+
+    assert name.endswith('.json')
+    assert store.find(name) == (name + '.gz', 'gzip')
+    assert gzip.decompress(client.objects[('bucket', f'artifacts/{name}.gz')]) == content
+    assert b''.join(store.iter_bytes(name)) == content
+
+    # Same content again: nothing new is uploaded
+    uploads = client.uploads
+    assert store.put_file(write(tmp_path / 'copy.json', content)) == name
+    assert client.uploads == uploads
+
+
+def test_variant_lookup(storage, tmp_path):
+    store = ContentStore(storage, 'none')
+    name = store.put_file(write(tmp_path / 'data.csv', b'a,b\n1,2\n'))
+
+    assert store.find(name) == (name, None)
+    assert store.add_variant(name, 'gzip')
+    assert storage.exists(name + '.gz')
+    assert not store.add_variant(name, 'unknown')
+
+
+def test_artifact_response_from_s3(storage, tmp_path):
+    store = ContentStore(storage, 'none')
+    content = b'x' * 50 + b'y' * 50
+    name = publish_artifact(write(tmp_path / 'data.csv', content), store)
+
+    # Precompressed variant for clients accepting gzip
+    response = artifact_response(name, Headers({'accept-encoding': 'gzip'}), store)
+    assert response.headers['content-encoding'] == 'gzip'
+    assert gzip.decompress(body(response)) == content
+
+    # Ranged read of the stored bytes
+    response = artifact_response(name, Headers({'range': 'bytes=40-59'}), store)
+    assert response.status_code == 206
+    assert response.headers['content-range'] == 'bytes 40-59/100'
+    assert response.headers['content-length'] == '20'
+    assert body(response) == content[40:60]
+
+    response = artifact_response(name, Headers({'range': 'bytes=200-'}), store)
+    assert response.status_code == 416
+    assert artifact_response('0' * 64 + '.csv', Headers({}), store).status_code == 404
+
+
+def test_compressed_artifact_without_ranges(storage, tmp_path):
+    store = ContentStore(storage, 'gzip')
+    content = b'{"a": 1}' * 100
+    name = store.put_file(write(tmp_path / 'data.json', content))
+
+    # Stored compressed only: identity clients get the whole decompressed body
+    response = artifact_response(name, Headers({'range': 'bytes=0-9'}), store)
+    assert response.status_code == 200
+    assert response.headers['accept-ranges'] == 'none'
+    assert body(response) == content
+
+
+@pytest.fixture
+def local_storage(tmp_path):
+    return LocalStorage(tmp_path / 'store')
+
+
+def test_local_put_stream_deduplicates(local_storage):
+    store = ContentStore(local_storage, 'none')
+    first = store.put_stream([b'abc', b'def'], '.SET')
+    second = store.put_stream([b'abcdef'], '.set')
+
+    assert first == second and first.endswith('.set')
+    assert sorted(path.name for path in local_storage.root.iterdir()) == [first]
+    assert b''.join(store.iter_bytes(first)) == b'abcdef'
+
+
+def test_local_copy(local_storage, tmp_path):
+    plain = ContentStore(local_storage, 'none')
+    name = plain.put_stream([b'recording'], '.set')
+    # Uncompressed local blobs are used in place
+    assert plain.local_copy(name, tmp_path / 'work') == local_storage.local_path(name)
+
+    compressed = ContentStore(LocalStorage(tmp_path / 'compressed'), 'gzip')
+    name = compressed.put_stream([b'recording'], '.set')
+    copy = compressed.local_copy(name, tmp_path / 'work')
+    assert copy == tmp_path / 'work' / name
+    assert copy.read_bytes() == b'recording'
+    # An existing working copy is reused
+    assert compressed.local_copy(name, tmp_path / 'work') == copy
+
+
+def test_artifact_response_from_local_blob(local_storage, tmp_path):
+    store = ContentStore(local_storage, 'none')
+    content = b'x' * 50 + b'y' * 50
+    name = publish_artifact(write(tmp_path / 'data.csv', content), store)
+
+    async def artifact(request):
+        return artifact_response(request.path_params['name'], request.headers, store)
+
+    client = TestClient(Starlette(routes=[Route('/artifacts/{name}', artifact)]))
+
+    response = client.get(f'/artifacts/{name}', headers={'accept-encoding': 'identity'})
+    assert response.status_code == 200
+    assert response.content == content
+    etag = response.headers['etag']
+
+    response = client.get(f'/artifacts/{name}', headers={'accept-encoding': 'identity',
+                                                         'range': 'bytes=40-59'})
+    assert response.status_code == 206
+    assert response.content == content[40:60]
+
+    response = client.get(f'/artifacts/{name}', headers={'accept-encoding': 'gzip'})
+    assert response.headers['content-encoding'] == 'gzip'
+    assert response.content == content  # decoded by the client
+
+    response = client.get(f'/artifacts/{name}', headers={'accept-encoding': 'identity',
+                                                         'if-none-match': etag})
+    assert response.status_code == 304
@@ -0,0 +1,201 @@
+import mimetypes
+from pathlib import Path
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response, StreamingResponse
+from starlette.staticfiles import StaticFiles
+
+from utils.storage import ContentStore, LocalStorage
+
+# Artifacts are never rewritten once published, so clients may cache them forever
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# Text formats worth compressing (MIDI and PNG are already compact)
+COMPRESSIBLE_SUFFIXES = {'.json', '.csv', '.svg'}
+
+# Content-Encoding token -> suffix of the precompressed variant, in order of preference
+ENCODING_SUFFIXES = {'br': '.br', 'zstd': '.zst', 'gzip': '.gz'}
+
+# Precompressed variants every compressible artifact gets (br only with brotli installed)
+HTTP_VARIANTS = ('gzip', 'br')
+
+mimetypes.add_type('audio/midi', '.mid')
+mimetypes.add_type('audio/mpeg', '.mp3')
+mimetypes.add_type('audio/wav', '.wav')
+
+
+def _as_store(store) -> ContentStore:
+    # A plain directory is an uncompressed local store, as before storage was configurable
+    return store if isinstance(store, ContentStore) else ContentStore(LocalStorage(store))
+
+
+def publish_artifact(path, store='output/artifacts') -> str:
+    """
+    Copy a job output into the content-addressed artifact store.
+
+    Artifacts are named after the SHA-256 of their content, so a published
+    name always refers to the same bytes and can be cached as immutable, and
+    identical outputs of different jobs are stored once. Text artifacts are
+    stored compressed with the store's codec plus gzip (and brotli) variants
+    for clients that accept them.
+
+    Args:
+        path (str or Path): File to publish
+        store (ContentStore, str or Path): Artifact store, or the directory
+            of an uncompressed local one
+
+    Returns:
+        str: Artifact name (``<sha256><suffix>``)
+    """
+    store = _as_store(store)
+    compressible = Path(path).suffix.lower() in COMPRESSIBLE_SUFFIXES
+    name = store.put_file(path, compress=compressible)
+    if compressible:
+        for codec in HTTP_VARIANTS:
+            store.add_variant(name, codec)
+    return name
+
+
+def _requested_range(range_header: str, size: int):
+    """
+    Byte range of a single-range request as (start, end) inclusive; None to
+    serve the whole blob (no, multi-part or malformed Range), False when the
+    range cannot be satisfied.
+    """
+    unit, _, spec = range_header.partition('=')
+    if unit.strip().lower() != 'bytes' or ',' in spec:
+        return None
+    first, dash, last = spec.strip().partition('-')
+    try:
+        if not dash or (not first and not last):
+            return None
+        if not first:
+            # Suffix range: the last N bytes
+            start, end = max(size - int(last), 0), size - 1
+        else:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+    except ValueError:
+        return None
+    if start > end or start >= size:
+        return False
+    return start, end
+
+
+def _blob_response(storage, key, media_type, headers, request_headers) -> Response:
+    """
+    Stored bytes as they are: a FileResponse (ranges, HEAD) for local blobs,
+    streamed otherwise - with single byte ranges served by a ranged read
+    """
+    if storage.local:
+        return FileResponse(storage.local_path(key), media_type=media_type, headers=headers)
+    size = storage.size(key)
+    headers = {**headers, "Accept-Ranges": "bytes"}
+    byte_range = _requested_range(request_headers.get('range', ''), size)
+    if byte_range is False:
+        return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+    if byte_range is None:
+        return StreamingResponse(storage.iter_bytes(key), media_type=media_type,
+                                 headers={**headers, "Content-Length": str(size)})
+    start, end = byte_range
+    return StreamingResponse(storage.iter_bytes(key, start=start, end=end), status_code=206,
+                             media_type=media_type,
+                             headers={**headers, "Content-Range": f"bytes {start}-{end}/{size}",
+                                      "Content-Length": str(end - start + 1)})
+
+
+def _accepted_encodings(accept_encoding: str) -> set:
+    """Parse an Accept-Encoding header into the set of acceptable codings"""
+    accepted = set()
+    for part in accept_encoding.split(','):
+        token, _, params = part.strip().partition(';')
+        token = token.strip().lower()
+        if not token:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if quality > 0:
+            accepted.add(token)
+    return accepted
+
+
+def artifact_response(name: str, request_headers: Headers,
+                      store='output/artifacts') -> Response:
+    """
+    Build the HTTP response for a published artifact.
+
+    Picks the best precompressed variant for the client's Accept-Encoding,
+    sets a strong ETag derived from the content hash and immutable caching.
+    Range requests and HEAD are handled by FileResponse for local blobs,
+    single ranges by a ranged read for remote ones; artifacts stored only
+    compressed are decompressed on the fly for clients that accept none of
+    the variants, advertised with ``Accept-Ranges: none``.
+
+    Args:
+        name (str): Artifact name returned by publish_artifact
+        request_headers (Headers): Incoming request headers
+        store (ContentStore, str or Path): Artifact store
+
+    Returns:
+        Response: 200/206 file or streaming response, 304 or 404
+    """
+    # Names are plain digests - reject anything that could escape the store
+    if '/' in name or '\\' in name or name.startswith('.'):
+        return Response(status_code=404)
+
+    store = _as_store(store)
+    stored = store.find(name)
+    if stored is None:
+        return Response(status_code=404)
+
+    digest = Path(name).stem
+    media_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+    headers = {"Cache-Control": IMMUTABLE_CACHE_CONTROL}
+
+    # Pick a precompressed variant if the client accepts one
+    encoding, key = None, None
+    if Path(name).suffix in COMPRESSIBLE_SUFFIXES:
+        headers["Vary"] = "Accept-Encoding"
+        accepted = _accepted_encodings(request_headers.get('accept-encoding', ''))
+        for candidate, suffix in ENCODING_SUFFIXES.items():
+            if candidate in accepted and store.storage.exists(name + suffix):
+                encoding, key = candidate, name + suffix
+                break
+
+    # Each representation needs its own strong validator
+    etag = f'"{digest}-{encoding}"' if encoding else f'"{digest}"'
+    headers["ETag"] = etag
+    if encoding:
+        headers["Content-Encoding"] = encoding
+
+    if_none_match = request_headers.get('if-none-match', '')
+    if etag in [tag.strip() for tag in if_none_match.split(',')] or if_none_match.strip() == '*':
+        return Response(status_code=304, headers=headers)
+
+    if encoding:
+        return _blob_response(store.storage, key, media_type, headers, request_headers)
+    if stored[1] is None:
+        return _blob_response(store.storage, stored[0], media_type, headers, request_headers)
+    # Decompressed on the fly: the length and offsets are unknown up front,
+    # so ranges are not supported for this representation (full 200 only)
+    return StreamingResponse(store.iter_bytes(name), media_type=media_type,
+                             headers={**headers, "Accept-Ranges": "none"})
+
+
+class RevalidatingStaticFiles(StaticFiles):
+    """
+    StaticFiles for mutable outputs.
+
+    Files under ``output/`` may be rewritten in place, so browsers must
+    revalidate them with the ETag before reusing a cached copy.
+    """
+
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        response.headers["Cache-Control"] = "no-cache"
+        return response
@@ -1,16 +1,21 @@
 import os
 import shutil
 
-def clear_uploads_directory(uploads_path, keep_latest=5):
+from utils.log import get_logger
+
+logger = get_logger(__name__)
+
+def clear_uploads_directory(uploads_path, keep_latest=5, keep=()):
     """
     Delete older files in the uploads directory, keeping only the latest ones.
     
     Args:
         uploads_path (str): Path to the uploads directory
         keep_latest (int): Number of latest files to keep (default: 5)
+        keep (iterable): Files that are never deleted (e.g. inputs of queued jobs)
     """
     if not os.path.exists(uploads_path):
-        print(f"Uploads directory does not exist: {uploads_path}")
+        logger.debug("Uploads directory does not exist: %s", uploads_path)
         return
 
     # Get all files in the directory
@@ -22,24 +27,26 @@ def clear_uploads_directory(uploads_path, keep_latest=5):
     
     # Check if we need to clean up (more files than the keep limit)
     if len(files) <= keep_latest:
-        print(f"No cleanup needed. {len(files)} files found, keeping up to {keep_latest}.")
+        logger.debug("No cleanup needed. %s files found, keeping up to %s.", len(files), keep_latest)
         return
         
     # Sort files by modification time (newest first)
     files.sort(key=os.path.getmtime, reverse=True)
     
     # Keep the latest N files, delete the rest
-    files_to_delete = files[keep_latest:]
+    protected = {os.path.abspath(path) for path in keep}
+    files_to_delete = [path for path in files[keep_latest:]
+                       if os.path.abspath(path) not in protected]
     
-    print(f"Keeping {keep_latest} newest files, deleting {len(files_to_delete)} older files.")
+    logger.info("Keeping %s newest files, deleting %s older files.", keep_latest, len(files_to_delete))
     
     # Delete the older files
     for file_path in files_to_delete:
         try:
             os.unlink(file_path)
-            print(f"Deleted: {file_path}")
+            logger.debug("Deleted: %s", file_path)
         except Exception as e:
-            print(f"Error deleting {file_path}: {e}")
+            logger.error("Error deleting %s: %s", file_path, e)
     
     # Also clean up any directories in the uploads folder
     for item in os.listdir(uploads_path):
@@ -47,6 +54,6 @@ def clear_uploads_directory(uploads_path, keep_latest=5):
         if os.path.isdir(item_path):
             try:
                 shutil.rmtree(item_path)
-                print(f"Deleted directory: {item_path}")
+                logger.debug("Deleted directory: %s", item_path)
             except Exception as e:
-                print(f"Error deleting directory {item_path}: {e}")
\ No newline at end of file
+                logger.error("Error deleting directory %s: %s", item_path, e)
\ No newline at end of file
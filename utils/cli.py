@@ -1,7 +1,6 @@
 import sys
 import time
 from itertools import cycle
-from datetime import datetime
 from typing import Optional
 import os
 
@@ -44,10 +43,15 @@ def create_loading_bar(current: int, total: int, width: int = 40) -> str:
     percent = int(100 * current / total)
     return f"[{bar}] {percent}%"
 
-def log_to_file(message: str, log_file: Optional[str] = "processing.log"):
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    with open(log_file, "a") as f:
-        f.write(f"[{timestamp}] {message}\n")
+def log_to_file(message: str, log_file: Optional[str] = None):
+    """
+    Log a message through the application logger (utils.log).
+
+    Kept for older scripts: the message goes to the rotating log file from
+    the `logging` config section; `log_file` is ignored.
+    """
+    from utils.log import get_logger
+    get_logger('utils.cli').info(message)
 
 def clear_screen():
     os.system('cls' if os.name == 'nt' else 'clear')
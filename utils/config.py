@@ -1,6 +1,9 @@
 import yaml
 from pathlib import Path
 
+# Sentinel so that None can be used as an explicit default
+_MISSING = object()
+
 class Config:
     _instance = None
 
@@ -15,10 +18,15 @@ class Config:
         with open(config_path, 'r') as f:
             self._config = yaml.safe_load(f)
 
-    def get(self, *keys):
+    def get(self, *keys, default=_MISSING):
         value = self._config
         for key in keys:
-            value = value[key]
+            try:
+                value = value[key]
+            except (KeyError, TypeError):
+                if default is _MISSING:
+                    raise
+                return default
         return value
 
 config = Config()
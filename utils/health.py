@@ -0,0 +1,178 @@
+"""
+Liveness and readiness signals for load balancers and autoscalers.
+
+Everything here is O(1): disk headroom comes from statvfs, memory from a few
+/proc and cgroup files, load from the scheduler's counters - no directory is
+ever scanned, so probes stay cheap under load.
+"""
+import os
+import shutil
+import time
+from pathlib import Path
+
+from utils.config import config
+
+# cgroup v2 / v1 memory limit and usage (containers)
+CGROUP_MEMORY_FILES = (
+    ('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory.current'),
+    ('/sys/fs/cgroup/memory/memory.limit_in_bytes', '/sys/fs/cgroup/memory/memory.usage_in_bytes'),
+)
+
+# Limits above this are "unlimited" placeholders, not real limits
+UNLIMITED_BYTES = 1 << 60
+
+_started = time.time()
+
+
+def health_settings() -> dict:
+    """The health config section with defaults filled in"""
+    settings = config.get('health', default=None) or {}
+    return {
+        "max_queue_depth": int(settings.get('max_queue_depth', 20)),
+        "min_free_disk_mb": float(settings.get('min_free_disk_mb', 1024)),
+        "min_free_disk_fraction": float(settings.get('min_free_disk_fraction', 0.05)),
+        "max_memory_used_fraction": float(settings.get('max_memory_used_fraction', 0.9))
+    }
+
+
+def uptime_seconds() -> float:
+    return round(time.time() - _started, 1)
+
+
+def disk_headroom(path) -> dict:
+    """Free space of the filesystem holding `path` (one statvfs call)"""
+    path = Path(path)
+    # The directory may not exist yet; measure the filesystem it will be created on
+    while not path.exists() and path != path.parent:
+        path = path.parent
+    usage = shutil.disk_usage(path)
+    return {
+        "free_mb": round(usage.free / (1024 * 1024), 1),
+        "total_mb": round(usage.total / (1024 * 1024), 1),
+        "free_fraction": round(usage.free / usage.total, 4) if usage.total else 0.0
+    }
+
+
+def _read_int(path):
+    try:
+        with open(path) as f:
+            value = f.read().strip()
+    except OSError:
+        return None
+    return int(value) if value.isdigit() else None
+
+
+def _meminfo() -> dict:
+    values = {}
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                name, _, rest = line.partition(':')
+                values[name] = int(rest.split()[0]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return values
+
+
+def _memory_psi():
+    """'some' avg10 of /proc/pressure/memory: % of time tasks stalled on memory, or None"""
+    try:
+        with open('/proc/pressure/memory') as f:
+            for line in f:
+                if line.startswith('some'):
+                    fields = dict(part.split('=') for part in line.split()[1:])
+                    return float(fields['avg10'])
+    except (OSError, ValueError, KeyError):
+        pass
+    return None
+
+
+def memory_pressure() -> dict:
+    """
+    Memory use against the effective limit: the container's cgroup limit
+    when there is one, otherwise the host's memory.
+
+    Returns:
+        dict: limit_mb, used_mb, used_fraction (None where unavailable),
+            source and psi_some_avg10 (Linux pressure stall information)
+    """
+    meminfo = _meminfo()
+    limit = used = None
+    source = None
+    for limit_file, usage_file in CGROUP_MEMORY_FILES:
+        cgroup_limit, cgroup_used = _read_int(limit_file), _read_int(usage_file)
+        if cgroup_limit and cgroup_used is not None and cgroup_limit < UNLIMITED_BYTES:
+            limit, used, source = cgroup_limit, cgroup_used, 'cgroup'
+            break
+    if limit is None and 'MemTotal' in meminfo and 'MemAvailable' in meminfo:
+        limit, used, source = meminfo['MemTotal'], meminfo['MemTotal'] - meminfo['MemAvailable'], 'host'
+
+    return {
+        "source": source,
+        "limit_mb": round(limit / (1024 * 1024), 1) if limit else None,
+        "used_mb": round(used / (1024 * 1024), 1) if limit else None,
+        "used_fraction": round(used / limit, 4) if limit else None,
+        "psi_some_avg10": _memory_psi()
+    }
+
+
+def readiness_report(scheduler, paths, settings=None, warmup=None) -> dict:
+    """
+    Load and resource state, and whether this instance should get more work.
+
+    Not ready while the startup warm-up has not finished (or has failed),
+    when the queue is deeper than max_queue_depth, a data directory's
+    filesystem is below the free space limits, or memory use is above
+    max_memory_used_fraction. Busy workers alone do not make an
+    instance unready (jobs queue), but `saturation` lets an autoscaler act
+    on them.
+
+    Args:
+        scheduler (JobScheduler): The job scheduler
+        paths (dict): Name -> directory whose disk headroom matters
+        settings (dict, optional): See health_settings
+        warmup (dict, optional): Warm-up state; its status must be done or disabled
+
+    Returns:
+        dict: ready, failed checks, warmup, workers, queue, disk and memory
+    """
+    settings = settings or health_settings()
+    stats = scheduler.stats()
+    running = sum(stats["running"].values())
+    queued = scheduler.queued()
+    disks = {name: disk_headroom(path) for name, path in paths.items()}
+    memory = memory_pressure()
+
+    failed = []
+    if warmup is not None and warmup.get("status") not in ("done", "disabled"):
+        failed.append("warmup")
+    if queued > settings["max_queue_depth"]:
+        failed.append("queue_depth")
+    min_free_mb = settings["min_free_disk_mb"]
+    for name, disk in disks.items():
+        if disk["free_mb"] < min_free_mb or disk["free_fraction"] < settings["min_free_disk_fraction"]:
+            failed.append(f"disk_{name}")
+    if memory["used_fraction"] is not None and \
+            memory["used_fraction"] > settings["max_memory_used_fraction"]:
+        failed.append("memory")
+
+    return {
+        "ready": not failed,
+        "failed_checks": failed,
+        "warmup": warmup,
+        "workers": {
+            "running": running,
+            "max_concurrent": stats["max_concurrent"],
+            "saturation": round(running / stats["max_concurrent"], 3),
+            "running_by_priority": stats["running"]
+        },
+        "queue": {
+            "depth": queued,
+            "max_depth": settings["max_queue_depth"],
+            "by_priority": {cls: sum(tenants.values()) for cls, tenants in stats["queued"].items()}
+        },
+        "disk": disks,
+        "memory": memory,
+        "pid": os.getpid(),
+        "uptime_seconds": uptime_seconds()
+    }
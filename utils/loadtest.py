@@ -0,0 +1,336 @@
+"""
+Load generator for the FastAPI service.
+
+Drives /api/upload, /api/process/{file_id} and /api/status/{job_id} with a
+number of concurrent clients, each uploading synthetic EEG recordings of
+mixed sizes and polling its jobs to completion, and writes a JSON report
+(throughput, per-endpoint latency percentiles, time to completion, error
+rates) that can be compared across releases.
+
+    python -m utils.loadtest --concurrency 4 --jobs 20 --sizes 8x60,32x300
+    python -m utils.loadtest --url http://localhost:8005 --compare old_report.json
+"""
+import argparse
+import json
+import platform
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import requests
+
+from data.synthetic import write_synthetic_eeglab
+
+ENDPOINTS = ('upload', 'process', 'status')
+PERCENTILES = (50, 90, 95, 99)
+TERMINAL_STATUSES = {"COMPLETED", "FAILED", "CANCELLED"}
+REPORT_VERSION = 1
+
+
+def parse_size(spec: str) -> dict:
+    """
+    Parse a recording size "CHANNELSxSECONDS[@HZ]", e.g. "32x300@512".
+
+    Returns:
+        dict: channels, duration and sfreq
+    """
+    shape, _, rate = spec.strip().partition('@')
+    channels, _, duration = shape.partition('x')
+    return {"channels": int(channels), "duration": float(duration),
+            "sfreq": float(rate) if rate else 256.0}
+
+
+def make_recordings(sizes, directory) -> list:
+    """Write one synthetic .set per size spec (reused across jobs)"""
+    recordings = []
+    for index, spec in enumerate(sizes):
+        size = parse_size(spec)
+        path = write_synthetic_eeglab(Path(directory) / f"synthetic_{index}.set", seed=index, **size)
+        recordings.append({"spec": spec, "path": path, **size})
+    return recordings
+
+
+def latency_summary(samples) -> dict:
+    """Count, mean, max and percentiles (seconds) of a list of latencies"""
+    if not samples:
+        return {"count": 0}
+    values = np.asarray(samples, dtype=np.float64)
+    summary = {"count": int(values.size), "mean": round(float(values.mean()), 4),
+               "max": round(float(values.max()), 4)}
+    for q, value in zip(PERCENTILES, np.percentile(values, PERCENTILES)):
+        summary[f"p{q}"] = round(float(value), 4)
+    return summary
+
+
+class LoadTestRecorder:
+    """Thread-safe collector of request latencies, errors and job outcomes"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {endpoint: [] for endpoint in ENDPOINTS}
+        self.errors = {endpoint: 0 for endpoint in ENDPOINTS}
+        self.error_samples = []
+        self.jobs = []
+
+    def request(self, session, endpoint, method, url, **kwargs):
+        """Send one request and record its latency; returns the JSON body or None"""
+        start = time.perf_counter()
+        try:
+            response = session.request(method, url, timeout=60, **kwargs)
+            ok = response.status_code < 400
+            body = response.json() if ok else None
+            error = None if ok else f"HTTP {response.status_code}: {response.text[:200]}"
+        except (requests.RequestException, ValueError) as e:
+            ok, body, error = False, None, str(e)
+        elapsed = time.perf_counter() - start
+
+        with self.lock:
+            self.latencies[endpoint].append(elapsed)
+            if not ok:
+                self.errors[endpoint] += 1
+                if len(self.error_samples) < 20:
+                    self.error_samples.append({"endpoint": endpoint, "error": error})
+        return body
+
+    def job(self, record):
+        with self.lock:
+            self.jobs.append(record)
+
+
+def run_job(base_url, recording, recorder, poll_interval, job_timeout, params):
+    """Upload, process and poll one recording to a terminal status"""
+    session = requests.Session()
+    record = {"size": recording["spec"], "status": "UPLOAD_FAILED"}
+    start = time.perf_counter()
+
+    with open(recording["path"], 'rb') as f:
+        body = recorder.request(session, 'upload', 'POST', f"{base_url}/api/upload",
+                                files={'file': (recording["path"].name, f)})
+    if body is None:
+        recorder.job(record)
+        return
+
+    body = recorder.request(session, 'process', 'POST',
+                            f"{base_url}/api/process/{body['file_id']}", params=params)
+    if body is None:
+        record["status"] = "PROCESS_FAILED"
+        recorder.job(record)
+        return
+
+    job_id = body["job_id"]
+    status = {"status": "TIMEOUT"}
+    while time.perf_counter() - start < job_timeout:
+        polled = recorder.request(session, 'status', 'GET', f"{base_url}/api/status/{job_id}")
+        if polled is not None:
+            status = polled
+            if status.get("status") in TERMINAL_STATUSES:
+                break
+        time.sleep(poll_interval)
+    else:
+        status = {"status": "TIMEOUT"}
+
+    record.update(job_id=job_id, status=status.get("status"), error=status.get("error"),
+                  completion_time=round(time.perf_counter() - start, 4),
+                  queue_time=status.get("queue_time"))
+    recorder.job(record)
+
+
+def build_report(recorder, settings, wall_time) -> dict:
+    """Summarize a finished run as a JSON-serializable report"""
+    completed = [job for job in recorder.jobs if job["status"] == "COMPLETED"]
+    requests_sent = sum(len(samples) for samples in recorder.latencies.values())
+
+    by_size = {}
+    for job in recorder.jobs:
+        by_size.setdefault(job["size"], []).append(job)
+
+    return {
+        "report_version": REPORT_VERSION,
+        "created": datetime.now().isoformat(timespec='seconds'),
+        "environment": {"python": platform.python_version(), "machine": platform.machine(),
+                        "host": platform.node()},
+        "settings": settings,
+        "wall_time": round(wall_time, 3),
+        "throughput": {
+            "jobs_per_second": round(len(completed) / wall_time, 4) if wall_time else 0.0,
+            "requests_per_second": round(requests_sent / wall_time, 3) if wall_time else 0.0
+        },
+        "endpoints": {
+            endpoint: {**latency_summary(samples),
+                       "errors": recorder.errors[endpoint],
+                       "error_rate": round(recorder.errors[endpoint] / len(samples), 4) if samples else 0.0}
+            for endpoint, samples in recorder.latencies.items()
+        },
+        "jobs": {
+            "submitted": len(recorder.jobs),
+            "completed": len(completed),
+            "failure_rate": round(1 - len(completed) / len(recorder.jobs), 4) if recorder.jobs else 0.0,
+            "statuses": {status: sum(1 for job in recorder.jobs if job["status"] == status)
+                         for status in sorted({job["status"] for job in recorder.jobs})},
+            "completion_time": latency_summary([job["completion_time"] for job in completed]),
+            "queue_time": latency_summary([job["queue_time"] for job in completed
+                                           if job.get("queue_time") is not None]),
+            "by_size": {size: latency_summary([job["completion_time"] for job in jobs
+                                               if job["status"] == "COMPLETED"])
+                        for size, jobs in by_size.items()}
+        },
+        "error_samples": recorder.error_samples
+    }
+
+
+def compare_reports(baseline: dict, current: dict) -> dict:
+    """
+    Relative change of the key metrics between two reports.
+
+    Returns:
+        dict: metric -> {"baseline", "current", "change"} where change is
+        (current - baseline) / baseline, or None when the baseline is zero
+    """
+    def metric(report, *keys):
+        for key in keys:
+            report = (report or {}).get(key)
+        return report
+
+    keys = [("throughput", "jobs_per_second"), ("throughput", "requests_per_second"),
+            ("jobs", "failure_rate"), ("jobs", "completion_time", "p50"),
+            ("jobs", "completion_time", "p95")]
+    keys += [("endpoints", endpoint, stat) for endpoint in ENDPOINTS for stat in ("p50", "p95", "error_rate")]
+
+    comparison = {}
+    for path in keys:
+        before, after = metric(baseline, *path), metric(current, *path)
+        if before is None or after is None:
+            continue
+        comparison[".".join(path)] = {
+            "baseline": before, "current": after,
+            "change": round((after - before) / before, 4) if before else None
+        }
+    return comparison
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_local_app(port=None, startup_timeout=60.0):
+    """
+    Start api:app with uvicorn in a subprocess and wait until it is ready
+    (warmed up), so the first measured jobs do not pay the start-up cost.
+
+    Returns:
+        tuple: (process, base URL)
+    """
+    port = port or _free_port()
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'api:app', '--host', '127.0.0.1', '--port', str(port),
+         '--log-level', 'warning'],
+        cwd=Path(__file__).resolve().parent.parent
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + startup_timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"API exited during startup with code {process.returncode}")
+        try:
+            if requests.get(f"{base_url}/readyz", timeout=1).status_code == 200:
+                return process, base_url
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("API did not start in time")
+
+
+def run_load_test(base_url=None, concurrency=4, jobs=20, sizes=("8x60",), poll_interval=0.5,
+                  job_timeout=600.0, data_dir='output/loadtest/data', params=None) -> dict:
+    """
+    Run a load test and return its report.
+
+    Args:
+        base_url (str, optional): Running service; a local app is started when omitted
+        concurrency (int): Number of clients submitting jobs at the same time
+        jobs (int): Total number of jobs; sizes are assigned round-robin
+        sizes (iterable): Recording sizes as "CHANNELSxSECONDS[@HZ]"
+        poll_interval (float): Seconds between status polls of a job
+        job_timeout (float): Seconds before a job counts as timed out
+        data_dir (str): Where the synthetic recordings are written
+        params (dict, optional): Extra query parameters for /api/process
+
+    Returns:
+        dict: The report (see build_report)
+    """
+    recordings = make_recordings(sizes, data_dir)
+    process = None
+    if base_url is None:
+        process, base_url = start_local_app()
+
+    settings = {"base_url": base_url, "local_app": process is not None, "concurrency": concurrency,
+                "jobs": jobs, "sizes": list(sizes), "poll_interval": poll_interval,
+                "job_timeout": job_timeout, "params": params or {}}
+    recorder = LoadTestRecorder()
+    print(f"Load test: {jobs} jobs, concurrency {concurrency}, sizes {', '.join(sizes)} -> {base_url}")
+
+    start = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            futures = [executor.submit(run_job, base_url, recordings[i % len(recordings)], recorder,
+                                       poll_interval, job_timeout, params or {})
+                       for i in range(jobs)]
+            for future in futures:
+                future.result()
+    finally:
+        wall_time = time.perf_counter() - start
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=30)
+
+    return build_report(recorder, settings, wall_time)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the EEG processing API")
+    parser.add_argument('--url', help="Base URL of a running service (default: start api:app locally)")
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--jobs', type=int, default=20)
+    parser.add_argument('--sizes', default="8x60,32x300",
+                        help="Comma-separated recording sizes CHANNELSxSECONDS[@HZ]")
+    parser.add_argument('--poll-interval', type=float, default=0.5)
+    parser.add_argument('--job-timeout', type=float, default=600.0)
+    parser.add_argument('--priority', choices=['interactive', 'bulk'])
+    parser.add_argument('--output', help="Report path (default: output/loadtest/report_<time>.json)")
+    parser.add_argument('--compare', help="Earlier report to compare against")
+    args = parser.parse_args(argv)
+
+    params = {"priority": args.priority} if args.priority else None
+    report = run_load_test(args.url, args.concurrency, args.jobs, args.sizes.split(','),
+                           args.poll_interval, args.job_timeout, params=params)
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            report["comparison"] = compare_reports(json.load(f), report)
+
+    output = Path(args.output or f"output/loadtest/report_{datetime.now():%Y%m%d_%H%M%S}.json")
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    jobs_summary = report["jobs"]
+    print(f"Completed {jobs_summary['completed']}/{jobs_summary['submitted']} jobs in {report['wall_time']}s "
+          f"({report['throughput']['jobs_per_second']} jobs/s)")
+    for endpoint, summary in report["endpoints"].items():
+        if summary["count"]:
+            print(f"  {endpoint:8s} p50 {summary['p50']:.3f}s  p95 {summary['p95']:.3f}s  "
+                  f"p99 {summary['p99']:.3f}s  errors {summary['errors']}")
+    print(f"Report saved to: {output}")
+    return report
+
+
+if __name__ == "__main__":
+    main()
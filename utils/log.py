@@ -0,0 +1,230 @@
+"""
+Structured, non-blocking logging.
+
+Records are put on an in-memory queue by the calling thread and written by
+a single background listener thread (JSON lines to a rotating file, plus the
+console), so logging on the request and processing paths costs no file
+syscalls. Every record carries the job_id and stage of the context it was
+logged in; high-volume DEBUG events are sampled.
+
+    from utils.log import get_logger, log_context
+    logger = get_logger(__name__)
+
+    with log_context(job_id=job_id, stage='analysis'):
+        logger.info("Analysis complete", extra={"tiles": 4})
+"""
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import queue
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from functools import partial
+from pathlib import Path
+
+from utils.config import config
+
+# Top-level packages whose loggers are configured (third-party loggers keep their defaults)
+APP_LOGGERS = ('api', 'main', 'core', 'data', 'utils', 'visualization')
+
+job_id_var = contextvars.ContextVar('job_id', default=None)
+stage_var = contextvars.ContextVar('stage', default=None)
+
+# LogRecord attributes that are not user-supplied `extra` fields
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {
+    'message', 'asctime', 'job_id', 'stage'
+}
+
+_listener = None
+_setup_lock = threading.Lock()
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Logger for a module (configures logging on first use)"""
+    setup_logging()
+    return logging.getLogger(name)
+
+
+@contextmanager
+def log_context(job_id=None, stage=None):
+    """Attach a job_id and/or stage to every record logged inside the block"""
+    tokens = []
+    if job_id is not None:
+        tokens.append((job_id_var, job_id_var.set(job_id)))
+    if stage is not None:
+        tokens.append((stage_var, stage_var.set(stage)))
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+def with_log_context(func, *args, **kwargs):
+    """
+    Bind a call to the current logging context.
+
+    Executor threads do not inherit context variables; pass the result to
+    run_in_executor so records logged by the stage keep their job_id/stage.
+    """
+    return partial(contextvars.copy_context().run, func, *args, **kwargs)
+
+
+class ContextFilter(logging.Filter):
+    """Copies the current job_id and stage onto each record"""
+
+    def filter(self, record):
+        record.job_id = job_id_var.get()
+        record.stage = stage_var.get()
+        return True
+
+
+class DebugSampler(logging.Filter):
+    """
+    Keeps one in every `every` DEBUG records per (logger, message template);
+    records above DEBUG always pass. The first occurrence is always kept.
+    """
+
+    def __init__(self, every=100):
+        super().__init__()
+        self.every = max(1, int(every))
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG or self.every == 1:
+            return True
+        key = (record.name, record.msg)
+        with self._lock:
+            count = self._counts.get(key, 0)
+            self._counts[key] = count + 1
+        if count % self.every:
+            return False
+        record.sample_rate = 1 / self.every
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line: time, level, logger, message, context and extra
+    fields (exceptions arrive pre-rendered in exc_text, see DroppingQueueHandler)
+    """
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "job_id": getattr(record, 'job_id', None),
+            "stage": getattr(record, 'stage', None)
+        }
+        entry.update({key: value for key, value in vars(record).items()
+                      if key not in _RECORD_ATTRIBUTES})
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class ConsoleFormatter(logging.Formatter):
+    """Human-readable line with the job context as a prefix"""
+
+    def format(self, record):
+        job_id, stage = getattr(record, 'job_id', None), getattr(record, 'stage', None)
+        context = "/".join(part for part in (job_id and str(job_id)[:8], stage) if part)
+        message = record.getMessage()
+        if record.exc_text:
+            message = f"{message}\n{record.exc_text}"
+        return f"[{context}] {message}" if context else message
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that never blocks: records are dropped (and counted) when the queue is full"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Render the message now (arguments may change later) but leave the
+        # formatting to the listener thread
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def setup_logging(force=False, console=None):
+    """
+    Configure the application loggers from the `logging` config section.
+
+    Idempotent: only the first call (or a call with force=True) builds the
+    handlers. The listener thread is stopped, flushing queued records, at exit.
+    `console` overrides logging.console, e.g. False for the interactive CLI,
+    which prints its own progress lines.
+    """
+    global _listener
+    with _setup_lock:
+        if _listener is not None and not force:
+            return
+        if _listener is not None:
+            _listener.stop()
+
+        settings = config.get('logging', default=None) or {}
+        handlers = []
+        log_file = settings.get('file')
+        if log_file:
+            Path(log_file).parent.mkdir(parents=True, exist_ok=True)
+            file_handler = logging.handlers.RotatingFileHandler(
+                log_file, maxBytes=int(settings.get('max_bytes', 10 * 1024 * 1024)),
+                backupCount=int(settings.get('backup_count', 5)), encoding='utf-8'
+            )
+            file_handler.setFormatter(JsonFormatter())
+            handlers.append(file_handler)
+        if settings.get('console', True) if console is None else console:
+            console_handler = logging.StreamHandler()
+            console_handler.setFormatter(JsonFormatter() if settings.get('console_format') == 'json'
+                                         else ConsoleFormatter())
+            handlers.append(console_handler)
+
+        log_queue = queue.Queue(maxsize=int(settings.get('queue_size', 10000)))
+        queue_handler = DroppingQueueHandler(log_queue)
+        queue_handler.addFilter(ContextFilter())
+        queue_handler.addFilter(DebugSampler(settings.get('debug_sample_every', 100)))
+
+        level = getattr(logging, str(settings.get('level', 'INFO')).upper())
+        for name in APP_LOGGERS:
+            logger = logging.getLogger(name)
+            for handler in list(logger.handlers):
+                if isinstance(handler, DroppingQueueHandler):
+                    logger.removeHandler(handler)
+            logger.addHandler(queue_handler)
+            logger.setLevel(level)
+            logger.propagate = False
+
+        _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+        _listener.start()
+
+
+def shutdown_logging():
+    """Stop the listener thread after it has written every queued record"""
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
+atexit.register(shutdown_logging)
@@ -0,0 +1,138 @@
+import asyncio
+import heapq
+import itertools
+from typing import Optional
+
+# Priority classes in dispatch order
+INTERACTIVE = 'interactive'
+BULK = 'bulk'
+PRIORITY_CLASSES = (INTERACTIVE, BULK)
+
+
+class JobScheduler:
+    """
+    Priority, fair-share and shortest-job-first dispatcher for processing jobs.
+
+    Jobs are queued per priority class and, within a class, per tenant
+    (clinic). Dispatch order is:
+
+    1. Interactive jobs before bulk jobs. Bulk jobs may only occupy
+       `bulk_max_concurrent` of the `max_concurrent` slots, so a slot is
+       always free soon for the next interactive job.
+    2. Within a class, the tenant with the least service so far (start-time
+       fair queuing: every dispatched job charges its estimated size to its
+       tenant's virtual time), so a clinic submitting a large batch cannot
+       starve the others.
+    3. Within a tenant, the smallest estimated job first, ties in arrival order.
+
+    Jobs are coroutine functions run as tasks on the event loop; the scheduler
+    only decides when they start.
+    """
+
+    def __init__(self, max_concurrent=2, bulk_max_concurrent=1):
+        self.max_concurrent = max(1, max_concurrent)
+        self.bulk_max_concurrent = max(1, min(bulk_max_concurrent, self.max_concurrent))
+        # class -> tenant -> heap of (size, sequence, job_id, run)
+        self.queues = {priority: {} for priority in PRIORITY_CLASSES}
+        # class -> tenant -> virtual time (service received, in size units)
+        self.virtual_time = {priority: {} for priority in PRIORITY_CLASSES}
+        # class -> virtual time of the last dispatched job
+        self.clock = {priority: 0.0 for priority in PRIORITY_CLASSES}
+        self.running = {}  # job_id -> (priority, task)
+        self._sequence = itertools.count()
+
+    def submit(self, job_id, run, priority=INTERACTIVE, tenant='default', size=0):
+        """
+        Queue a job and start it as soon as the policy allows.
+
+        Args:
+            job_id (str): Job identifier
+            run (callable): Coroutine function started with no arguments
+            priority (str): 'interactive' or 'bulk'
+            tenant (str): Tenant (clinic) the job is charged to
+            size (int): Estimated job size, e.g. channels x samples
+        """
+        if priority not in self.queues:
+            raise ValueError(f"Unknown priority class: {priority}")
+        queue = self.queues[priority].setdefault(tenant, [])
+        if not queue:
+            # A tenant returning from idle starts at the current virtual time
+            # instead of cashing in the service it did not use
+            times = self.virtual_time[priority]
+            times[tenant] = max(times.get(tenant, 0.0), self.clock[priority])
+        heapq.heappush(queue, (size, next(self._sequence), job_id, run))
+        self._dispatch()
+
+    def cancel(self, job_id) -> Optional[str]:
+        """
+        Remove a job from its queue.
+
+        Args:
+            job_id (str): Job identifier
+
+        Returns:
+            str or None: 'queued' if the job was waiting and has been dropped, 'running'
+            if it has already started (the caller must stop it), None if unknown
+        """
+        if job_id in self.running:
+            return 'running'
+        for tenants in self.queues.values():
+            for queue in tenants.values():
+                for index, entry in enumerate(queue):
+                    if entry[2] == job_id:
+                        queue[index] = queue[-1]
+                        queue.pop()
+                        heapq.heapify(queue)
+                        return 'queued'
+        return None
+
+    def queued(self, priority=None) -> int:
+        """Number of jobs waiting, in one class or in all of them"""
+        classes = [priority] if priority else PRIORITY_CLASSES
+        return sum(len(queue) for cls in classes for queue in self.queues[cls].values())
+
+    def stats(self) -> dict:
+        """Queue depth per class and tenant, and the running jobs per class"""
+        return {
+            "max_concurrent": self.max_concurrent,
+            "running": {cls: sum(1 for priority, _ in self.running.values() if priority == cls)
+                        for cls in PRIORITY_CLASSES},
+            "queued": {cls: {tenant: len(queue) for tenant, queue in self.queues[cls].items() if queue}
+                       for cls in PRIORITY_CLASSES}
+        }
+
+    def _next_job(self, priority):
+        """Pop the next job of a class: least-served tenant, then its smallest job"""
+        queues = self.queues[priority]
+        waiting = [tenant for tenant, queue in queues.items() if queue]
+        if not waiting:
+            return None
+        times = self.virtual_time[priority]
+        tenant = min(waiting, key=lambda name: times[name])
+        size, _, job_id, run = heapq.heappop(queues[tenant])
+
+        self.clock[priority] = times[tenant]
+        times[tenant] += size
+        return job_id, run
+
+    def _dispatch(self):
+        """Start queued jobs while there are free slots"""
+        while len(self.running) < self.max_concurrent:
+            running_bulk = sum(1 for priority, _ in self.running.values() if priority == BULK)
+            job = self._next_job(INTERACTIVE)
+            priority = INTERACTIVE
+            if job is None and running_bulk < self.bulk_max_concurrent:
+                job = self._next_job(BULK)
+                priority = BULK
+            if job is None:
+                return
+            job_id, run = job
+            task = asyncio.get_event_loop().create_task(self._run(job_id, run))
+            self.running[job_id] = (priority, task)
+
+    async def _run(self, job_id, run):
+        try:
+            await run()
+        finally:
+            self.running.pop(job_id, None)
+            self._dispatch()
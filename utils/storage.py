@@ -0,0 +1,433 @@
+"""
+Blob storage for uploads and artifacts.
+
+Two backends share one small interface (exists / size / put_file /
+iter_bytes, optionally over a byte range / delete): LocalStorage keeps blobs as files under a directory,
+S3Storage keeps them in an S3-compatible bucket (AWS, MinIO, or any local
+stand-in reachable through `endpoint_url`).
+
+On top of a backend, ContentStore names every blob after the SHA-256 of its
+content, so identical files are stored once, and can compress blobs at rest
+(zstd, or gzip when zstandard is not installed). Reads are streamed and
+decompressed block by block, never loaded whole.
+
+    store = open_store('artifacts')
+    name = store.put_file('output/jobs/<id>/json/wave_analysis.json', compress=True)
+    for block in store.iter_bytes(name):
+        ...
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import zlib
+from pathlib import Path
+
+from utils.config import config
+from utils.log import get_logger
+
+# Optional dependencies - gzip (zlib) is always available
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import boto3
+except ImportError:
+    boto3 = None
+
+logger = get_logger(__name__)
+
+# Streaming block size for hashing, copying and (de)compression
+BLOCK_SIZE = 1 << 20
+
+# Codec -> suffix appended to the name of a blob stored with that codec
+CODEC_SUFFIXES = {'zstd': '.zst', 'gzip': '.gz', 'br': '.br'}
+
+
+class _Codec:
+    """Streaming compressor / decompressor factory for one codec"""
+
+    def __init__(self, name, compressor, decompressor):
+        self.name = name
+        self.suffix = CODEC_SUFFIXES[name]
+        self.compressor = compressor
+        self.decompressor = decompressor
+
+
+class _BrotliCompressor:
+    def __init__(self):
+        self._compressor = brotli.Compressor()
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self):
+        return self._compressor.finish()
+
+
+class _BrotliDecompressor:
+    def __init__(self):
+        self._decompressor = brotli.Decompressor()
+
+    def decompress(self, data):
+        return self._decompressor.process(data)
+
+
+def available_codecs() -> dict:
+    """Codecs usable in this environment, by name"""
+    codecs = {
+        # wbits=31: gzip container, mtime 0 so equal content gives equal bytes
+        'gzip': _Codec('gzip', lambda: zlib.compressobj(9, zlib.DEFLATED, 31),
+                       lambda: zlib.decompressobj(31))
+    }
+    if zstandard is not None:
+        codecs['zstd'] = _Codec('zstd', lambda: zstandard.ZstdCompressor(level=10).compressobj(),
+                                lambda: zstandard.ZstdDecompressor().decompressobj())
+    if brotli is not None:
+        codecs['br'] = _Codec('br', _BrotliCompressor, _BrotliDecompressor)
+    return codecs
+
+
+def get_codec(name):
+    """
+    Codec by name, or None for 'none'. A requested codec that is not
+    installed falls back to gzip (with a warning).
+    """
+    if not name or name == 'none':
+        return None
+    codecs = available_codecs()
+    if name not in codecs:
+        if name not in CODEC_SUFFIXES:
+            raise ValueError(f"Unknown compression {name!r}. Supported: none, {', '.join(CODEC_SUFFIXES)}")
+        logger.warning("Compression codec not installed, falling back to gzip", extra={"codec": name})
+        return codecs['gzip']
+    return codecs[name]
+
+
+def _staging_file(directory):
+    """Hidden temporary file (fd, path) with the permissions of a regular file"""
+    fd, tmp_name = tempfile.mkstemp(prefix='.', suffix='.tmp', dir=directory)
+    os.chmod(tmp_name, 0o644)
+    return fd, tmp_name
+
+
+def _check_key(key: str):
+    # Keys are flat content names - reject anything that could escape the store
+    if not key or '/' in key or '\\' in key or key.startswith('.'):
+        raise ValueError(f"Invalid storage key {key!r}")
+
+
+class LocalStorage:
+    """Blobs as files in one directory"""
+
+    local = True
+
+    def __init__(self, root):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def local_path(self, key) -> Path:
+        _check_key(key)
+        return self.root / key
+
+    def exists(self, key) -> bool:
+        return self.local_path(key).is_file()
+
+    def size(self, key) -> int:
+        return self.local_path(key).stat().st_size
+
+    def put_file(self, key, path, move=False):
+        """Store a local file under `key` (atomically; moved instead of copied with move=True)"""
+        target = self.local_path(key)
+        if move:
+            os.replace(path, target)
+            return
+        tmp_path = target.with_name(f".{key}.{os.getpid()}.{threading.get_ident()}.tmp")
+        shutil.copyfile(path, tmp_path)
+        os.replace(tmp_path, target)
+
+    def iter_bytes(self, key, block_size=BLOCK_SIZE, start=0, end=None):
+        """Stream a blob, or its bytes start..end (inclusive)"""
+        with open(self.local_path(key), 'rb') as f:
+            f.seek(start)
+            remaining = None if end is None else end - start + 1
+            while remaining is None or remaining > 0:
+                block = f.read(block_size if remaining is None else min(block_size, remaining))
+                if not block:
+                    break
+                if remaining is not None:
+                    remaining -= len(block)
+                yield block
+
+    def touch(self, key):
+        """Mark a blob as recently used (upload cleanup keeps the newest files)"""
+        os.utime(self.local_path(key))
+
+    def delete(self, key):
+        self.local_path(key).unlink(missing_ok=True)
+
+    def staging_dir(self) -> Path:
+        """Where new blobs are assembled (same filesystem, so storing is a rename)"""
+        return self.root
+
+
+class S3Storage:
+    """
+    Blobs as objects in an S3-compatible bucket.
+
+    Args:
+        bucket (str): Bucket name
+        prefix (str): Key prefix, e.g. "artifacts/"
+        endpoint_url (str, optional): Non-AWS endpoint such as a local MinIO
+        region (str, optional): Region name
+        client (optional): Preconfigured boto3 S3 client
+    """
+
+    local = False
+
+    def __init__(self, bucket, prefix='', endpoint_url=None, region=None, client=None):
+        if client is None:
+            if boto3 is None:
+                raise RuntimeError("The s3 storage backend requires boto3 (pip install boto3)")
+            client = boto3.client('s3', endpoint_url=endpoint_url, region_name=region)
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix
+
+    def _object_key(self, key):
+        _check_key(key)
+        return f"{self.prefix}{key}"
+
+    def local_path(self, key):
+        return None
+
+    def _head(self, key):
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=self._object_key(key))
+        except Exception as e:
+            code = str(getattr(e, 'response', {}).get('Error', {}).get('Code', ''))
+            if code in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise
+
+    def exists(self, key) -> bool:
+        return self._head(key) is not None
+
+    def size(self, key) -> int:
+        head = self._head(key)
+        if head is None:
+            raise FileNotFoundError(key)
+        return int(head['ContentLength'])
+
+    def put_file(self, key, path, move=False):
+        # Multipart upload for large files; the local file is kept (caller cleans up)
+        self.client.upload_file(str(path), self.bucket, self._object_key(key))
+
+    def iter_bytes(self, key, block_size=BLOCK_SIZE, start=0, end=None):
+        """Stream an object, or its bytes start..end (inclusive) with a ranged GET"""
+        request = {"Bucket": self.bucket, "Key": self._object_key(key)}
+        if start or end is not None:
+            request["Range"] = f"bytes={start}-{'' if end is None else end}"
+        body = self.client.get_object(**request)['Body']
+        try:
+            for block in iter(lambda: body.read(block_size), b''):
+                yield block
+        finally:
+            body.close()
+
+    def touch(self, key):
+        pass
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=self._object_key(key))
+
+    def staging_dir(self) -> Path:
+        return Path(tempfile.gettempdir())
+
+
+class ContentStore:
+    """
+    Content-addressed blobs on a storage backend.
+
+    A blob is named ``<sha256><suffix>`` after its uncompressed content and
+    stored under that name, or under ``<name><codec suffix>`` when it is
+    compressed at rest. Storing content that is already there only refreshes
+    it, so duplicates cost neither space nor upload time.
+
+    Args:
+        storage (LocalStorage or S3Storage): Backend
+        compression (str, optional): At-rest codec: 'zstd', 'gzip', 'br' or 'none'
+    """
+
+    def __init__(self, storage, compression=None):
+        self.storage = storage
+        self.codec = get_codec(compression)
+
+    def find(self, name):
+        """
+        Stored representation of a blob.
+
+        Returns:
+            tuple: (storage key, codec name or None), or None if not stored
+        """
+        if self.storage.exists(name):
+            return name, None
+        for codec in available_codecs().values():
+            if self.storage.exists(name + codec.suffix):
+                return name + codec.suffix, codec.name
+        return None
+
+    def exists(self, name) -> bool:
+        return self.find(name) is not None
+
+    def put_stream(self, blocks, suffix='', compress=True) -> str:
+        """
+        Store content given as an iterable of byte blocks.
+
+        The content is hashed and (optionally) compressed in one pass into a
+        staging file, which is then moved or uploaded to its final key.
+
+        Args:
+            blocks (iterable): Content as bytes blocks
+            suffix (str): Name suffix, usually the file extension
+            compress (bool): Compress with the store's codec (if it has one)
+
+        Returns:
+            str: Content name (``<sha256><suffix>``)
+        """
+        codec = self.codec if compress else None
+        compressor = codec.compressor() if codec else None
+        sha = hashlib.sha256()
+        fd, tmp_name = _staging_file(self.storage.staging_dir())
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for block in blocks:
+                    sha.update(block)
+                    f.write(compressor.compress(block) if compressor else block)
+                if compressor:
+                    f.write(compressor.flush())
+
+            name = f"{sha.hexdigest()}{suffix.lower()}"
+            stored = self.find(name)
+            if stored is not None:
+                self.storage.touch(stored[0])
+                return name
+            self.storage.put_file(name + codec.suffix if codec else name, tmp_name, move=True)
+            return name
+        finally:
+            if os.path.exists(tmp_name):
+                os.unlink(tmp_name)
+
+    def put_file(self, path, compress=True) -> str:
+        """Store a local file (see put_stream); the suffix is the file's extension"""
+        path = Path(path)
+        with open(path, 'rb') as f:
+            return self.put_stream(iter(lambda: f.read(BLOCK_SIZE), b''), path.suffix, compress)
+
+    def iter_bytes(self, name, block_size=BLOCK_SIZE):
+        """
+        Stream a blob's content, decompressing it on the fly.
+
+        Raises:
+            FileNotFoundError: If the blob is not stored
+        """
+        stored = self.find(name)
+        if stored is None:
+            raise FileNotFoundError(name)
+        key, codec_name = stored
+        if codec_name is None:
+            yield from self.storage.iter_bytes(key, block_size)
+            return
+        decompressor = available_codecs()[codec_name].decompressor()
+        for block in self.storage.iter_bytes(key, block_size):
+            data = decompressor.decompress(block)
+            if data:
+                yield data
+
+    def add_variant(self, name, codec_name) -> bool:
+        """
+        Also store a blob compressed with another codec (e.g. for HTTP
+        content negotiation). Returns False if the codec is not installed.
+        """
+        codec = available_codecs().get(codec_name)
+        if codec is None:
+            return False
+        key = name + codec.suffix
+        if self.storage.exists(key):
+            return True
+        compressor = codec.compressor()
+        fd, tmp_name = _staging_file(self.storage.staging_dir())
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for block in self.iter_bytes(name):
+                    f.write(compressor.compress(block))
+                f.write(compressor.flush())
+            self.storage.put_file(key, tmp_name, move=True)
+        finally:
+            if os.path.exists(tmp_name):
+                os.unlink(tmp_name)
+        return True
+
+    def local_copy(self, name, directory) -> Path:
+        """
+        Path of a blob's uncompressed content on the local filesystem.
+
+        Uncompressed blobs of a local store are used in place; others are
+        streamed into `directory` (once - an existing copy is reused).
+        """
+        stored = self.find(name)
+        if stored is None:
+            raise FileNotFoundError(name)
+        key, codec_name = stored
+        if codec_name is None and self.storage.local:
+            return self.storage.local_path(key)
+
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        target = directory / name
+        if not target.exists():
+            fd, tmp_name = _staging_file(directory)
+            with os.fdopen(fd, 'wb') as f:
+                for block in self.iter_bytes(name):
+                    f.write(block)
+            os.replace(tmp_name, target)
+        return target
+
+
+def open_storage(settings):
+    """
+    Storage backend from a config section.
+
+    Args:
+        settings (dict): backend ('local' or 's3'); root for local;
+            bucket, prefix, endpoint_url and region for s3
+    """
+    backend = settings.get('backend', 'local')
+    if backend == 'local':
+        return LocalStorage(settings['root'])
+    if backend == 's3':
+        return S3Storage(settings['bucket'], settings.get('prefix', ''),
+                         settings.get('endpoint_url'), settings.get('region'))
+    raise ValueError(f"Unknown storage backend {backend!r}. Supported: local, s3")
+
+
+def _store_defaults(name) -> dict:
+    # Local stores default to the directories used before storage was configurable
+    roots = {'uploads': 'uploads', 'artifacts': config.get('paths', 'artifacts', default='output/artifacts')}
+    compression = {'artifacts': 'zstd'}
+    return {'backend': 'local', 'root': roots.get(name, f"output/{name}"),
+            'compression': compression.get(name, 'none')}
+
+
+def open_store(name) -> ContentStore:
+    """ContentStore configured by the storage.<name> config section"""
+    settings = {**_store_defaults(name), **(config.get('storage', name, default=None) or {})}
+    return ContentStore(open_storage(settings), settings.get('compression'))
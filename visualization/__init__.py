@@ -9,6 +9,7 @@ Components:
 - Distribution analysis
 - Heatmaps
 - Music parameter visualizations
+- Plot data export for client-side rendering (binary/JSON, SVG)
 """
 
 __all__ = [
@@ -16,7 +17,9 @@ __all__ = [
     'plot_wave_distribution_boxplot',
     'plot_wave_heatmap',
     'plot_music_parameters',
-    'create_all_visualizations'
+    'create_all_visualizations',
+    'visualization_files',
+    'export_plot_data'
 ]
 
 from visualization.plots import (
@@ -24,5 +27,7 @@ from visualization.plots import (
     plot_wave_distribution_boxplot,
     plot_wave_heatmap,
     plot_music_parameters,
-    create_all_visualizations
+    create_all_visualizations,
+    visualization_files
 )
+from visualization.export import export_plot_data
@@ -0,0 +1,292 @@
+"""
+Plot data export for client-side rendering.
+
+Instead of rasterizing on the server, the visualization stage can write the
+plot data itself, pre-decimated and packed for a browser (Canvas/WebGL):
+
+- ``plot_data.json``: small series inline and a description of every binary
+  buffer (name, dtype, shape, byte offset, byte length)
+- ``plot_data.bin``: the buffers as little-endian typed arrays, each aligned
+  to 4 bytes, so a client can wrap them in Float32Array/Uint8Array views (or
+  upload the heatmap tiles as textures) without parsing
+- optional lightweight SVGs of the same data
+"""
+import json
+import os
+from html import escape
+
+import numpy as np
+
+from core.music_mapper import load_global_parameters, load_music_parameters, load_wave_strengths
+from utils.config import config
+
+PLOT_DATA_FORMAT = "autis-buddy-plot-data"
+PLOT_DATA_VERSION = 1
+BUFFER_ALIGNMENT = 4
+# The SVG heatmap draws one rect per cell, so it gets a coarser decimation
+SVG_HEATMAP_COLUMNS = 120
+
+# Colors for SVG series, cycled for extra bands
+SVG_COLORS = ['#1f77b4', '#2ca02c', '#d62728', '#9467bd', '#ff7f0e', '#8c564b']
+
+
+def export_settings() -> dict:
+    """The visualization.export section with defaults filled in"""
+    settings = config.get('visualization', 'export', default=None) or {}
+    return {
+        "max_points": int(settings.get('max_points', 1000)),
+        "heatmap_tile_width": int(settings.get('heatmap_tile_width', 256)),
+        "svg": bool(settings.get('svg', True))
+    }
+
+
+def decimate_envelope(values, max_points):
+    """
+    Reduce a series to at most `max_points` buckets, keeping each bucket's
+    mean, minimum and maximum so peaks survive the decimation.
+
+    Parameters:
+    values (ndarray): Array of shape (points, series)
+    max_points (int): Maximum number of buckets
+
+    Returns:
+    dict: x (bucket centers as 1-based point positions), mean, min and max,
+    the last three of shape (series, buckets)
+    """
+    values = np.asarray(values, dtype=np.float64).reshape(len(values), -1)
+    count = len(values)
+    buckets = max(1, min(count, max_points))
+    edges = np.linspace(0, count, buckets + 1).astype(np.int64)
+    starts = edges[:-1]
+    if count == 0:
+        empty = np.zeros((values.shape[1], 0))
+        return {"x": np.zeros(0), "mean": empty, "min": empty, "max": empty}
+
+    sizes = np.maximum(np.diff(edges), 1)
+    return {
+        "x": (edges[:-1] + edges[1:] - 1) / 2 + 1,
+        "mean": (np.add.reduceat(values, starts, axis=0) / sizes[:, None]).T,
+        "min": np.minimum.reduceat(values, starts, axis=0).T,
+        "max": np.maximum.reduceat(values, starts, axis=0).T
+    }
+
+
+def box_statistics(values) -> dict:
+    """Five-number summary and Tukey outliers (beyond 1.5 IQR) of one series"""
+    values = np.asarray(values, dtype=np.float64)
+    if not len(values):
+        return {"count": 0}
+    q1, median, q3 = np.percentile(values, [25, 50, 75])
+    iqr = q3 - q1
+    inside = values[(values >= q1 - 1.5 * iqr) & (values <= q3 + 1.5 * iqr)]
+    outliers = values[(values < q1 - 1.5 * iqr) | (values > q3 + 1.5 * iqr)]
+    return {
+        "count": int(len(values)),
+        "q1": float(q1), "median": float(median), "q3": float(q3),
+        "whisker_low": float(inside.min()), "whisker_high": float(inside.max()),
+        "outliers": sorted(float(v) for v in outliers)
+    }
+
+
+class BufferWriter:
+    """Packs typed arrays into one aligned binary blob and records their layout"""
+
+    def __init__(self):
+        self.chunks = []
+        self.size = 0
+        self.buffers = {}
+
+    def add(self, name, array, dtype):
+        array = np.ascontiguousarray(array, dtype=np.dtype(dtype).newbyteorder('<'))
+        data = array.tobytes()
+        self.buffers[name] = {"dtype": np.dtype(dtype).name, "shape": list(array.shape),
+                              "offset": self.size, "length": len(data)}
+        padding = -len(data) % BUFFER_ALIGNMENT
+        self.chunks.append(data + b'\0' * padding)
+        self.size += len(data) + padding
+        return name
+
+    def getvalue(self) -> bytes:
+        return b''.join(self.chunks)
+
+
+def quantize(values, scale):
+    """Map values in [0, scale] to uint8 (0-255)"""
+    if scale <= 0:
+        return np.zeros(np.shape(values), dtype=np.uint8)
+    return np.clip(np.rint(np.asarray(values) / scale * 255), 0, 255).astype(np.uint8)
+
+
+def build_plot_data(eeg_file, music_file, global_file=None, settings=None):
+    """
+    Collect and pack the data behind every plot.
+
+    Parameters:
+    eeg_file: wave_analysis.json path or 'analysis' handoff header
+    music_file: music_parameters.json path or 'music' handoff header
+    global_file (optional): global_parameters.json path or 'music' handoff header
+    settings (dict, optional): Export settings, defaults to export_settings()
+
+    Returns:
+    tuple: (JSON-serializable document, binary buffer bytes, the decimated
+    arrays used for the SVG previews)
+    """
+    settings = settings or export_settings()
+    max_points = settings["max_points"]
+    writer = BufferWriter()
+
+    bands, intervals, strengths, interval_length = load_wave_strengths(eeg_file)
+    waves = decimate_envelope(strengths, max_points)
+    wave_document = {
+        "bands": list(bands),
+        "interval_length": interval_length,
+        "intervals": len(intervals),
+        "points": len(waves["x"]),
+        "x": writer.add("wave_x", waves["x"], np.float32),
+        "mean": writer.add("wave_mean", waves["mean"], np.float32),
+        "min": writer.add("wave_min", waves["min"], np.float32),
+        "max": writer.add("wave_max", waves["max"], np.float32),
+        "boxplot": {band: box_statistics(strengths[:, i]) for i, band in enumerate(bands)}
+    }
+
+    # Heatmap: uint8 intensities (bands x intervals) split into fixed-width
+    # tiles, plus a decimated overview for the first paint
+    scale = float(strengths.max()) if strengths.size else 0.0
+    matrix = quantize(strengths.T, scale)
+    tile_width = max(1, settings["heatmap_tile_width"])
+    tiles = [writer.add(f"heatmap_tile_{index}", matrix[:, start:start + tile_width], np.uint8)
+             for index, start in enumerate(range(0, matrix.shape[1], tile_width))]
+    heatmap_document = {
+        "rows": list(bands),
+        "columns": matrix.shape[1],
+        "scale": scale,
+        "tile_width": tile_width,
+        "tiles": tiles,
+        "overview": writer.add("heatmap_overview", quantize(waves["mean"], scale), np.uint8)
+    }
+
+    music_intervals, note_params, _ = load_music_parameters(music_file)
+    music = decimate_envelope(note_params, max_points)
+    music_document = {
+        "columns": ["pitch", "step", "duration"],
+        "intervals": len(music_intervals),
+        "points": len(music["x"]),
+        "x": writer.add("music_x", music["x"], np.float32),
+        "mean": writer.add("music_mean", music["mean"], np.float32),
+        "min": writer.add("music_min", music["min"], np.float32),
+        "max": writer.add("music_max", music["max"], np.float32)
+    }
+
+    document = {
+        "format": PLOT_DATA_FORMAT,
+        "version": PLOT_DATA_VERSION,
+        "binary": "plot_data.bin",
+        "waves": wave_document,
+        "heatmap": heatmap_document,
+        "music": music_document,
+        "global_parameters": load_global_parameters(global_file) if global_file is not None else None,
+        "buffers": writer.buffers
+    }
+    return document, writer.getvalue(), {"waves": waves, "strengths": strengths, "bands": bands,
+                                         "music": music}
+
+
+def svg_line_chart(x, series, labels, title, y_label, width=800, height=300):
+    """Polyline chart of one or more series sharing an x axis (no dependencies)"""
+    margin = 45
+    x = np.asarray(x, dtype=np.float64)
+    series = np.atleast_2d(np.asarray(series, dtype=np.float64))
+    x_span = (x.min(), x.max()) if len(x) else (0.0, 1.0)
+    y_span = (series.min(), series.max()) if series.size else (0.0, 1.0)
+
+    def scale(values, span, size, flip=False):
+        low, high = span
+        unit = (np.asarray(values) - low) / (high - low) if high > low else np.full(np.shape(values), 0.5)
+        return margin + (1 - unit if flip else unit) * (size - 2 * margin)
+
+    parts = [f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+             f'viewBox="0 0 {width} {height}" font-family="sans-serif" font-size="11">',
+             f'<text x="{width / 2}" y="16" text-anchor="middle" font-size="13">{escape(title)}</text>',
+             f'<line x1="{margin}" y1="{height - margin}" x2="{width - margin}" y2="{height - margin}" stroke="#888"/>',
+             f'<line x1="{margin}" y1="{margin}" x2="{margin}" y2="{height - margin}" stroke="#888"/>',
+             f'<text x="12" y="{height / 2}" transform="rotate(-90 12 {height / 2})" '
+             f'text-anchor="middle">{escape(y_label)}</text>',
+             f'<text x="{margin}" y="{height - margin + 14}">{x_span[0]:g}</text>',
+             f'<text x="{width - margin}" y="{height - margin + 14}" text-anchor="end">{x_span[1]:g}</text>',
+             f'<text x="{margin - 4}" y="{height - margin}" text-anchor="end">{y_span[0]:.3g}</text>',
+             f'<text x="{margin - 4}" y="{margin + 4}" text-anchor="end">{y_span[1]:.3g}</text>']
+    xs = scale(x, x_span, width)
+    for index, (values, label) in enumerate(zip(series, labels)):
+        color = SVG_COLORS[index % len(SVG_COLORS)]
+        points = " ".join(f"{px:.1f},{py:.1f}" for px, py in zip(xs, scale(values, y_span, height, True)))
+        parts.append(f'<polyline fill="none" stroke="{color}" stroke-width="1.2" points="{points}"/>')
+        parts.append(f'<text x="{width - margin + 4}" y="{margin + 14 * index}" fill="{color}">'
+                     f'{escape(label)}</text>')
+    parts.append('</svg>')
+    return "\n".join(parts)
+
+
+def svg_heatmap(matrix, rows, title, width=800, height=260):
+    """Heatmap of a (rows, columns) uint8 matrix as one rect per cell"""
+    margin_left, margin = 70, 30
+    rows_count, columns = matrix.shape
+    cell_w = (width - margin_left - margin) / max(columns, 1)
+    cell_h = (height - 2 * margin) / max(rows_count, 1)
+    parts = [f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+             f'viewBox="0 0 {width} {height}" font-family="sans-serif" font-size="11" shape-rendering="crispEdges">',
+             f'<text x="{width / 2}" y="16" text-anchor="middle" font-size="13">{escape(title)}</text>']
+    for r in range(rows_count):
+        y = margin + r * cell_h
+        parts.append(f'<text x="{margin_left - 6}" y="{y + cell_h / 2 + 4:.1f}" text-anchor="end">'
+                     f'{escape(rows[r].capitalize())}</text>')
+        for c in range(columns):
+            # Dark blue (low) to yellow (high)
+            level = int(matrix[r, c])
+            color = f"#{level:02x}{int(64 + level * 0.6):02x}{255 - level:02x}"
+            parts.append(f'<rect x="{margin_left + c * cell_w:.2f}" y="{y:.2f}" width="{cell_w + 0.5:.2f}" '
+                         f'height="{cell_h:.2f}" fill="{color}"/>')
+    parts.append('</svg>')
+    return "\n".join(parts)
+
+
+def export_plot_data(eeg_file, music_file, output_dir='output/plots', global_file=None, settings=None):
+    """
+    Write plot_data.json, plot_data.bin and (if enabled) the SVG previews.
+
+    Parameters:
+    eeg_file: wave_analysis.json path or 'analysis' handoff header
+    music_file: music_parameters.json path or 'music' handoff header
+    output_dir (str): Directory for the exported files
+    global_file (optional): global_parameters.json path or 'music' handoff header
+    settings (dict, optional): Export settings, defaults to export_settings()
+
+    Returns:
+    list: Names of the written files
+    """
+    settings = settings or export_settings()
+    document, binary, data = build_plot_data(eeg_file, music_file, global_file, settings)
+    os.makedirs(output_dir, exist_ok=True)
+    with open(os.path.join(output_dir, 'plot_data.bin'), 'wb') as f:
+        f.write(binary)
+    with open(os.path.join(output_dir, 'plot_data.json'), 'w') as f:
+        json.dump(document, f, separators=(',', ':'))
+    written = ['plot_data.json', 'plot_data.bin']
+
+    if settings["svg"]:
+        bands, waves, music = data["bands"], data["waves"], data["music"]
+        svgs = {
+            'wave_strengths.svg': svg_line_chart(
+                waves["x"], waves["mean"], [band.capitalize() for band in bands],
+                'EEG Wave Strengths Over Time', 'Strength'),
+            'wave_heatmap.svg': svg_heatmap(
+                quantize(decimate_envelope(data["strengths"], SVG_HEATMAP_COLUMNS)["mean"],
+                         document["heatmap"]["scale"]),
+                bands, 'Wave Strength Heatmap Over Time'),
+            'music_parameters.svg': svg_line_chart(
+                music["x"], music["mean"][:1], ['Pitch'], 'MIDI Pitch Over Time', 'Pitch')
+        }
+        for name, content in svgs.items():
+            with open(os.path.join(output_dir, name), 'w') as f:
+                f.write(content)
+            written.append(name)
+    return written
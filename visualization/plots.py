@@ -5,26 +5,71 @@ import json
 import os
 from pathlib import Path
 
+from core.cancellation import raise_if_cancelled
+from core.handoff import is_handoff
+from core.music_mapper import (
+    load_global_parameters, load_music_parameters, load_wave_strengths, wave_strength_matrix
+)
+from utils.config import config
+from utils.log import get_logger
+from visualization.export import export_plot_data, export_settings
+
+logger = get_logger(__name__)
+
+# Bar colors for the average wave strengths, cycled for extra bands
+BAND_COLORS = ['blue', 'green', 'red', 'purple', 'orange']
+
+# Server-side PNGs (visualization.render_png), keyed by their status name
+PNG_FILES = {
+    "wave_distribution_plot": "wave_distribution_boxplot.png",
+    "wave_heatmap_plot": "wave_heatmap.png",
+    "music_parameters_plot": "music_parameters.png",
+    "global_parameters_plot": "global_parameters.png"
+}
+
+# Client-side rendering exports, keyed by their status name
+EXPORT_FILES = {
+    "plot_data": "plot_data.json",
+    "plot_data_binary": "plot_data.bin"
+}
+SVG_FILES = {
+    "wave_strengths_svg": "wave_strengths.svg",
+    "wave_heatmap_svg": "wave_heatmap.svg",
+    "music_parameters_svg": "music_parameters.svg"
+}
+
+
+def visualization_files() -> dict:
+    """Files create_all_visualizations writes with the current config, keyed by status name"""
+    files = dict(EXPORT_FILES)
+    if export_settings()["svg"]:
+        files.update(SVG_FILES)
+    if config.get('visualization', 'render_png', default=False):
+        files.update(PNG_FILES)
+    return files
+
+def _savefig(output_dir, filename):
+    """Save the current figure with the configured resolution"""
+    plt.savefig(os.path.join(output_dir, filename),
+                dpi=config.get('visualization', 'plot_settings', 'dpi', default='figure'))
+
 def load_json_data(file_path):
     """Helper function to load JSON data"""
     with open(file_path, 'r') as f:
         return json.load(f)
 
-def plot_wave_strengths(results):
+def plot_wave_strengths(results, output_dir='output/plots'):
     """
     Plot the wave strength percentages over time intervals.
     
     Parameters:
     results (dict): Analysis results from analyze_eeg_waves
+    output_dir (str): Directory where the plot is saved
     """
     
     # Convert data for plotting
-    intervals = list(results["wave_strengths"].keys())
-    wave_types = ["Delta", "Theta", "Alpha", "Beta", "Gamma"]
-    
-    # Create matrix of values
-    values = np.array([[float(v) for v in results["wave_strengths"][i]] 
-                      for i in intervals])
+    bands, intervals, values = wave_strength_matrix(results)
+    wave_types = [band.capitalize() for band in bands]
     
     # Create plot
     plt.figure(figsize=(12, 6))
@@ -37,54 +82,44 @@ def plot_wave_strengths(results):
     plt.title('EEG Wave Strengths Over Time')
     plt.legend()
     plt.grid(True)
-    plt.savefig('output/plots/wave_strengths_plot.png')
+    _savefig(output_dir, 'wave_strengths_plot.png')
 
-def plot_wave_distribution_boxplot(eeg_file):
+def plot_wave_distribution_boxplot(eeg_file, output_dir='output/plots'):
     """Create a boxplot showing the distribution of each wave type"""
-    data = load_json_data(eeg_file)
-    wave_types = ["Delta", "Theta", "Alpha", "Beta", "Gamma"]
+    bands, _, matrix, _ = load_wave_strengths(eeg_file)
+    wave_types = [band.capitalize() for band in bands]
     
-    # Convert data to array
-    values = []
-    for wave_idx in range(5):
-        wave_values = [float(data["wave_strengths"][interval][wave_idx]) 
-                      for interval in data["wave_strengths"]]
-        values.append(wave_values)
+    # One column of values per wave type
+    values = list(matrix.T)
 
     plt.figure(figsize=(10, 6))
     plt.boxplot(values, labels=wave_types)
     plt.title('Distribution of Wave Strengths')
     plt.ylabel('Strength (%)')
     plt.grid(True, alpha=0.3)
-    plt.savefig('output/plots/wave_distribution_boxplot.png')
+    _savefig(output_dir, 'wave_distribution_boxplot.png')
     plt.close()
 
-def plot_wave_heatmap(eeg_file):
+def plot_wave_heatmap(eeg_file, output_dir='output/plots'):
     """Create a heatmap showing wave strengths over time"""
-    data = load_json_data(eeg_file)
-    wave_types = ["Delta", "Theta", "Alpha", "Beta", "Gamma"]
-    
-    # Convert data to matrix
-    values = np.array([[float(v) for v in data["wave_strengths"][str(i)]] 
-                      for i in range(1, len(data["wave_strengths"]) + 1)])
+    # Band matrix (intervals rejected by quality control may be missing)
+    bands, _, values, _ = load_wave_strengths(eeg_file)
+    wave_types = [band.capitalize() for band in bands]
 
     plt.figure(figsize=(12, 8))
     sns.heatmap(values.T, yticklabels=wave_types, cmap='viridis')
     plt.title('Wave Strength Heatmap Over Time')
     plt.xlabel('Time Interval')
     plt.ylabel('Wave Type')
-    plt.savefig('output/plots/wave_heatmap.png')
+    _savefig(output_dir, 'wave_heatmap.png')
     plt.close()
 
-def plot_music_parameters(music_file):
+def plot_music_parameters(music_file, output_dir='output/plots'):
     """Plot the generated music parameters"""
-    data = load_json_data(music_file)
-    intervals = list(data["musical_parameters"].keys())
+    intervals, values, _ = load_music_parameters(music_file)
     
     # Extract parameters
-    pitch = [float(data["musical_parameters"][i][0]) for i in intervals]
-    step = [float(data["musical_parameters"][i][1]) for i in intervals]
-    duration = [float(data["musical_parameters"][i][2]) for i in intervals]
+    pitch, step, duration = values.T
 
     fig, (ax1, ax2, ax3) = plt.subplots(3, 1, figsize=(12, 10))
     
@@ -108,26 +143,23 @@ def plot_music_parameters(music_file):
     ax3.grid(True)
 
     plt.tight_layout()
-    plt.savefig('output/plots/music_parameters.png')
+    _savefig(output_dir, 'music_parameters.png')
     plt.close()
 
-def plot_global_parameters(global_file):
+def plot_global_parameters(global_file, output_dir='output/plots'):
     """Plot the global music parameters and average wave strengths"""
-    data = load_json_data(global_file)
+    data = load_global_parameters(global_file)
     
     # Create a figure with 2 subplots
     fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(15, 6))
     
     # Plot 1: Average Wave Strengths
-    wave_types = ["Delta", "Theta", "Alpha", "Beta", "Gamma"]
-    wave_values = [data["average_wave_strengths"]["delta"], 
-                   data["average_wave_strengths"]["theta"],
-                   data["average_wave_strengths"]["alpha"],
-                   data["average_wave_strengths"]["beta"],
-                   data["average_wave_strengths"]["gamma"]]
+    wave_types = [band.capitalize() for band in data["average_wave_strengths"]]
+    wave_values = list(data["average_wave_strengths"].values())
+    colors = [BAND_COLORS[i % len(BAND_COLORS)] for i in range(len(wave_types))]
     
     # Create bar chart
-    bars = ax1.bar(wave_types, wave_values, color=['blue', 'green', 'red', 'purple', 'orange'])
+    bars = ax1.bar(wave_types, wave_values, color=colors)
     ax1.set_title('Average Wave Strengths')
     ax1.set_ylabel('Strength (%)')
     ax1.grid(True, alpha=0.3, axis='y')
@@ -147,29 +179,56 @@ def plot_global_parameters(global_file):
     ax2.set_title('Global Musical Parameters')
     
     plt.tight_layout()
-    plt.savefig('output/plots/global_parameters.png')
+    _savefig(output_dir, 'global_parameters.png')
     plt.close()
 
-def create_all_visualizations(eeg_file, music_file):
-    """Generate all visualizations"""
+def create_all_visualizations(eeg_file, music_file, output_dir='output/plots', cancel=None):
+    """
+    Generate all visualizations (an optional CancelToken is checked between plots).
+    `eeg_file` and `music_file` may also be the 'analysis' and 'music' handoff headers.
+
+    Always exports the pre-decimated plot data (and SVG previews unless
+    visualization.export.svg is off) for client-side rendering; the
+    matplotlib PNGs are only rendered with visualization.render_png.
+    """
     # Create analysis directory if it doesn't exist
-    Path('output/plots').mkdir(exist_ok=True)
-    
-    # Generate all plots
-    plot_wave_distribution_boxplot(eeg_file)
-    print("Wave distribution boxplot generated")
-    plot_wave_heatmap(eeg_file)
-    print("Wave heatmap generated")
-    plot_music_parameters(music_file)
-    print("Music parameters plot generated")
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+
+    # Global parameters are written next to the music parameters, or carried
+    # by the music handoff
+    if is_handoff(music_file):
+        global_file = music_file
+    else:
+        global_file = os.path.join(os.path.dirname(music_file), "global_parameters.json")
+    if not (is_handoff(global_file) or os.path.exists(global_file)):
+        global_file = None
+
+    raise_if_cancelled(cancel)
+    export_plot_data(eeg_file, music_file, output_dir, global_file)
+    logger.debug("Plot data exported")
+
+    if not config.get('visualization', 'render_png', default=False):
+        logger.info("Plot data for client-side rendering exported to '%s'", output_dir)
+        return
+
+    # Server-side PNG rendering
+    raise_if_cancelled(cancel)
+    plot_wave_distribution_boxplot(eeg_file, output_dir)
+    logger.debug("Wave distribution boxplot generated")
+    raise_if_cancelled(cancel)
+    plot_wave_heatmap(eeg_file, output_dir)
+    logger.debug("Wave heatmap generated")
+    raise_if_cancelled(cancel)
+    plot_music_parameters(music_file, output_dir)
+    logger.debug("Music parameters plot generated")
     
     # Add global parameters visualization
-    global_file = "output/json/global_parameters.json"
-    if os.path.exists(global_file):
-        plot_global_parameters(global_file)
-        print("Global parameters plot generated")
+    if global_file is not None:
+        raise_if_cancelled(cancel)
+        plot_global_parameters(global_file, output_dir)
+        logger.debug("Global parameters plot generated")
     
-    print("All visualizations have been generated in the 'output/plots' directory")
+    logger.info("All visualizations have been generated in the '%s' directory", output_dir)
 
 if __name__ == "__main__":
     eeg_file = "output/json/wave_analysis.json"
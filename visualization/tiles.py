@@ -0,0 +1,236 @@
+"""
+Zoomable heatmap tiles of the band matrix.
+
+The session is laid out as a tile pyramid: zoom level z splits the intervals
+into 2**z tiles of `tile_width` pixel columns, so level 0 shows the whole
+session in one tile and every level doubles the horizontal resolution, up to
+a few pixels per interval. Tiles are rendered on demand (plain numpy and
+Pillow, no matplotlib figure) and kept in a disk cache with LRU eviction.
+"""
+import hashlib
+import io
+import json
+import math
+import os
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from core.music_mapper import load_wave_strengths
+from utils.config import config
+
+# Bump when the rendering changes so cached tiles are not reused
+TILE_RENDER_VERSION = 1
+
+
+def tile_settings() -> dict:
+    """The visualization.heatmap_tiles section with defaults filled in"""
+    settings = config.get('visualization', 'heatmap_tiles', default=None) or {}
+    return {
+        "tile_width": int(settings.get('tile_width', 256)),
+        "row_height": int(settings.get('row_height', 24)),
+        "max_pixels_per_interval": int(settings.get('max_pixels_per_interval', 8)),
+        "colormap": settings.get('colormap', 'viridis'),
+        "cache_mb": float(settings.get('cache_mb', 256))
+    }
+
+
+def tile_variant(settings=None) -> str:
+    """
+    Short hash of everything that changes a tile's pixels (render version,
+    sizes, colormap), so tiles rendered with other settings are never reused
+    from the cache or by clients. Band order is part of the analysis content.
+    """
+    settings = settings or tile_settings()
+    rendering = {name: value for name, value in settings.items() if name != 'cache_mb'}
+    rendering["version"] = TILE_RENDER_VERSION
+    return hashlib.sha256(json.dumps(rendering, sort_keys=True).encode()).hexdigest()[:12]
+
+
+@lru_cache(maxsize=8)
+def colormap_table(name):
+    """256 x 3 uint8 RGB lookup table of a matplotlib colormap"""
+    from matplotlib import colormaps
+    return (colormaps[name](np.linspace(0, 1, 256))[:, :3] * 255).round().astype(np.uint8)
+
+
+@lru_cache(maxsize=16)
+def _load_matrix(path, mtime):
+    bands, _, strengths, interval_length = load_wave_strengths(path)
+    return bands, strengths, interval_length
+
+
+def load_band_matrix(analysis_path):
+    """Band names, (intervals, bands) matrix and interval length, cached per file version"""
+    path = str(analysis_path)
+    return _load_matrix(path, os.stat(path).st_mtime_ns)
+
+
+def pyramid_info(intervals, bands, settings=None) -> dict:
+    """
+    Layout of the tile pyramid for a session.
+
+    Returns:
+    dict: tile_width, tile_height, max_zoom and the tile count of every level
+    """
+    settings = settings or tile_settings()
+    width = settings["tile_width"]
+    # Deepest level: at most max_pixels_per_interval pixels per interval
+    pixels = max(1, intervals) * settings["max_pixels_per_interval"]
+    max_zoom = max(0, math.ceil(math.log2(max(pixels / width, 1))))
+    return {
+        "tile_width": width,
+        "tile_height": settings["row_height"] * len(bands),
+        "max_zoom": max_zoom,
+        "tiles_per_level": [2 ** z for z in range(max_zoom + 1)]
+    }
+
+
+def tile_columns(strengths, z, x, width):
+    """
+    Band values of one tile's pixel columns.
+
+    Each pixel column covers a span of intervals; spans longer than one
+    interval are averaged, shorter ones repeat the interval they fall in.
+
+    Returns:
+    ndarray: (bands, width) array
+    """
+    intervals = len(strengths)
+    tiles = 2 ** z
+    # Interval position of every pixel edge of this tile
+    edges = (x + np.arange(width + 1) / width) * intervals / tiles
+    starts = np.minimum(np.floor(edges[:-1]).astype(np.int64), intervals - 1)
+    stops = np.maximum(np.ceil(edges[1:]).astype(np.int64), starts + 1)
+    stops = np.minimum(stops, intervals)
+
+    cumulative = np.vstack([np.zeros((1, strengths.shape[1])), np.cumsum(strengths, axis=0)])
+    sums = cumulative[stops] - cumulative[starts]
+    return (sums / (stops - starts)[:, None]).T
+
+
+def render_tile(strengths, z, x, settings=None) -> bytes:
+    """
+    Render one heatmap tile as PNG.
+
+    Rows are bands (first band on top), colors are scaled to the session's
+    maximum band value so neighbouring tiles match.
+
+    Raises:
+    ValueError: If (z, x) is outside the pyramid
+    """
+    settings = settings or tile_settings()
+    info = pyramid_info(len(strengths), range(strengths.shape[1]), settings)
+    if not 0 <= z <= info["max_zoom"] or not 0 <= x < 2 ** z or not len(strengths):
+        raise ValueError(f"Tile {z}/{x} is outside the pyramid")
+
+    values = tile_columns(strengths, z, x, settings["tile_width"])
+    scale = float(strengths.max())
+    levels = np.zeros(values.shape, dtype=np.uint8) if scale <= 0 else \
+        np.clip(np.rint(values / scale * 255), 0, 255).astype(np.uint8)
+    rgb = colormap_table(settings["colormap"])[np.repeat(levels, settings["row_height"], axis=0)]
+
+    buffer = io.BytesIO()
+    Image.fromarray(rgb, 'RGB').save(buffer, format='PNG', optimize=False, compress_level=6)
+    return buffer.getvalue()
+
+
+class TileCache:
+    """
+    Disk cache of rendered tiles bounded by total size, evicting the least
+    recently used tiles first.
+
+    Recency is kept in memory and mirrored in the files' mtimes, so a
+    restarted process resumes with the same eviction order.
+    """
+
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # relative path -> size, oldest first
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if not self.cache_dir.exists():
+            return
+        files = [(path.stat().st_mtime, path) for path in self.cache_dir.rglob('*.png')]
+        for _, path in sorted(files):
+            size = path.stat().st_size
+            self._entries[path.relative_to(self.cache_dir).as_posix()] = size
+            self._bytes += size
+
+    def get(self, key):
+        """Cached tile bytes, or None"""
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+        path = self.cache_dir / key
+        try:
+            data = path.read_bytes()
+            os.utime(path)
+            return data
+        except FileNotFoundError:
+            with self._lock:
+                self._bytes -= self._entries.pop(key, 0)
+            return None
+
+    def put(self, key, data):
+        """Store a tile and evict the least recently used ones beyond the size limit"""
+        path = self.cache_dir / key
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+
+        evicted = []
+        with self._lock:
+            self._bytes += len(data) - self._entries.pop(key, 0)
+            self._entries[key] = len(data)
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                old_key, size = self._entries.popitem(last=False)
+                self._bytes -= size
+                evicted.append(old_key)
+        for old_key in evicted:
+            try:
+                (self.cache_dir / old_key).unlink()
+            except FileNotFoundError:
+                pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"tiles": len(self._entries), "bytes": self._bytes, "max_bytes": self.max_bytes}
+
+
+def get_tile(cache, analysis_path, source_key, z, x, settings=None) -> bytes:
+    """
+    Return a heatmap tile, rendering and caching it on a miss.
+
+    Args:
+        cache (TileCache): Tile cache
+        analysis_path (str or Path): wave_analysis.json of the session
+        source_key (str): Identifies the analysis content (e.g. its artifact
+            digest), so identical sessions share tiles
+        z (int): Zoom level
+        x (int): Tile column
+
+    Returns:
+        bytes: PNG data
+
+    Raises:
+        ValueError: If (z, x) is outside the pyramid
+    """
+    settings = settings or tile_settings()
+    key = f"{source_key}/{tile_variant(settings)}/{z}/{x}.png"
+    data = cache.get(key)
+    if data is None:
+        _, strengths, _ = load_band_matrix(analysis_path)
+        data = render_tile(strengths, z, x, settings)
+        cache.put(key, data)
+    return data